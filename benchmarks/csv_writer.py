@@ -0,0 +1,62 @@
+"""
+Compares the per-row csv.writer loop CSVArrayWriter used to run with its columnar writer,
+on a report shaped like EcoComposer's: time, lat and lon columns, then one column per variable.
+Checks that both outputs are byte-identical.
+
+Usage: python benchmarks/csv_writer.py [--periods 12] [--lat 200] [--lon 300] [--variables 5]
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.csvarraywriter import CSVArrayWriter
+
+
+def write_rows(file_name, field_names, data):
+    with open(file_name, 'w') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(field_names)
+        for i in range(len(data[-1])):
+            writer.writerow(tuple(data[j][i] for j in range(len(data))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of CSVArrayWriter.')
+    parser.add_argument('--periods', type=int, default=12)
+    parser.add_argument('--lat', type=int, default=200)
+    parser.add_argument('--lon', type=int, default=300)
+    parser.add_argument('--variables', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    time_col = ['1990-{:02d}'.format(mo % 12 + 1) for mo in range(args.periods)]
+    lat_col = [round(-28.0 - 0.01 * i, 3) for i in range(args.lat)]
+    lon_col = [round(150.0 + 0.01 * i, 3) for i in range(args.lon)]
+    report = [
+        np.repeat(time_col, args.lat * args.lon),
+        np.tile(np.repeat(lat_col, args.lon), args.periods),
+        np.tile(lon_col, args.lat * args.periods)]
+    rows = args.periods * args.lat * args.lon
+    for _ in range(args.variables):
+        # float32 means, upcast to float64 as in multi-period results
+        report.append((np.random.random(rows) * 30).astype(np.float32).astype(np.float64))
+    field_names = ['year-month', 'lat', 'lon'] + ['var{}'.format(v) for v in range(args.variables)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (rows_file, columns_file) = (os.path.join(tmp, 'rows.csv'), os.path.join(tmp, 'columns.csv'))
+        started = time.perf_counter()
+        write_rows(rows_file, field_names, report)
+        print('{:<9} {:8.3f} s'.format('rows', time.perf_counter() - started))
+        started = time.perf_counter()
+        CSVArrayWriter(columns_file, field_names, report).write()
+        print('{:<9} {:8.3f} s'.format('columns', time.perf_counter() - started))
+        with open(rows_file, 'rb') as f1, open(columns_file, 'rb') as f2:
+            assert f1.read() == f2.read(), 'outputs differ'
+    print('{} rows, identical output'.format(rows))
+
+
+if __name__ == '__main__':
+    main()
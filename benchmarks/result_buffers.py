@@ -0,0 +1,62 @@
+"""
+Compares the two ways of collecting per-period means into one result:
+growing a flat array with np.concatenate on every period (as EcoMeasure used to),
+and filling a (period, lat, lon) buffer preallocated once (EcoMeasure.period_means).
+Reports the time, the bytes copied into results and the peak memory of each.
+
+Usage: python benchmarks/result_buffers.py [--periods 540] [--lat 200] [--lon 300]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def concatenated(planes):
+    result = np.array([])
+    copied = 0
+    for plane in planes:
+        result = np.concatenate((result, plane.flatten()), axis=0)
+        copied += result.nbytes
+    return (result, copied)
+
+
+def preallocated(planes):
+    result = np.empty((len(planes),) + planes[0].shape, dtype=np.float64)
+    copied = 0
+    for (i, plane) in enumerate(planes):
+        result[i] = plane
+        copied += plane.size * result.itemsize
+    return (result.reshape(-1), copied)
+
+
+def measure(fn, planes):
+    tracemalloc.start()
+    started = time.perf_counter()
+    (result, copied) = fn(planes)
+    elapsed = time.perf_counter() - started
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (result, elapsed, copied, peak)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the result buffers of EcoMeasure.')
+    parser.add_argument('--periods', type=int, default=540, help='number of periods, e.g. 540 months')
+    parser.add_argument('--lat', type=int, default=200, help='latitudes in the bbox')
+    parser.add_argument('--lon', type=int, default=300, help='longitudes in the bbox')
+    args = parser.parse_args(argv)
+
+    # per-period means, as the reductions return them
+    planes = [np.random.random((args.lat, args.lon)).astype(np.float32) for _ in range(args.periods)]
+    results = {}
+    for (name, fn) in (('concatenate', concatenated), ('preallocated', preallocated)):
+        (results[name], elapsed, copied, peak) = measure(fn, planes)
+        print('{:<13} {:8.3f} s  {:10.1f} MB copied  {:8.1f} MB peak'.format(
+            name, elapsed, copied / 1024 ** 2, peak / 1024 ** 2))
+    assert np.array_equal(results['concatenate'], results['preallocated'])
+
+
+if __name__ == '__main__':
+    main()
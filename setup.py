@@ -61,8 +61,13 @@ setup(
         'paste.app_factory': [
             'main = silvereye_wps_demo:main',
         ],
+        'console_scripts': [
+            'silvereye-prewarm = silvereye_wps_demo.scripts.prewarm:main',
+            'silvereye-build-aggregates = silvereye_wps_demo.scripts.build_aggregates:main',
+        ],
         'pywps_processing': [
             'threads = silvereye_wps_demo.pywps.processing:ThreadProcessing',
+            'pool = silvereye_wps_demo.pywps.processing:PoolProcessing',
         ],
         'pywps_storage': [
             'SwiftStorage = silvereye_wps_demo.pywps.swiftstorage:SwiftStorage',
@@ -70,6 +75,8 @@ setup(
     },
     extras_require={
         'dev': dev_requires,
+        'netcdf': ['netCDF4'],
+        'zstd': ['zstandard'],
     }
 
 )
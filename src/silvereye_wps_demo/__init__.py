@@ -21,6 +21,11 @@ def main(global_config, **settings):
 
     config.scan('.views')
 
+    # start the worker pool of the pool processing mode now, rather than on the first request
+    if wpsconfig.get_config_value('processing', 'mode') == 'pool':
+        from silvereye_wps_demo.pywps.processing import PoolProcessing
+        PoolProcessing.pool()
+
     # ensure paths exist
     for name in ('workdir', 'statuspath', 'outputpath'):
         dirname = os.path.abspath(wpsconfig.get_config_value('server', name))
@@ -0,0 +1,35 @@
+from silvereye_wps_demo.models.backends.base import Backend
+from silvereye_wps_demo.models.backends.mirror import NetCDFMirrorBackend, NpyMirrorBackend
+from silvereye_wps_demo.models.backends.opendap import OPeNDAPBackend
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+__all__ = ["Backend", "OPeNDAPBackend", "NetCDFMirrorBackend", "NpyMirrorBackend", "create_backend"]
+
+
+def create_backend(name: str, url: str, variable: str) -> Backend:
+    """
+    Creates the backend configured for a variable in the [backend:<name>] section of pywps.cfg.
+    type = opendap (the default) reads from url,
+    type = netcdf or npy reads from a local mirror in path,
+    falling back to url for missing years unless fallback = false.
+    npy mirrors take the fill value of their arrays from fill_value, if set.
+    :param name: name of the EcoMeasure, e.g. Rainfall
+    :param url: default remote url of the dataset
+    :param variable: name of the variable in the dataset
+    :return: a Backend, not opened yet
+    """
+    section = 'backend:' + name
+    kind = Settings.get('type', 'opendap', section)
+    remote = OPeNDAPBackend(Settings.get('url', url, section), variable)
+    if kind == 'opendap':
+        return remote
+
+    path = Settings.get('path', '', section)
+    fallback = remote if Settings.get_bool('fallback', True, section) else None
+    if kind == 'netcdf':
+        return NetCDFMirrorBackend(path, variable, Settings.get('pattern', '{year}.nc', section), fallback)
+    if kind == 'npy':
+        fill_value = Settings.get('fill_value', '', section)
+        return NpyMirrorBackend(path, variable, Settings.get('pattern', '{year}.npy', section), fallback,
+                                float(fill_value) if fill_value else None)
+    raise ValueError("Unknown backend type '{}' for {}".format(kind, name))
@@ -0,0 +1,72 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.upstreamlimiter import UpstreamLimiter
+
+IndexRange = Tuple[int, int]
+
+
+class Backend(object):
+    """
+    Generic data backend.
+    Do not instantiate directly.
+    Gives access to one gridded (time, lat, lon) variable,
+    whatever the storage it is read from.
+    """
+
+    def __init__(self, url: str, variable: str) -> None:
+        """
+        :param url: location of the data, a remote url or a local path
+        :param variable: name of the variable in the dataset
+        """
+        self.url = url
+        self.variable = variable
+
+    def open(self) -> 'Backend':
+        """Opens the underlying dataset. Returns self, so it can be chained."""
+        return self
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """(time, lat, lon) size of the whole variable."""
+        raise NotImplementedError
+
+    @property
+    def dtype(self) -> np.dtype:
+        raise NotImplementedError
+
+    @property
+    def attributes(self) -> Dict:
+        """Attributes of the variable, e.g. _FillValue."""
+        return {}
+
+    @property
+    def missing_values(self) -> List[float]:
+        """Values flagging missing cells, from the _FillValue and missing_value attributes."""
+        values = []
+        for name in ('_FillValue', 'missing_value'):
+            if name in self.attributes:
+                values.extend(np.ravel(self.attributes[name]).tolist())
+        return values
+
+    def slot(self):
+        """Returns the context to hold while reading: a connection slot of the server of url, see UpstreamLimiter."""
+        return UpstreamLimiter.slot(self.url)
+
+    def read(self, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        """
+        Reads a hyperslab.
+        :param time_idx: (start, stop) time indices
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :return: NumPy.Array (of 3 dimensions: time, lat, lon)
+        """
+        raise NotImplementedError
+
+    def __getitem__(self, key: Tuple[slice, slice, slice]) -> np.ndarray:
+        """Array-like access with [time, lat, lon] slices."""
+        (time_key, lat_key, lon_key) = key
+        return self.read((time_key.start, time_key.stop),
+                         (lat_key.start, lat_key.stop),
+                         (lon_key.start, lon_key.stop))
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+from contextlib import nullcontext
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.backends.base import Backend, IndexRange
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.upstreamlimiter import UpstreamLimiter
+
+
+class YearMirrorBackend(Backend):
+    """
+    Generic local mirror, made of one file per year.
+    Do not instantiate directly.
+    Years missing from the mirror are read from the fallback backend, if any,
+    so hot years can be served locally and the rest from the remote server.
+    The fallback is only opened on the first read of a missing year, so a complete mirror
+    does not depend on the remote server; its reads hold the connection slots of the remote server.
+    """
+
+    def __init__(self, path: str, variable: str, pattern: str, fallback: Optional[Backend] = None) -> None:
+        """
+        :param path: directory holding the yearly files
+        :param variable: name of the variable
+        :param pattern: file name of a year, e.g. '{year}.nc'
+        :param fallback: backend to read missing years from
+        """
+        Backend.__init__(self, path, variable)
+        self.pattern = pattern
+        self.fallback = fallback
+        self._dtype = None
+        self._attributes = {}
+        self._fallback_open = False
+        self._fallback_lock = threading.Lock()
+
+    def year_path(self, year: int) -> str:
+        return os.path.join(self.url, self.pattern.format(year=year))
+
+    def years(self):
+        """Years available in the mirror."""
+        return [yr for yr in range(eco_constants.YEAR_MIN, eco_constants.YEAR_MAX + 1)
+                if os.path.exists(self.year_path(yr))]
+
+    def open(self) -> Backend:
+        years = self.years()
+        if not years and self.fallback is None:
+            raise ValueError("No data for {} in mirror {}".format(self.variable, self.url))
+        if years:
+            (self._dtype, self._attributes) = self._describe(years[0])
+        else:
+            fallback = self._open_fallback()
+            (self._dtype, self._attributes) = (fallback.dtype, fallback.attributes)
+        return self
+
+    def _open_fallback(self) -> Backend:
+        """Returns the fallback backend, opening it on first use."""
+        with self._fallback_lock:
+            if not self._fallback_open:
+                self.fallback.open()
+                self._fallback_open = True
+        return self.fallback
+
+    def slot(self):
+        """Reads hold the slots of the mirror and of the fallback themselves, year by year."""
+        return nullcontext()
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (eco_constants.TIME_IDX_MAX + 1, eco_constants.LAT_IDX_MAX + 1, eco_constants.LON_IDX_MAX + 1)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def attributes(self) -> Dict:
+        return self._attributes
+
+    def read(self, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        (time_lo_idx, time_hi_idx) = time_idx
+        result = np.empty((time_hi_idx - time_lo_idx, lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]),
+                          dtype=self.dtype)
+        for (year, (lo, hi)) in Indexers.time_idx_by_year(time_idx):
+            year_lo = Indexers.year_start_idx(year)
+            out = result[lo - time_lo_idx:hi - time_lo_idx]
+            if os.path.exists(self.year_path(year)):
+                with UpstreamLimiter.slot(self.url):
+                    out[...] = self._read_year(year, (lo - year_lo, hi - year_lo), lat_idx, lon_idx)
+            elif self.fallback is not None:
+                fallback = self._open_fallback()
+                with fallback.slot():
+                    out[...] = fallback.read((lo, hi), lat_idx, lon_idx)
+            else:
+                raise ValueError("Year {} of {} is not in mirror {}".format(year, self.variable, self.url))
+        return result
+
+    def _describe(self, year: int) -> Tuple[np.dtype, Dict]:
+        """Returns the dtype and attributes of the data, from the file of one year."""
+        raise NotImplementedError
+
+    def _read_year(self, year: int, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        """Reads a hyperslab from the file of one year, with time indices relative to that year."""
+        raise NotImplementedError
+
+
+class NetCDFMirrorBackend(YearMirrorBackend):
+    """Local mirror made of per-year NetCDF files, e.g. copies of the ANUClimate files."""
+
+    def __init__(self, path: str, variable: str, pattern: str = '{year}.nc', fallback: Optional[Backend] = None):
+        YearMirrorBackend.__init__(self, path, variable, pattern, fallback)
+
+    @staticmethod
+    def _dataset(path: str):
+        try:
+            import netCDF4
+        except ImportError:
+            raise ImportError("The netcdf backend requires the netCDF4 package")
+        return netCDF4.Dataset(path, 'r')
+
+    def _describe(self, year: int) -> Tuple[np.dtype, Dict]:
+        with self._dataset(self.year_path(year)) as ds:
+            var = ds.variables[self.variable]
+            return (np.dtype(var.dtype), {name: var.getncattr(name) for name in var.ncattrs()})
+
+    def _read_year(self, year: int, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        with self._dataset(self.year_path(year)) as ds:
+            var = ds.variables[self.variable]
+            var.set_auto_mask(False)
+            return var[time_idx[0]:time_idx[1], lat_idx[0]:lat_idx[1], lon_idx[0]:lon_idx[1]]
+
+
+class NpyMirrorBackend(YearMirrorBackend):
+    """
+    Local mirror made of per-year raw arrays, saved with numpy.save
+    as (days in year, lat, lon) and read memory-mapped.
+    Raw arrays carry no attributes: those of the variable, _FillValue and missing_value included,
+    are read from attributes.json in the mirror directory, else from the fallback backend.
+    A fill value given explicitly overrides both.
+    """
+    ATTRIBUTES_FILE = 'attributes.json'
+
+    def __init__(self, path: str, variable: str, pattern: str = '{year}.npy', fallback: Optional[Backend] = None,
+                 fill_value: Optional[float] = None):
+        """
+        :param fill_value: value of the days without data in the arrays, if not in attributes.json
+        """
+        YearMirrorBackend.__init__(self, path, variable, pattern, fallback)
+        self.fill_value = fill_value
+
+    def _describe(self, year: int) -> Tuple[np.dtype, Dict]:
+        dtype = np.load(self.year_path(year), mmap_mode='r').dtype
+        attributes_path = os.path.join(self.url, self.ATTRIBUTES_FILE)
+        if os.path.exists(attributes_path):
+            with open(attributes_path) as f:
+                attributes = json.load(f)
+        elif self.fallback is not None and self.fill_value is None:
+            attributes = dict(self._open_fallback().attributes)
+        else:
+            attributes = {}
+        if self.fill_value is not None:
+            attributes['_FillValue'] = self.fill_value
+        return (dtype, attributes)
+
+    def _read_year(self, year: int, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        data = np.load(self.year_path(year), mmap_mode='r')
+        return data[time_idx[0]:time_idx[1], lat_idx[0]:lat_idx[1], lon_idx[0]:lon_idx[1]]
@@ -0,0 +1,41 @@
+from typing import Dict, Tuple
+
+import numpy as np
+from pydap.client import open_url
+
+from silvereye_wps_demo.models.backends.base import Backend, IndexRange
+
+
+class OPeNDAPBackend(Backend):
+    """Reads a variable from a remote OPeNDAP server, e.g. NCI THREDDS."""
+
+    def __init__(self, url: str, variable: str, timeout: int = 3600) -> None:
+        Backend.__init__(self, url, variable)
+        self.timeout = timeout
+        self.dataset = None
+
+    def open(self) -> Backend:
+        self.dataset = open_url(self.url, output_grid=False, timeout=self.timeout)
+        return self
+
+    def _var(self):
+        if self.dataset is None:
+            self.open()
+        return self.dataset[self.variable]
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self._var().shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self._var().dtype)
+
+    @property
+    def attributes(self) -> Dict:
+        return self._var().attributes
+
+    def read(self, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        return self._var()[time_idx[0]:time_idx[1],
+                           lat_idx[0]:lat_idx[1],
+                           lon_idx[0]:lon_idx[1]].data
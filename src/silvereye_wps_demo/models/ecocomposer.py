@@ -1,5 +1,7 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Tuple
+from typing import Callable, Iterator, List, Optional, Tuple
 
 from silvereye_wps_demo.models.tempmax import TempMax
 from silvereye_wps_demo.models.tempmin import TempMin
@@ -7,20 +9,66 @@ from silvereye_wps_demo.models.rainfall import Rainfall
 from silvereye_wps_demo.models.vapourpressure import VapourPressure
 from silvereye_wps_demo.models.solarradiation import SolarRadiation
 
+from silvereye_wps_demo.models.ecomeasure import EcoMeasure
 from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.runningstatistics import STATISTICS
+from silvereye_wps_demo.models.helpers.settings import Settings
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
 from silvereye_wps_demo.models.helpers.validators import Validators
+from silvereye_wps_demo.models.helpers.compression import Compression
 from silvereye_wps_demo.models.helpers.csvarraywriter import CSVArrayWriter
+from silvereye_wps_demo.models.helpers.netcdfarraywriter import NetCDFArrayWriter
+
+OUTPUT_FORMATS = ["csv", "netcdf"]
+
+# EcoMeasure class of every variable
+MEASURES = {
+    "rainfall": Rainfall,
+    "solar_radiation": SolarRadiation,
+    "temp_max": TempMax,
+    "temp_min": TempMin,
+    "vapour_pressure": VapourPressure,
+}
+
+# CF cell methods of the statistics, along time
+CELL_METHODS = {'mean': 'mean', 'min': 'minimum', 'max': 'maximum', 'std': 'standard_deviation'}
 
 
 class EcoComposer:
 
-    def __init__(self, variables: List) -> None:
-        """initializer"""
+    def __init__(self, variables: List, region_mean: bool = False, statistics: List[str] = None,
+                 output_format: str = "csv", compression: str = "none") -> None:
+        """
+        initializer
+        :param variables: variables to process
+        :param region_mean: output one mean over the whole region per period (period,variable rows),
+                            instead of one mean per cell
+        :param statistics: statistics to output per cell, from mean, min, max, std, count; mean by default
+        :param output_format: csv, one row per period and cell, or netcdf, one gridded variable per result
+        :param compression: gzip or zstd to compress the csv output while it is written, none to leave it plain;
+                            netcdf output is always compressed internally, see netcdf_complevel
+        """
         self.variables = variables
+        self.region_mean = region_mean
+        self.output_format = output_format
+        self.compression = None if compression == "none" else compression
+        # in the canonical order, so the columns do not depend on the order of the request
+        self.statistics = [s for s in STATISTICS if s in (statistics or ['mean'])]
         self.instances = {}  # will hold instances of classes, when needed
         if not self._valid_vars():
             raise ValueError("ecoComposer::init: invalid list of variables")
+        if not self.statistics or any(s not in STATISTICS for s in statistics or []):
+            raise ValueError("ecoComposer::init: invalid list of statistics")
+        if region_mean and self.statistics != ['mean']:
+            raise ValueError("ecoComposer::init: statistics other than mean are not available for region means")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("ecoComposer::init: invalid output format")
+        if self.compression is not None and self.compression not in Compression.available():
+            raise ValueError("ecoComposer::init: compression not available")
         self._create_instances()
+        for instance in self.instances.values():
+            instance.region_mean = region_mean
+            instance.statistics = self.statistics
 
     def _valid_vars(self) -> bool:
         """ensures the requested processes are within our capabilities"""
@@ -56,19 +104,246 @@ class EcoComposer:
         if "solar_radiation" in self.variables:
             self.instances["solar_radiation"] = SolarRadiation()
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def dataset(variable: str) -> str:
+        """Returns the dataset a variable is read from, as url#variable, without creating a composer."""
+        measure = MEASURES[variable]()
+        return '{}#{}'.format(measure.data['url'], measure.data['variable'])
+
+    def _map_variables(self, fn: Callable[[EcoMeasure], np.ndarray]) -> List[np.ndarray]:
+        """
+        Applies fn to the EcoMeasure instance of every requested variable.
+        The variables are independent datasets, so they are processed concurrently
+        by up to variable_workers threads; results are returned in the requested order.
+        :param fn: callable receiving an EcoMeasure instance
+        :return: list of results, one per variable
+        """
+        instances = [self.instances[v] for v in self.variables]
+        workers = min(Settings.get_int('variable_workers', 5), len(instances))
+        if workers <= 1:
+            return [fn(instance) for instance in instances]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='variable') as executor:
+            return list(executor.map(fn, instances))
+
+    def _coordinates(self,
+                     time_name: str,
+                     time_col: List[str],
+                     lat_range: Tuple[float, float],
+                     lon_range: Tuple[float, float]) -> Tuple[List, List[str]]:
+        """
+        Makes the coordinate columns of a report, and their headers:
+        time, latitude and longitude of every cell, or only time in region mean mode.
+        :param time_name: header of the time column
+        :param time_col: one label per period
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :return: (report columns, field names)
+        """
+        if self.region_mean:
+            return ([np.array(time_col)], [time_name])
+        (lat_col, lon_col) = self._cell_labels(lat_range, lon_range)
+        lat_size = len(lat_col)
+        lon_size = len(lon_col)
+        time_size = len(time_col)
+        report = [
+            np.repeat(time_col, lat_size * lon_size),
+            np.tile(np.repeat(lat_col, lon_size), time_size),
+            np.tile(lon_col, lat_size * time_size)]
+        return (report, [time_name, "lat", "lon"])
+
+    @staticmethod
+    def _cell_labels(lat_range: Tuple[float, float], lon_range: Tuple[float, float]) -> Tuple[List, List]:
+        """
+        Returns the latitude and longitude labels of the csv rows, exactly one per cell sliced from the data,
+        so that rows stay aligned with the results over all periods.
+        Labels are the requested coordinates (Indexers.lat_as_vector, lon_as_vector), cut to the number of cells;
+        the coordinates of the cells themselves in the rare cases there are fewer labels than cells.
+        """
+        (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(lat_range), Indexers.lon_range_as_idx(lon_range))
+        lat_col = Indexers.lat_as_vector(lat_range)[:lat_idx[1] - lat_idx[0]]
+        if len(lat_col) < lat_idx[1] - lat_idx[0]:
+            lat_col = Indexers.lat_idx_as_vector(lat_idx)
+        lon_col = Indexers.lon_as_vector(lon_range)[:lon_idx[1] - lon_idx[0]]
+        if len(lon_col) < lon_idx[1] - lon_idx[0]:
+            lon_col = Indexers.lon_idx_as_vector(lon_idx)
+        return (lat_col, lon_col)
+
+    def _result_columns(self, results: List[np.ndarray]) -> List[Tuple[str, str, str, np.ndarray]]:
+        """
+        Lists the results of every variable, one entry per statistic:
+        the mean is named after the variable, e.g. Rainfall, other statistics get a suffix, e.g. Rainfall_max.
+        :param results: one result per variable, a structured array when several statistics are computed
+        :return: list of (name, statistic, variable, values)
+        """
+        columns = []
+        for (v, result) in zip(self.variables, results):
+            column_name = self.instances[v].column_name()
+            if result.dtype.names is None:
+                columns.append((column_name, 'mean', v, result))
+                continue
+            for name in result.dtype.names:
+                columns.append((column_name if name == 'mean' else "{}_{}".format(column_name, name),
+                                name, v, result[name]))
+        return columns
+
+    def _append_results(self, report: List, field_names: List[str], results: List[np.ndarray]) -> None:
+        """
+        Appends the result columns of every variable to a report, and their headers.
+        :param report: report columns
+        :param field_names: headers of the report columns
+        :param results: one result per variable, a structured array when several statistics are computed
+        """
+        for (name, _, _, values) in self._result_columns(results):
+            field_names.append(name)
+            report.append(values.flatten())
+
+    def _write(self,
+               file_name: str,
+               time_name: str,
+               time_col: List[str],
+               lat_range: Tuple[float, float],
+               lon_range: Tuple[float, float],
+               fn: Callable[[EcoMeasure], np.ndarray],
+               time_column: bool = True) -> Optional[Iterator[str]]:
+        """
+        Computes the results of every variable, and writes them in the output format.
+        :param file_name: path to output file to write into, None to stream the csv output
+        :param time_name: header of the time column
+        :param time_col: one label per period
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :param fn: callable receiving an EcoMeasure instance, and returning its result for all periods
+        :param time_column: False to leave the time column out of a csv output with a single period
+        :return: None, or an iterator over the csv text when streamed
+        """
+        if file_name is None:
+            return self._stream(time_name, time_col, lat_range, lon_range, fn, time_column)
+
+        results = self._map_variables(fn)
+        if self.output_format == "netcdf":
+            self._write_netcdf(file_name, time_name, time_col, lat_range, lon_range, results)
+            return None
+
+        (report, field_names) = self._csv_columns(time_name, time_col, lat_range, lon_range, results, time_column)
+        csv = CSVArrayWriter(file_name, field_names, report, compression=self.compression)
+        csv.write()
+        return None
+
+    def _stream(self,
+                time_name: str,
+                time_col: List[str],
+                lat_range: Tuple[float, float],
+                lon_range: Tuple[float, float],
+                fn: Callable[[EcoMeasure], np.ndarray],
+                time_column: bool = True) -> Iterator[str]:
+        """
+        Yields the csv output as it is computed, nothing being written to disk.
+        Periods are computed as the file output computes them, a span of contiguous periods at a time
+        (see EcoMeasure._span_groups), or stream_periods periods at a time when set;
+        the rows of a span are then formatted and yielded period by period, before the next span is computed.
+        Several periods are reduced with EcoMeasure.mean_periods, as the processes over several periods do.
+        """
+        if self.output_format != "csv":
+            raise ValueError("ecoComposer::_stream(): only the csv output can be streamed")
+        if len(time_col) == 1:
+            groups = [time_col]
+        else:
+            if Settings.get('fetch_mode', 'span') == 'period':
+                sizes = [1] * len(time_col)
+            else:
+                time_ranges = [TimeConverters.label2trange(label) for label in time_col]
+                sizes = [len(span) for span in EcoMeasure._span_groups(time_ranges)]
+            group_size = Settings.get_int('stream_periods', 0)
+            if group_size > 0:
+                sizes = [min(group_size, size - lo) for size in sizes for lo in range(0, size, group_size)]
+            bounds = np.cumsum([0] + sizes)
+            groups = [time_col[lo:hi] for (lo, hi) in zip(bounds[:-1], bounds[1:])]
+        header = True
+        for group in groups:
+            if len(time_col) == 1:
+                results = self._map_variables(fn)
+            else:
+                time_ranges = [TimeConverters.label2trange(label) for label in group]
+                results = self._map_variables(lambda m: m.mean_periods(time_ranges, lat_range, lon_range))
+            results = [result.reshape((len(group), -1)) for result in results]
+            for (i, label) in enumerate(group):
+                (report, field_names) = self._csv_columns(time_name, [label], lat_range, lon_range,
+                                                          [result[i] for result in results], time_column)
+                yield from CSVArrayWriter(None, field_names, report).blocks(header=header)
+                header = False
+
+    def _csv_columns(self,
+                     time_name: str,
+                     time_col: List[str],
+                     lat_range: Tuple[float, float],
+                     lon_range: Tuple[float, float],
+                     results: List[np.ndarray],
+                     time_column: bool = True) -> Tuple[List, List[str]]:
+        """
+        Makes the columns of a csv report, and their headers: coordinates first, then results.
+        :return: (report columns, field names)
+        """
+        if time_column or self.region_mean:
+            (report, field_names) = self._coordinates(time_name, time_col, lat_range, lon_range)
+        else:
+            (lat_col, lon_col) = self._cell_labels(lat_range, lon_range)
+            report = [np.repeat(lat_col, len(lon_col)), np.tile(lon_col, len(lat_col))]
+            field_names = ["lat", "lon"]
+        # report[j] with 0 < j < total_cols has all the data, by column
+        self._append_results(report, field_names, results)
+        return (report, field_names)
+
+    def _write_netcdf(self,
+                      file_name: str,
+                      time_name: str,
+                      time_col: List[str],
+                      lat_range: Tuple[float, float],
+                      lon_range: Tuple[float, float],
+                      results: List[np.ndarray]) -> None:
+        """
+        Writes the results as NetCDF: one (time, lat, lon) variable per variable and statistic,
+        or one (time) variable per variable in region mean mode.
+        Cell values are stored in the storage type of each variable, counts as 32 bit integers.
+        """
+        # the coordinates of the cells sliced from the data
+        lat_col = Indexers.lat_idx_as_vector(Indexers.lat_range_as_idx(lat_range))
+        lon_col = Indexers.lon_idx_as_vector(Indexers.lon_range_as_idx(lon_range))
+        if self.region_mean:
+            shape = (len(time_col),)
+        else:
+            shape = (len(time_col), len(lat_col), len(lon_col))
+        variables = []
+        for (name, statistic, v, values) in self._result_columns(results):
+            instance = self.instances[v]
+            if statistic == 'count':
+                attributes = {'long_name': "number of valid days of {}".format(instance.column_name()), 'units': '1'}
+                values = values.astype(np.int32)
+            else:
+                source = instance.attributes()
+                attributes = {k: source[k] for k in ('standard_name', 'long_name', 'units') if k in source}
+                attributes['cell_methods'] = "time: {}".format(CELL_METHODS[statistic])
+                if self.region_mean:
+                    attributes['cell_methods'] += " area: mean"
+                values = values.astype(instance.dtype(), copy=False)
+            variables.append((name, values.reshape(shape), attributes))
+        writer = NetCDFArrayWriter(file_name, time_name, time_col, lat_col, lon_col, variables,
+                                   gridded=not self.region_mean, complevel=Settings.get_int('netcdf_complevel', 4))
+        writer.write()
+
     def process_one_year_one_month(self,
                                    file_name: str,
                                    yr: int, mo: int,
                                    lat_range: Tuple[float, float],
-                                   lon_range: Tuple[float, float]) -> None:
+                                   lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a given year-month period
-        :param file_name: path to outfile file to write into
+        :param file_name: path to outfile file to write into, None to stream the csv output
         :param yr: year in range 1970..2014
         :param mo: month in range 1..12
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len((self.instances.keys())) > 0 \
                    and Validators.is_valid_year(yr) \
@@ -78,42 +353,25 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer.process_one_year_one_month(): Invalid parameters")
 
-        # make the latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = ["{:4d}-{:02d}".format(yr, mo)]
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = 1
-
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.repeat(lat_col, lon_size),
-            np.tile(lon_col, lat_size)]
-        field_names = ["year-month", "lat", "lon"]
 
         # now, iterate over variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_by_month(yr, mo, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-month", time_col, lat_range, lon_range,
+                           lambda m: m.mean_by_month(yr, mo, lat_range, lon_range))
 
     def process_one_year_all_months(self,
                                     file_name: str,
                                     yr: int,
                                     lat_range: Tuple[float, float],
-                                    lon_range: Tuple[float, float]) -> None:
+                                    lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a whole year period, getting by month
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr: year in range 1970..2014
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year(yr) \
@@ -122,42 +380,25 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer.process_one_year_all_months(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.year_as_monthly_vector(yr)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be 12
-
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-month", "lat", "lon"]
 
         # now, perform each process, and accum results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_one_year_all_months(yr, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-month", time_col, lat_range, lon_range,
+                           lambda m: m.mean_one_year_all_months(yr, lat_range, lon_range))
 
     def process_years_all_months(self,
                                  file_name: str,
                                  yr_range: Tuple[int, int],
                                  lat_range: Tuple[float, float],
-                                 lon_range: Tuple[float, float]) -> None:
+                                 lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a whole year period, getting by month
-        :param file_name: path to file where the results will be written
+        :param file_name: path to file where the results will be written, None to stream the csv output
         :param yr_range: year range in range 1970..2014
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year_range(yr_range)\
@@ -166,45 +407,28 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer.process_years_all_months(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.years_as_monthly_vector(yr_range)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be 12 * (number of years)
-
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-month", "lat", "lon"]
 
         # now, iterate over processes, perform each process, and accum results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_years_all_months(yr_range, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-month", time_col, lat_range, lon_range,
+                           lambda m: m.mean_years_all_months(yr_range, lat_range, lon_range))
 
     def process_years_one_month(self,
                                 file_name: str,
                                 yr_range: Tuple[int, int],
                                 mo: int,
                                 lat_range: Tuple[float, float],
-                                lon_range: Tuple[float, float]) -> None:
+                                lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a whole year period, getting by month
         :type lat_range: Tuple[float, float]
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr_range: year range in range 1970..2014
         :param mo: one month in range 1..12
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year_range(yr_range) \
@@ -214,42 +438,26 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_years_one_month(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.years_month_as_vector(yr_range, mo)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be (number of years) * 1 month
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-month", "lat", "lon"]
 
         # now, iterate over processes, perform each process, and accum results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_years_one_month(yr_range, mo, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-month", time_col, lat_range, lon_range,
+                           lambda m: m.mean_years_one_month(yr_range, mo, lat_range, lon_range))
 
     def process_one_year_one_quarter(self,
                                      file_name: str,
                                      yr: int, qtr: int,
                                      lat_range: Tuple[float, float],
-                                     lon_range: Tuple[float, float]) -> None:
+                                     lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a given year-month period
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr: year in range 1970..2014
         :param qtr: quarter in range 1..4
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len((self.instances.keys())) > 0 \
                    and Validators.is_valid_year(yr) \
@@ -259,37 +467,25 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer.process_one_year_one_quarter(): Invalid parameters")
 
-        # make the latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-
-        report = [np.repeat(lat_col, lon_size), np.tile(lon_col, lat_size)]
-        field_names = ["lat", "lon"]
+        # make the time labels; the csv output has no time column, unless in region mean mode
+        time_col = ["{:04d}-q{:1d}".format(yr, qtr)]
 
         # now, iterate over processes, perform each process, and accum results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_by_quarter(yr, qtr, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-quarter", time_col, lat_range, lon_range,
+                           lambda m: m.mean_by_quarter(yr, qtr, lat_range, lon_range), time_column=False)
 
     def process_one_year_all_quarters(self,
                                       file_name: str,
                                       yr: int,
                                       lat_range: Tuple[float, float],
-                                      lon_range: Tuple[float, float]) -> None:
+                                      lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a whole year period, by quarter
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr: year in range 1970..2014
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs to csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year(yr) \
@@ -298,41 +494,25 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_one_year_all_quarters(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.year_as_quarterly_vector(yr)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be 4
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-quarter", "lat", "lon"]
 
         # now, iterate process over variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_one_year_all_quarters(yr, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-quarter", time_col, lat_range, lon_range,
+                           lambda m: m.mean_one_year_all_quarters(yr, lat_range, lon_range))
 
     def process_years_all_quarters(self,
                                    file_name: str,
                                    yr_range: Tuple[int, int],
                                    lat_range: Tuple[float, float],
-                                   lon_range: Tuple[float, float]) -> None:
+                                   lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a whole year period, by quarters
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr_range: year range in 1970..2014
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year_range(yr_range) \
@@ -341,44 +521,27 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_years_all_quarters(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.years_as_quarterly_vector(yr_range)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be 4 * (number of years)
-
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-quarter", "lat", "lon"]
 
         # now, iterate over processes, perform each process, and accum results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_years_all_quarters(yr_range, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-quarter", time_col, lat_range, lon_range,
+                           lambda m: m.mean_years_all_quarters(yr_range, lat_range, lon_range))
 
     def process_years_one_quarter(self,
                                   file_name: str,
                                   yr_range: Tuple[int, int],
                                   qtr: int,
                                   lat_range: Tuple[float, float],
-                                  lon_range: Tuple[float, float]) -> None:
+                                  lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a whole year period, getting by month
-        :param file_name: name of output file to write into
+        :param file_name: name of output file to write into, None to stream the csv output
         :param yr_range: year range in range 1970..2014
         :param qtr: one quarter in range 1..4
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year_range(yr_range) \
@@ -388,45 +551,27 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_years_one_quarter(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.years_quarter_as_vector(yr_range, qtr)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be (number of years) * 1 quarter
-
-        # prepare report series columns, and header
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-quarter", "lat", "lon"]
 
         # now, iterate process over variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_years_one_quarter(yr_range, qtr, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-quarter", time_col, lat_range, lon_range,
+                           lambda m: m.mean_years_one_quarter(yr_range, qtr, lat_range, lon_range))
 
     def process_one_year_month_range(self,
                                  file_name: str,
                                  yr: int,
                                  mo_range: Tuple[int, int],
                                  lat_range: Tuple[float, float],
-                                 lon_range: Tuple[float, float]):
+                                 lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the monthly mean for a range of months, in one year
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr: year in range 1970..2014
         :param mo_range: range of months, each in range 1..12
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year(yr) \
@@ -436,43 +581,25 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_one_year_month_range(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.year_months_as_vector(yr, mo_range)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)
-
-        # prepare report series columns, and headers
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-month", "lat", "lon"]
 
         # now, process variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_one_year_month_range(yr, mo_range, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-month", time_col, lat_range, lon_range,
+                           lambda m: m.mean_one_year_month_range(yr, mo_range, lat_range, lon_range))
 
     def process_one_year(self,
                          file_name: str,
                          yr: int,
                          lat_range: Tuple[float, float],
-                         lon_range: Tuple[float, float]) -> None:
+                         lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the mean for a whole year period, by year
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr: year in range 1970..2014
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs to csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year(yr) \
@@ -481,41 +608,25 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_one_year(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
-        time_col = ["{:04d}".format(yr)]  # only one element
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be 1
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year", "lat", "lon"]
+        # make the time labels
+        time_col = ["{:04d}".format(yr)]
 
         # now, iterate process over variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_by_year(yr, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year", time_col, lat_range, lon_range,
+                           lambda m: m.mean_by_year(yr, lat_range, lon_range))
 
     def process_years(self,
                       file_name: str,
                       yr_range: Tuple[int, int],
                       lat_range: Tuple[float, float],
-                      lon_range: Tuple[float, float]) -> None:
+                      lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the means for a range of years, by year
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yr_range: range of years, with each in range 1970..2014
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs to csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         is_valid = len(self.instances.keys()) > 0 \
                    and Validators.is_valid_year_range(yr_range) \
@@ -524,43 +635,27 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_years(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.years_as_vector(yr_range)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)  # should be 1
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year", "lat", "lon"]
 
         # now, iterate process over variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_years(yr_range, lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year", time_col, lat_range, lon_range,
+                           lambda m: m.mean_years(yr_range, lat_range, lon_range))
 
     def process_fromto_year_month_range(self,
                                         file_name: str,
                                         yrmo_from: Tuple[int, int],
                                         yrmo_to: Tuple[int, int],
                                         lat_range: Tuple[float, float],
-                                        lon_range: Tuple[float, float]):
+                                        lon_range: Tuple[float, float]) -> Optional[Iterator[str]]:
         """
         processes the monthly means for a range of months, within years
-        :param file_name: path to output file to write into
+        :param file_name: path to output file to write into, None to stream the csv output
         :param yrmo_from: starting year-month tuple, with year in range 1970:2014 and month in 1:12
         :param yrmo_to: ending year-month tuple, with year in range 1970:2014 and month in 1:12
         :param lat_range: latitudes
         :param lon_range: longitudes
-        :return: None, outputs a csv file
+        :return: None, outputs a csv or netcdf file; without file_name, an iterator over the csv text
         """
         (yr_from, mo_from) = yrmo_from
         (yr_to, mo_to) = yrmo_to
@@ -576,28 +671,9 @@ class EcoComposer:
         if not is_valid:
             raise ValueError("ecoComposer::process_fromto_year_month_range(): Invalid parameters")
 
-        # make the time, latitude and longitude columns
-        lat_col = Indexers.lat_as_vector(lat_range)
-        lon_col = Indexers.lon_as_vector(lon_range)
+        # make the time labels
         time_col = Indexers.fromto_yrmo_as_string_vector(yrmo_from, yrmo_to)
-        lat_size = len(lat_col)
-        lon_size = len(lon_col)
-        time_size = len(time_col)
-
-        # prepare report series columns, and headers
-        report = [
-            np.repeat(time_col, lat_size * lon_size),
-            np.tile(np.repeat(lat_col, lon_size), time_size),
-            np.tile(lon_col, lat_size * time_size)]
-        field_names = ["year-month", "lat", "lon"]
 
         # now, process variables, and collect results
-        for v in self.variables:
-            field_names.append(self.instances[v].column_name())
-            result = self.instances[v].mean_fromto_year_month_range(yrmo_from, yrmo_to,
-                                                                    lat_range, lon_range)
-            report.append(result.flatten())
-
-        # report[j] with 0 < j < total_cols has all the data, by column
-        csv = CSVArrayWriter(file_name, field_names, report)
-        csv.write()
+        return self._write(file_name, "year-month", time_col, lat_range, lon_range,
+                           lambda m: m.mean_fromto_year_month_range(yrmo_from, yrmo_to, lat_range, lon_range))
@@ -1,7 +1,23 @@
-from pydap.client import open_url
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import re
+from typing import Dict, List, Tuple
 import numpy as np
 
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.backends import create_backend
+from silvereye_wps_demo.models.helpers.aggregatestore import MonthlyAggregateStore
+from silvereye_wps_demo.models.helpers.datasetregistry import DatasetRegistry
+from silvereye_wps_demo.models.helpers.jobcost import JobCost
+from silvereye_wps_demo.models.helpers.periodcache import PeriodCache
+from silvereye_wps_demo.models.helpers.prefixsumstore import PrefixSumStore
+from silvereye_wps_demo.models.helpers.reductions import Reductions
+from silvereye_wps_demo.models.helpers.runningstatistics import RunningStatistics
+from silvereye_wps_demo.models.helpers.settings import Settings
+from silvereye_wps_demo.models.helpers.singleflight import FileSingleFlight, single_flight
+from silvereye_wps_demo.models.helpers.slicecache import SliceCache
+from silvereye_wps_demo.models.helpers.summedareatables import SummedAreaTables
+from silvereye_wps_demo.models.helpers.tilecache import TileCache
 from silvereye_wps_demo.models.helpers.validators import Validators
 from silvereye_wps_demo.models.helpers.indexers import Indexers
 from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
@@ -19,9 +35,12 @@ class EcoMeasure(object):
         self.data = {
             'url':  url,
             'variable': variable,
-            'name': name,
-            'ds': open_url(url, output_grid=False, timeout=3600)
+            'name': name
         }
+        # when set, means are averaged over the whole region: one value per period
+        self.region_mean = False
+        # statistics computed per cell and period; other than ['mean'], results are structured arrays
+        self.statistics = ['mean']
         self.debug = {
             'time_size': 0,
             'lat_size': 0,
@@ -30,13 +49,208 @@ class EcoMeasure(object):
             'total_size': 0
         }
 
+    def _open(self):
+        """Creates and opens the backend configured for this variable. Called by the registry on first use."""
+        return create_backend(self.data['name'], self.data['url'], self.data['variable']).open()
+
     def ds(self):
-        """Return the dataset. """
-        return self.data['ds']
+        """Return the data backend, opening it if this process has not done so yet."""
+        return DatasetRegistry.instance().get(self.data['name'], self._open)
+
+    def dtype(self) -> np.dtype:
+        """Returns the type fetched data is kept in, per the storage_dtype policy."""
+        return Reductions.storage_dtype(self.ds().dtype)
+
+    def attributes(self) -> Dict:
+        """Returns the attributes of the variable, e.g. units and long_name."""
+        return self.ds().attributes
 
     def raw_data(self):
-        """Returns the raw data matrix for this variable"""
-        return self.data['ds'][self.data['variable']]
+        """Returns the raw data matrix for this variable, indexable by [time, lat, lon] slices"""
+        return self.ds()
+
+    def check(self) -> bool:
+        """
+        Health check of the shared backend: reads a single value.
+        An unhealthy backend is dropped, and re-opened on next use.
+        """
+        return DatasetRegistry.instance().check(self.data['name'], lambda backend: backend.read((0, 1), (0, 1), (0, 1)))
+
+    def _fetch(self, time_idx: Tuple[int, int], lat_idx: Tuple[int, int], lon_idx: Tuple[int, int]):
+        """
+        Fetches a hyperslab by indices.
+        Requests are split into parts that upstream servers accept (see _plan),
+        fetched concurrently by up to fetch_workers threads,
+        and written straight into a preallocated result.
+        Indices outside the grid raise ValueError, rather than slicing from the end.
+        """
+        EcoMeasure._check_box((time_idx, lat_idx, lon_idx))
+        dtype = self.dtype()
+        parts = self._plan((time_idx, lat_idx, lon_idx), dtype.itemsize)
+        if len(parts) == 1:
+            return self._fetch_part(parts[0])
+
+        shape = tuple(hi - lo for (lo, hi) in (time_idx, lat_idx, lon_idx))
+        result = np.empty(shape, dtype=dtype)
+        origin = (time_idx[0], lat_idx[0], lon_idx[0])
+
+        def fetch_part(part):
+            result[self._offsets(part, origin)] = self._fetch_part(part)
+
+        workers = min(Settings.get_int('fetch_workers', 4), len(parts))
+        if workers <= 1:
+            for part in parts:
+                fetch_part(part)
+            return result
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch') as executor:
+            # list() re-raises the first failure, if any
+            list(executor.map(fetch_part, parts))
+        return result
+
+    @staticmethod
+    def _check_box(box) -> None:
+        """Raises ValueError unless every (start, stop) range of a (time, lat, lon) box is within the grid."""
+        grid = (eco_constants.TIME_IDX_MAX, eco_constants.LAT_IDX_MAX, eco_constants.LON_IDX_MAX)
+        for ((lo, hi), idx_max, axis) in zip(box, grid, ('time', 'lat', 'lon')):
+            if not 0 <= lo <= hi <= idx_max + 1:
+                raise ValueError("Invalid {} indices {}: must be within 0..{}".format(axis, (lo, hi), idx_max + 1))
+
+    @staticmethod
+    def _plan(box, itemsize: int) -> List:
+        """
+        Splits a (time_idx, lat_idx, lon_idx) box into parts of at most fetch_chunk_days days,
+        each part estimated to be at most max_response_bytes (extents x dtype size),
+        so that responses stay within what THREDDS/OPeNDAP servers accept.
+        :return: list of boxes, in order
+        """
+        chunk_days = Settings.get_int('fetch_chunk_days', 366)
+        max_bytes = Settings.get_int('max_response_bytes', 256 * 1024 ** 2)
+        ((time_lo_idx, time_hi_idx), lat_idx, lon_idx) = box
+        parts = []
+        for lo in range(time_lo_idx, time_hi_idx, chunk_days):
+            chunk = ((lo, min(lo + chunk_days, time_hi_idx)), lat_idx, lon_idx)
+            parts.extend(EcoMeasure._split(chunk, max(max_bytes // itemsize, 1)))
+        return parts
+
+    @staticmethod
+    def _split(box, max_size: int) -> List:
+        """
+        Splits a box along time, then latitude, then longitude,
+        until every part holds at most max_size values.
+        """
+        size = int(np.prod([hi - lo for (lo, hi) in box]))
+        if size <= max_size:
+            return [box]
+        for axis in range(3):
+            (lo, hi) = box[axis]
+            if hi - lo > 1:
+                step = -(-(hi - lo) // min(hi - lo, -(-size // max_size)))  # ceil divisions
+                parts = []
+                for part_lo in range(lo, hi, step):
+                    part = box[:axis] + ((part_lo, min(part_lo + step, hi)),) + box[axis + 1:]
+                    parts.extend(EcoMeasure._split(part, max_size))
+                return parts
+        return [box]
+
+    @staticmethod
+    def _offsets(box, origin) -> Tuple[slice, slice, slice]:
+        """Returns the slices where box goes in an array starting at origin indices."""
+        return tuple(slice(lo - o, hi - o) for ((lo, hi), o) in zip(box, origin))
+
+    def _fetch_part(self, part, depth: int = 0):
+        """
+        Fetches one planned part. A part the server still rejects as too large (see _too_large)
+        is halved along its longest axis and fetched again, at most fetch_split_depth times;
+        any other failure, e.g. a timeout or an unavailable server, is raised at once.
+        """
+        try:
+            return self._fetch_block(*part)
+        except Exception as err:
+            axis = int(np.argmax([hi - lo for (lo, hi) in part]))
+            (lo, hi) = part[axis]
+            if not self._too_large(err) or hi - lo <= 1 or depth >= Settings.get_int('fetch_split_depth', 8):
+                raise
+            logging.getLogger(__name__).warning('Fetch of %s rejected as too large, splitting it: %s', part, err)
+            mid = (lo + hi) // 2
+            halves = [part[:axis] + (half,) + part[axis + 1:] for half in ((lo, mid), (mid, hi))]
+            return np.concatenate([self._fetch_part(half, depth + 1) for half in halves], axis=axis)
+
+    @staticmethod
+    def _too_large(err: Exception) -> bool:
+        """
+        Tells whether a failed read was rejected for its size: an HTTP 413 response,
+        or a THREDDS/OPeNDAP error saying the request is too large, in err or the errors it was raised from.
+        """
+        while err is not None:
+            response = getattr(err, 'response', None)
+            if getattr(response, 'status_code', None) == 413:
+                return True
+            if re.search(r'\b413\b|too (large|big)', str(err), re.IGNORECASE):
+                return True
+            err = err.__cause__ or err.__context__
+        return False
+
+    def _fetch_block(self, time_idx: Tuple[int, int], lat_idx: Tuple[int, int], lon_idx: Tuple[int, int]):
+        """
+        Reads a hyperslab by indices from the shared backend,
+        holding one of the connection slots of its upstream server (see Backend.slot).
+        If the read fails, other than for its size, the backend is re-opened and the read retried once.
+        The data is converted to the storage type, with fill and missing values replaced by NaN.
+        """
+        backend = self.ds()
+        with backend.slot():
+            try:
+                block = backend.read(time_idx, lat_idx, lon_idx)
+            except Exception as err:
+                if self._too_large(err):
+                    raise
+                logging.getLogger(__name__).warning('Fetch from %s failed, re-opening: %s', backend.url, err)
+                DatasetRegistry.instance().invalidate(self.data['name'])
+                backend = self.ds()
+                block = backend.read(time_idx, lat_idx, lon_idx)
+        return Reductions.mask_missing(block, backend.missing_values, self.dtype())
+
+    def _cache_name(self) -> str:
+        """Returns the name of the fetched data in the caches: dataset, variable and the type it is kept in."""
+        return '#'.join([self.data['url'], self.data['variable'], Settings.get('storage_dtype', 'float32')])
+
+    def _read(self, time_idx: Tuple[int, int], lat_idx: Tuple[int, int], lon_idx: Tuple[int, int]):
+        """
+        Reads a hyperslab by indices, through the in-memory slice cache
+        and the on-disk tile cache when they are configured.
+        Concurrent requests for the same data wait for a single fetch.
+        Indices are snapped to the grid, so slightly different coordinates share cache entries.
+        """
+        name = self._cache_name()
+        memory = SliceCache.instance()
+        if memory is not None:
+            data = memory.get(name, time_idx, lat_idx, lon_idx)
+            if data is not None:
+                return data
+
+        # identical or contained fetches running at the same time share one upstream request
+        data = single_flight.fetch(name, time_idx, lat_idx, lon_idx, self._read_upstream)
+
+        if memory is not None:
+            memory.put(name, time_idx, lat_idx, lon_idx, data)
+        return data
+
+    def _read_upstream(self, time_idx: Tuple[int, int], lat_idx: Tuple[int, int], lon_idx: Tuple[int, int]):
+        """
+        Reads a hyperslab by indices through the tile cache when configured,
+        coalescing identical fetches of other processes when single_flight_dir is set.
+        """
+        name = self._cache_name()
+        fetch = self._fetch
+        cache = TileCache.instance()
+        if cache is not None:
+            def fetch(*idx):
+                return cache.read(name, *idx, self._fetch)
+
+        files = FileSingleFlight.instance()
+        if files is None:
+            return fetch(time_idx, lat_idx, lon_idx)
+        return files.fetch(name, time_idx, lat_idx, lon_idx, fetch)
 
     def column_name(self):
         return self.data["name"]
@@ -74,13 +288,8 @@ class EcoMeasure(object):
             (lat_lo, lat_hi) = lat_range
             (lon_lo, lon_hi) = lon_range
 
-            # convert times from iso to timestamps
-            time_lo_ts = TimeConverters.iso2ts(time_lo)
-            time_hi_ts = TimeConverters.iso2ts(time_hi)
-
-            # get time indices
-            time_lo_idx = Indexers.get_time_idx(time_lo_ts)
-            time_hi_idx = Indexers.get_time_idx(time_hi_ts)
+            # get time indices, in calendar days whatever the timezone
+            (time_lo_idx, time_hi_idx) = Indexers.time_range_as_idx((time_lo, time_hi))
 
             # get latitude indices
             lat_lo_idx = Indexers.get_lat_idx(lat_lo)
@@ -90,38 +299,470 @@ class EcoMeasure(object):
             lon_lo_idx = Indexers.get_lon_idx(lon_lo)
             lon_hi_idx = Indexers.get_lon_idx(lon_hi)
 
-            # debug data
-            # time_size = time_hi_idx - time_lo_idx + 1
-            # lat_size = abs(lat_hi_idx - lat_lo_idx) + 1
-            # lon_size = lon_hi_idx - lon_lo_idx + 1
-            # self.debug['time_size'] = time_size
-            # self.debug['lat_size'] = lat_size
-            # self.debug['lon_size'] = lon_size
-            # self.debug['dimensions'] = (time_size, lat_size, lon_size)
-            # total_size = time_size * lat_size * lon_size
-            # self.debug['total_size'] = total_size
-            # self.debug['time_lo_idx'] = time_lo_idx
-            # self.debug['time_hi_idx'] = time_hi_idx
-            # self.debug['lat_lo_idx'] = lat_lo_idx
-            # self.debug['lat_hi_idx'] = lat_hi_idx
-            # self.debug['lon_lo_idx'] = lon_lo_idx
-            # self.debug['lon_hi_idx'] = lon_hi_idx
+            # sizes of the slice, as estimated by JobCost before the job runs
+            self.debug = JobCost.slice_size((time_lo_idx, time_hi_idx),
+                                            (lat_hi_idx, lat_lo_idx),
+                                            (lon_lo_idx, lon_hi_idx))
 
             # return slice
-            return self.data['ds'][self.data['variable']][
-                      time_lo_idx:time_hi_idx,
-                      lat_hi_idx:lat_lo_idx,
-                      lon_lo_idx:lon_hi_idx
-                      ].data
+            return self._read((time_lo_idx, time_hi_idx),
+                              (lat_hi_idx, lat_lo_idx),
+                              (lon_lo_idx, lon_hi_idx))
             # for testing without real data:
-            # return (np.random.random(total_size) * 30 + 10).reshape(time_size, lat_size, lon_size )
+            # return np.random.random(self.debug['dimensions']) * 30 + 10
 
         except ValueError as err:
-            print(err)
+            logging.getLogger(__name__).error('%s.slice%s: %s',
+                                              self.data['name'], (time_range, lat_range, lon_range), err)
+            raise
 
     def get_debug(self):
         return self.debug
 
+    def mean_periods(self,
+                     time_ranges: List[Tuple[str, str]],
+                     lat_range: Tuple[float, float],
+                     lon_range: Tuple[float, float]):
+        """
+        Calculates the means for a list of periods, in the given order.
+        With fetch_mode = span (the default) contiguous periods are fetched with a single
+        request per span of at most span_days days, and reduced locally into periods.
+        With fetch_mode = period every period is fetched on its own.
+        With reduction_source = aggregate, periods are answered from the monthly aggregate store
+        when it holds them; with reduction_source = prefix, from the prefix-sum store.
+        :param time_ranges: list of (time_lo, time_hi) iso date tuples, in ascending order
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :return: NumPy array flat
+        """
+        if self.region_mean:
+            return self.region_mean_periods(time_ranges, lat_range, lon_range)
+        cache = PeriodCache.instance()
+        if cache is not None and Settings.get('reduction_source', 'daily') == 'daily':
+            return self._cached_periods(cache, time_ranges, lat_range, lon_range).reshape(-1)
+        if self.statistics != ['mean']:
+            return self.period_statistics(time_ranges, lat_range, lon_range, self.statistics).reshape(-1)
+        return self.period_means(time_ranges, lat_range, lon_range).reshape(-1)
+
+    def _cached_periods(self,
+                        cache: PeriodCache,
+                        time_ranges: List[Tuple[str, str]],
+                        lat_range: Tuple[float, float],
+                        lon_range: Tuple[float, float]):
+        """
+        Calculates the per cell results of a list of periods through the period cache:
+        periods already computed are read back, and only the missing ones are computed,
+        over the cache tiles covering the region.
+        :param cache: the period cache
+        :param time_ranges: list of (time_lo, time_hi) iso date tuples, in ascending order
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :return: NumPy.Array (of 3 dimensions: period, lat, lon), structured if statistics other than mean
+        """
+        Validators.validate_parameters((time_ranges[0][0], time_ranges[-1][1]), lat_range, lon_range)
+        # results depend on the dataset, the statistics and the type policy
+        name = '#'.join([self.data['url'], self.data['variable'], ','.join(self.statistics),
+                         Settings.get('storage_dtype', 'float32'), Settings.get('accumulator_dtype', 'float64'),
+                         Settings.get('dataset_version', '')])
+
+        def compute(missing: List[int], lat_idx: Tuple[int, int], lon_idx: Tuple[int, int]):
+            ranges = [time_ranges[i] for i in missing]
+            (lat_box, lon_box) = (Indexers.lat_idx_as_range(lat_idx), Indexers.lon_idx_as_range(lon_idx))
+            if self.statistics != ['mean']:
+                return self.period_statistics(ranges, lat_box, lon_box, self.statistics)
+            return self.period_means(ranges, lat_box, lon_box)
+
+        return cache.periods(name,
+                             [Indexers.time_range_as_idx(time_range) for time_range in time_ranges],
+                             Indexers.lat_range_as_idx(lat_range),
+                             Indexers.lon_range_as_idx(lon_range),
+                             compute)
+
+    def period_statistics(self,
+                          time_ranges: List[Tuple[str, str]],
+                          lat_range: Tuple[float, float],
+                          lon_range: Tuple[float, float],
+                          statistics: List[str],
+                          dtype=np.float64):
+        """
+        Calculates several statistics for a list of periods, with one fetch and one pass over the data:
+        each fetched block (a span of periods, or a chunk of it for huge requests)
+        feeds the running statistics of every period it covers.
+        :param time_ranges: list of (time_lo, time_hi) iso date tuples, in ascending order
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :param statistics: names of the statistics, from mean, min, max, std, count
+        :param dtype: type of the floating point fields, the values being rounded to the dataset type
+        :return: NumPy structured Array (of 3 dimensions: period, lat, lon), with one field per statistic
+        """
+        Validators.validate_parameters((time_ranges[0][0], time_ranges[-1][1]), lat_range, lon_range)
+        lat_idx = Indexers.lat_range_as_idx(lat_range)
+        lon_idx = Indexers.lon_range_as_idx(lon_range)
+        shape = (lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0])
+        fields = [(name, np.int64 if name == 'count' else dtype) for name in statistics]
+        out = np.empty((len(time_ranges),) + shape, dtype=fields)
+        data_dtype = self.dtype()
+
+        if Settings.get('fetch_mode', 'span') == 'period':
+            groups = [[time_range] for time_range in time_ranges]
+        else:
+            groups = self._span_groups(time_ranges)
+        i = 0
+        for group in groups:
+            bounds = [Indexers.time_range_as_idx(time_range) for time_range in group]
+            (span_lo, span_hi) = (bounds[0][0], bounds[-1][1])
+            chunk_days = span_hi - span_lo
+            if self._is_streamed(group, lat_range, lon_range):
+                chunk_days = max(Settings.get_int('stream_chunk_days', 16), 1)
+            running = [RunningStatistics(shape, statistics) for _ in group]
+            for chunk_lo in range(span_lo, span_hi, chunk_days):
+                chunk_hi = min(chunk_lo + chunk_days, span_hi)
+                block = self._read((chunk_lo, chunk_hi), lat_idx, lon_idx)
+                for ((lo, hi), period) in zip(bounds, running):
+                    if lo < chunk_hi and chunk_lo < hi:
+                        period.add(block[max(lo, chunk_lo) - chunk_lo:min(hi, chunk_hi) - chunk_lo])
+            for period in running:
+                for name in statistics:
+                    value = period.result(name)
+                    out[name][i] = value if name == 'count' else value.astype(data_dtype, copy=False)
+                i += 1
+        return out
+
+    def period_means(self,
+                     time_ranges: List[Tuple[str, str]],
+                     lat_range: Tuple[float, float],
+                     lon_range: Tuple[float, float],
+                     out: np.ndarray = None):
+        """
+        Calculates the means for a list of periods, as mean_periods does,
+        into a (period, lat, lon) result buffer allocated once and filled in place.
+        :param time_ranges: list of (time_lo, time_hi) iso date tuples, in ascending order
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :param out: buffer to fill, of shape (len(time_ranges), lat, lon); allocated if None
+        :return: NumPy.Array (of 3 dimensions: period, lat, lon), float64 unless out says otherwise
+        """
+        if out is None:
+            Validators.validate_parameters((time_ranges[0][0], time_ranges[-1][1]), lat_range, lon_range)
+            (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(lat_range), Indexers.lon_range_as_idx(lon_range))
+            out = np.empty((len(time_ranges), lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]), dtype=np.float64)
+
+        if self._mean_precomputed(time_ranges, lat_range, lon_range, out) is not None:
+            return out
+
+        if Settings.get('fetch_mode', 'span') == 'period':
+            for (i, time_range) in enumerate(time_ranges):
+                if self._is_streamed([time_range], lat_range, lon_range):
+                    self._mean_streaming([time_range], lat_range, lon_range, out[i:i + 1])
+                else:
+                    out[i] = Reductions.mean(self.slice(time_range, lat_range, lon_range))
+            return out
+
+        i = 0
+        for group in self._span_groups(time_ranges):
+            if self._is_streamed(group, lat_range, lon_range):
+                self._mean_streaming(group, lat_range, lon_range, out[i:i + len(group)])
+            else:
+                self._mean_span(group, lat_range, lon_range, out[i:i + len(group)])
+            i += len(group)
+        return out
+
+    def _is_streamed(self,
+                     time_ranges: List[Tuple[str, str]],
+                     lat_range: Tuple[float, float],
+                     lon_range: Tuple[float, float]) -> bool:
+        """
+        Tells whether the daily data covering time_ranges would exceed stream_threshold_bytes,
+        in which case it is reduced by _mean_streaming instead of being fetched whole.
+        """
+        threshold = Settings.get_int('stream_threshold_bytes', 1024 ** 3)
+        if threshold <= 0:
+            return False
+        time_idx = Indexers.time_range_as_idx((time_ranges[0][0], time_ranges[-1][1]))
+        lat_idx = Indexers.lat_range_as_idx(lat_range)
+        lon_idx = Indexers.lon_range_as_idx(lon_range)
+        size = (time_idx[1] - time_idx[0]) * (lat_idx[1] - lat_idx[0]) * (lon_idx[1] - lon_idx[0])
+        return size * self.dtype().itemsize > threshold
+
+    def _mean_streaming(self,
+                        time_ranges: List[Tuple[str, str]],
+                        lat_range: Tuple[float, float],
+                        lon_range: Tuple[float, float],
+                        out: np.ndarray = None):
+        """
+        Calculates the means of periods walking the time axis in chunks of stream_chunk_days days,
+        keeping only a running sum and valid count per cell and period:
+        peak memory is bounded by the chunk size rather than by the size of the request.
+        :param out: optional (period, lat, lon) buffer to fill
+        :return: NumPy.Array (of 3 dimensions: period, lat, lon)
+        """
+        Validators.validate_parameters((time_ranges[0][0], time_ranges[-1][1]), lat_range, lon_range)
+        lat_idx = Indexers.lat_range_as_idx(lat_range)
+        lon_idx = Indexers.lon_range_as_idx(lon_range)
+        chunk_days = max(Settings.get_int('stream_chunk_days', 16), 1)
+        dtype = self.dtype()
+        if out is None:
+            out = np.empty((len(time_ranges), lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]), dtype=dtype)
+
+        total = np.empty(out.shape[1:], dtype=Reductions.accumulator_dtype())
+        count = np.empty(out.shape[1:], dtype=np.int32)
+        for (i, time_range) in enumerate(time_ranges):
+            (lo, hi) = Indexers.time_range_as_idx(time_range)
+            total.fill(0)
+            count.fill(0)
+            for chunk_lo in range(lo, hi, chunk_days):
+                chunk = self._read((chunk_lo, min(chunk_lo + chunk_days, hi)), lat_idx, lon_idx)
+                (chunk_sums, chunk_counts) = Reductions.valid_sums(chunk)
+                total += chunk_sums
+                count += chunk_counts
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[i] = (total / count).astype(dtype, copy=False)
+        return out
+
+    def _mean_precomputed(self,
+                          time_ranges: List[Tuple[str, str]],
+                          lat_range: Tuple[float, float],
+                          lon_range: Tuple[float, float],
+                          out: np.ndarray = None):
+        """
+        Calculates the means of periods from a precomputed store, selected by reduction_source:
+        aggregate answers whole-month periods from the monthly aggregate store,
+        prefix answers any period, within the region the prefix-sum store was built for.
+        Cells without valid days get NaN.
+        :param out: optional (period, lat, lon) buffer to fill
+        :return: NumPy.Array (of 3 dimensions: period, lat, lon), or None if the store cannot answer
+        """
+        source = Settings.get('reduction_source', 'daily')
+        if source == 'aggregate':
+            store = MonthlyAggregateStore.instance(self.data['name'])
+        elif source == 'prefix':
+            store = PrefixSumStore.instance(self.data['name'])
+        else:
+            return None
+        if store is None:
+            return None
+        Validators.validate_parameters((time_ranges[0][0], time_ranges[-1][1]), lat_range, lon_range)
+        lat_idx = Indexers.lat_range_as_idx(lat_range)
+        lon_idx = Indexers.lon_range_as_idx(lon_range)
+        dtype = self.dtype()
+        if out is None:
+            out = np.empty((len(time_ranges), lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]), dtype=dtype)
+        for (i, time_range) in enumerate(time_ranges):
+            period = store.period(Indexers.time_range_as_idx(time_range), lat_idx, lon_idx)
+            if period is None:
+                return None
+            (total, count) = period
+            with np.errstate(invalid='ignore', divide='ignore'):
+                # rounded to the dataset type, as computed from daily data
+                out[i] = (total / count).astype(dtype, copy=False)
+        return out
+
+    def build_aggregates(self, yr_range: Tuple[int, int], force: bool = False) -> int:
+        """
+        Builds the monthly aggregates of this variable for a range of years, from daily data.
+        Months already stored are skipped unless force is set.
+        :param yr_range: year range in 1970..2014
+        :param force: rebuild months already stored
+        :return: number of months built
+        """
+        store = MonthlyAggregateStore.instance(self.data['name'])
+        if store is None:
+            raise ValueError("aggregate_dir is not configured")
+        return store.build(self._fetch, yr_range, force)
+
+    def build_region_tables(self, yr_range: Tuple[int, int], force: bool = False) -> int:
+        """
+        Builds the summed-area tables of the monthly aggregates already stored for a range of years.
+        Months that have tables are skipped unless force is set.
+        :param yr_range: year range in 1970..2014
+        :param force: rebuild tables already stored
+        :return: number of months built
+        """
+        tables = SummedAreaTables.instance(self.data['name'])
+        if tables is None:
+            raise ValueError("aggregate_dir is not configured")
+        return tables.build(yr_range, force)
+
+    def build_prefix_sums(self, yr_hi: int, lat_range: Tuple[float, float], lon_range: Tuple[float, float]) -> int:
+        """
+        Builds the prefix sums of this variable from 1970 to yr_hi, for a region, from daily data.
+        Years already stored for the same region are skipped.
+        :param yr_hi: last year to build, in 1970..2014
+        :param lat_range: latitudes of the region
+        :param lon_range: longitudes of the region
+        :return: number of years built
+        """
+        store = PrefixSumStore.instance(self.data['name'])
+        if store is None:
+            raise ValueError("prefix_sum_dir is not configured")
+        Validators.validate_parameters(('1970-01-01', '{:04d}-12-31'.format(yr_hi)), lat_range, lon_range)
+        return store.build(self._fetch, yr_hi,
+                           Indexers.lat_range_as_idx(lat_range),
+                           Indexers.lon_range_as_idx(lon_range))
+
+    def prefix_sum_drift(self,
+                         time_range: Tuple[str, str],
+                         lat_range: Tuple[float, float],
+                         lon_range: Tuple[float, float]) -> float:
+        """
+        Compares the mean of a period from the prefix sums with the one computed from daily data.
+        :return: largest absolute difference, NaN if the store cannot answer
+        """
+        store = PrefixSumStore.instance(self.data['name'])
+        if store is None:
+            raise ValueError("prefix_sum_dir is not configured")
+        return store.drift(self._fetch,
+                           Indexers.time_range_as_idx(time_range),
+                           Indexers.lat_range_as_idx(lat_range),
+                           Indexers.lon_range_as_idx(lon_range))
+
+    def _mean_period(self,
+                     time_range: Tuple[str, str],
+                     lat_range: Tuple[float, float],
+                     lon_range: Tuple[float, float]):
+        """
+        Calculates the mean of a single period, from aggregates if possible, else from daily data.
+        :return: NumPy.Array (of 2 dimensions: lat, lon) with the result
+        """
+        if self.region_mean:
+            return self.region_mean_periods([time_range], lat_range, lon_range)
+        if self.statistics != ['mean']:
+            return self.period_statistics([time_range], lat_range, lon_range, self.statistics, self.dtype())[0]
+        means = self._mean_precomputed([time_range], lat_range, lon_range)
+        if means is not None:
+            return means[0]
+        if self._is_streamed([time_range], lat_range, lon_range):
+            return self._mean_streaming([time_range], lat_range, lon_range)[0]
+        return Reductions.mean(self.slice(time_range, lat_range, lon_range))
+
+    def region_mean_periods(self,
+                            time_ranges: List[Tuple[str, str]],
+                            lat_range: Tuple[float, float],
+                            lon_range: Tuple[float, float]):
+        """
+        Calculates the mean over the whole region for a list of periods, in the given order:
+        the mean of all the valid daily values of each period within the region.
+        Whole-month periods are answered with 4 lookups per month from the summed-area tables
+        of the monthly aggregates when they are built, others are reduced from daily data.
+        :param time_ranges: list of (time_lo, time_hi) iso date tuples, in ascending order
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :return: NumPy array flat, one mean per period
+        """
+        tables = SummedAreaTables.instance(self.data['name'])
+        if tables is not None:
+            Validators.validate_parameters((time_ranges[0][0], time_ranges[-1][1]), lat_range, lon_range)
+            lat_idx = Indexers.lat_range_as_idx(lat_range)
+            lon_idx = Indexers.lon_range_as_idx(lon_range)
+            periods = [tables.region_period(Indexers.time_range_as_idx(tr), lat_idx, lon_idx) for tr in time_ranges]
+            if all(period is not None for period in periods):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means = np.array([total for (total, _) in periods]) / [count for (_, count) in periods]
+                return means.astype(self.dtype())
+
+        if Settings.get('fetch_mode', 'span') == 'period':
+            groups = [[time_range] for time_range in time_ranges]
+        else:
+            groups = self._span_groups(time_ranges)
+        return np.concatenate([self._region_mean_span(group, lat_range, lon_range) for group in groups])
+
+    def _region_mean_span(self,
+                          time_ranges: List[Tuple[str, str]],
+                          lat_range: Tuple[float, float],
+                          lon_range: Tuple[float, float]):
+        """
+        Fetches the whole span covered by time_ranges at once, or in chunks of stream_chunk_days days
+        when it exceeds stream_threshold_bytes, and reduces it into one region mean per period.
+        :return: NumPy.Array (of 1 dimension: period)
+        """
+        span = (time_ranges[0][0], time_ranges[-1][1])
+        Validators.validate_parameters(span, lat_range, lon_range)
+        (span_lo, span_hi) = Indexers.time_range_as_idx(span)
+        lat_idx = Indexers.lat_range_as_idx(lat_range)
+        lon_idx = Indexers.lon_range_as_idx(lon_range)
+        chunk_days = span_hi - span_lo
+        if self._is_streamed(time_ranges, lat_range, lon_range):
+            chunk_days = max(Settings.get_int('stream_chunk_days', 16), 1)
+
+        # valid values and their count per day, then per period as in _mean_span
+        day_sums = np.empty(span_hi - span_lo, dtype=Reductions.accumulator_dtype())
+        day_counts = np.empty(span_hi - span_lo, dtype=np.int64)
+        for chunk_lo in range(span_lo, span_hi, chunk_days):
+            chunk_hi = min(chunk_lo + chunk_days, span_hi)
+            block = self._read((chunk_lo, chunk_hi), lat_idx, lon_idx)
+            days = slice(chunk_lo - span_lo, chunk_hi - span_lo)
+            (day_sums[days], day_counts[days]) = Reductions.valid_sums(block, axis=(1, 2))
+        starts = self._segment_starts(time_ranges, span_lo, span_hi - span_lo)
+        sums = np.add.reduceat(day_sums, starts)[::2]
+        counts = np.add.reduceat(day_counts, starts)[::2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (sums / counts).astype(self.dtype(), copy=False)
+
+    @staticmethod
+    def _span_groups(time_ranges: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """
+        Groups consecutive periods that can be fetched together:
+        the gap to the previous period is at most one day,
+        and the whole group spans no more than span_days days.
+        """
+        span_days = Settings.get_int('span_days', 3660)
+        groups = []
+        group_lo = prev_hi = None
+        for time_range in time_ranges:
+            (lo, hi) = Indexers.time_range_as_idx(time_range)
+            if groups and lo - prev_hi <= 1 and hi - group_lo <= span_days:
+                groups[-1].append(time_range)
+            else:
+                groups.append([time_range])
+                group_lo = lo
+            prev_hi = hi
+        return groups
+
+    @staticmethod
+    def _segment_starts(time_ranges: List[Tuple[str, str]], span_lo: int, span_days: int) -> np.ndarray:
+        """
+        Returns the start indices of the segmented sum of a span into periods, relative to the start of the span.
+        np.add.reduceat sums between consecutive indices, so (lo, hi) pairs are interleaved and every other
+        segment is kept; the last hi is the end of the span.
+        Raises ValueError unless the periods are in order, not empty, and cover the span from start to end,
+        as reduceat would silently sum the wrong days otherwise.
+        :param time_ranges: list of (time_lo, time_hi) iso date tuples, in ascending order
+        :param span_lo: time index of the first day of the span
+        :param span_days: number of days in the span
+        :return: NumPy.Array of 2 x len(time_ranges) - 1 indices
+        """
+        bounds = np.array([Indexers.time_range_as_idx(tr) for tr in time_ranges]) - span_lo
+        flat = bounds.flatten()
+        if flat[0] != 0 or flat[-1] != span_days or np.any(bounds[:, 1] <= bounds[:, 0]) or np.any(np.diff(flat) < 0):
+            raise ValueError("Invalid periods {}: they must be in order, within a span of {} days"
+                             .format(time_ranges, span_days))
+        return flat[:-1]
+
+    def _mean_span(self,
+                   time_ranges: List[Tuple[str, str]],
+                   lat_range: Tuple[float, float],
+                   lon_range: Tuple[float, float],
+                   out: np.ndarray = None):
+        """
+        Fetches the whole span covered by time_ranges at once,
+        and reduces it into one mean per period with a segmented sum.
+        Sums are accumulated in accumulator_dtype (float64 by default), then rounded to the type of the data:
+        means may differ from a float32 np.mean of each period in the last digit.
+        :param out: optional (period, lat, lon) buffer to fill
+        :return: NumPy.Array (of 3 dimensions: period, lat, lon)
+        """
+        span = (time_ranges[0][0], time_ranges[-1][1])
+        block = self.slice(span, lat_range, lon_range)
+        (span_lo, _) = Indexers.time_range_as_idx(span)
+        starts = self._segment_starts(time_ranges, span_lo, block.shape[0])
+        (sums, counts) = Reductions.segment_sums(block, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sums = sums[::2] / counts[::2]
+        if out is None:
+            return sums.astype(block.dtype, copy=False)
+        out[...] = sums.astype(block.dtype, copy=False)
+        return out
+
     def mean_by_month(self, year: int, month: int, lat_range: Tuple[float, float], lon_range: Tuple[float, float]):
         """
         Calculates the mean for the given month, for the given coords,
@@ -133,8 +774,7 @@ class EcoMeasure(object):
         :return: NumPy.Array (of 2 dimensions: lat, lon) with the result
         """
         time_range = TimeConverters.ym2trange(year, month)
-        slice = self.slice(time_range, lat_range, lon_range)
-        return np.mean(slice, 0)
+        return self._mean_period(time_range, lat_range, lon_range)
 
     def mean_one_year_all_months(self, year: int, lat_range: Tuple[float, float], lon_range: Tuple[float, float]):
         """
@@ -144,12 +784,8 @@ class EcoMeasure(object):
         :param lon_range: longitudes
         :return: NumPy array flat
         """
-        result = np.array([])
-        mo_range = range(1, 13)
-        for mo in mo_range:
-            mean = self.mean_by_month(year, mo, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.ym2trange(year, mo) for mo in range(1, 13)]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_years_all_months(self,
                               yr_range: Tuple[int, int],
@@ -163,14 +799,10 @@ class EcoMeasure(object):
         :return: NumPy array flat
         """
         (yr_lo, yr_hi) = yr_range
-        result = np.array([])
         years_range = range(yr_lo, yr_hi + 1)
         mo_range = range(1, 13)
-        for yr in years_range:
-            for mo in mo_range:
-                mean = self.mean_by_month(yr, mo, lat_range, lon_range)
-                result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.ym2trange(yr, mo) for yr in years_range for mo in mo_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_years_one_month(self,
                              yr_range: Tuple[int, int],
@@ -186,12 +818,9 @@ class EcoMeasure(object):
         :return: NumPy array flat
         """
         (yr_lo, yr_hi) = yr_range
-        result = np.array([])
         years_range = range(yr_lo, yr_hi + 1)
-        for yr in years_range:
-            mean = self.mean_by_month(yr, mo, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.ym2trange(yr, mo) for yr in years_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def min_by_month(self,
                      year: int,
@@ -209,7 +838,8 @@ class EcoMeasure(object):
         """
         time_range = TimeConverters.ym2trange(year, month)
         slice = self.slice(time_range, lat_range, lon_range)
-        return np.ma.min(slice, 0)
+        # fmin skips NaN, unless a cell has no valid value
+        return np.fmin.reduce(slice, axis=0)
 
     def max_by_month(self,
                      year: int,
@@ -227,7 +857,8 @@ class EcoMeasure(object):
         """
         time_range = TimeConverters.ym2trange(year, month)
         slice = self.slice(time_range, lat_range, lon_range)
-        return np.ma.max(slice, 0)
+        # fmax skips NaN, unless a cell has no valid value
+        return np.fmax.reduce(slice, axis=0)
 
     def mean_by_quarter(self,
                         year: int,
@@ -244,8 +875,7 @@ class EcoMeasure(object):
         :return: NumPy.Array (of 2 dimensions: lat, lon) with the result
         """
         time_range = TimeConverters.yq2trange(year, qtr)
-        slice = self.slice(time_range, lat_range, lon_range)
-        return np.mean(slice, 0)
+        return self._mean_period(time_range, lat_range, lon_range)
 
     def mean_one_year_all_quarters(self,
                                    year: int,
@@ -258,12 +888,9 @@ class EcoMeasure(object):
         :param lon_range: longitudes range
         :return: NumPy Array flattened to one-dimension vector
         """
-        result = np.array([])
         quarters_range = range(1, 5)
-        for qtr in quarters_range:
-            mean = self.mean_by_quarter(year, qtr, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.yq2trange(year, qtr) for qtr in quarters_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_years_all_quarters(self,
                                 yr_range: Tuple[int, int],
@@ -277,14 +904,10 @@ class EcoMeasure(object):
         :return: NumPy Array flattened to one-dimensional vector
         """
         (yr_lo, yr_hi) = yr_range
-        result = np.array([])
         years_range = range(yr_lo, yr_hi + 1)
         quarters_range = range(1, 5)
-        for yr in years_range:
-            for qtr in quarters_range:
-                mean = self.mean_by_quarter(yr, qtr, lat_range, lon_range)
-                result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.yq2trange(yr, qtr) for yr in years_range for qtr in quarters_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_years_one_quarter(self,
                                yr_range: Tuple[int, int],
@@ -300,12 +923,9 @@ class EcoMeasure(object):
         :return: NumPy Array flattened to one-dimension vector
         """
         (yr_lo, yr_hi) = yr_range
-        result = np.array([])
         years_range = range(yr_lo, yr_hi + 1)
-        for yr in years_range:
-            mean = self.mean_by_quarter(yr, qtr, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.yq2trange(yr, qtr) for yr in years_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_one_year_month_range(self,
                                   year: int,
@@ -321,12 +941,9 @@ class EcoMeasure(object):
         :return: NumPy array flat
         """
         (mo_min, mo_max) = mo_range
-        result = np.array([])
         months_range = range(mo_min, mo_max + 1)
-        for mo in months_range:
-            mean = self.mean_by_month(year, mo, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.ym2trange(year, mo) for mo in months_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_by_year(self,
                      year: int,
@@ -340,8 +957,7 @@ class EcoMeasure(object):
         :return: NumPy.Array (of 2 dimensions: lat, lon) with the result
         """
         time_range = TimeConverters.y2trange(year)
-        slice = self.slice(time_range, lat_range, lon_range)
-        return np.mean(slice, 0)
+        return self._mean_period(time_range, lat_range, lon_range)
 
     def mean_years(self,
                    yr_range: Tuple[int, int],
@@ -355,12 +971,9 @@ class EcoMeasure(object):
         :return: NumPy.Array (of 2 dimensions: lat, lon) with the result
         """
         (yr_min, yr_max) = yr_range
-        result = np.array([])
         years_range = range(yr_min, yr_max + 1)
-        for yr in years_range:
-            mean = self.mean_by_year(yr, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.y2trange(yr) for yr in years_range]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
 
     def mean_fromto_year_month_range(self,
                                      yrmo_from: Tuple[int, int],
@@ -375,9 +988,6 @@ class EcoMeasure(object):
         :param lon_range: longitude range
         :return: NumPy array flat
         """
-        result = np.array([])
         range_of_year_months = Indexers.fromto_yrmo_as_vector(yrmo_from, yrmo_to)
-        for (yr, mo) in range_of_year_months:
-            mean = self.mean_by_month(yr, mo, lat_range, lon_range)
-            result = np.concatenate((result, mean.flatten()), axis=0)
-        return result
+        time_ranges = [TimeConverters.ym2trange(yr, mo) for (yr, mo) in range_of_year_months]
+        return self.mean_periods(time_ranges, lat_range, lon_range)
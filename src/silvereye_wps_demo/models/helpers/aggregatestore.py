@@ -0,0 +1,154 @@
+import functools
+import logging
+import os
+import uuid
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.settings import Settings
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+
+IndexRange = Tuple[int, int]
+
+
+class MonthlyAggregateStore(object):
+    """
+    Precomputed per-cell monthly sums and valid-day counts of one variable, on the full grid.
+    Each month is stored as 2-D .npy planes read memory-mapped, so a period mean
+    reads one small (lat, lon) window per month instead of every daily plane:
+        <root>/<name>/YYYY-MM.sum.npy    sum over the month's time indices, float64
+        <root>/<name>/YYYY-MM.count.npy  number of valid days in that sum, int16
+        <root>/<name>/YYYY-MM.tail.npy   value of the day right after them, NaN if invalid
+    Month time indices are the ones EcoMeasure.slice uses, which stop before the last day
+    of the month; the tail plane holds that day, so quarters and years spanning several
+    months are reproduced exactly from the monthly planes.
+    """
+
+    def __init__(self, root: str, name: str) -> None:
+        """
+        :param root: directory of the aggregate stores
+        :param name: name of the variable, e.g. Rainfall
+        """
+        self.path = os.path.join(root, name)
+
+    @staticmethod
+    def instance(name: str) -> Optional['MonthlyAggregateStore']:
+        """Returns the store of a variable under aggregate_dir, or None if not configured."""
+        root = Settings.get('aggregate_dir', '')
+        if not root:
+            return None
+        return MonthlyAggregateStore(root, name)
+
+    @staticmethod
+    def month_idx(yr: int, mo: int) -> IndexRange:
+        """(lo, hi) time indices of a month, as used by EcoMeasure.slice."""
+        return Indexers.time_range_as_idx(TimeConverters.ym2trange(yr, mo))
+
+    @staticmethod
+    def months() -> List[Tuple[int, int]]:
+        """All the (year, month) pairs of the dataset."""
+        return [(yr, mo)
+                for yr in range(eco_constants.YEAR_MIN, eco_constants.YEAR_MAX + 1)
+                for mo in range(1, 13)]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def month_table() -> List[Tuple[Tuple[int, int], IndexRange]]:
+        """All the months of the dataset, with their (lo, hi) time indices."""
+        return [((yr, mo), MonthlyAggregateStore.month_idx(yr, mo))
+                for (yr, mo) in MonthlyAggregateStore.months()]
+
+    def _plane_path(self, yr: int, mo: int, kind: str) -> str:
+        return os.path.join(self.path, '{:04d}-{:02d}.{}.npy'.format(yr, mo, kind))
+
+    def has_month(self, yr: int, mo: int) -> bool:
+        # the sum plane is written last
+        return os.path.exists(self._plane_path(yr, mo, 'sum'))
+
+    def _plane(self, yr: int, mo: int, kind: str, lat_idx: IndexRange, lon_idx: IndexRange) -> np.ndarray:
+        data = np.load(self._plane_path(yr, mo, kind), mmap_mode='r')
+        return data[lat_idx[0]:lat_idx[1], lon_idx[0]:lon_idx[1]]
+
+    def months_of(self, time_idx: IndexRange) -> Optional[List[Tuple[int, int]]]:
+        """
+        Returns the months exactly covering a (lo, hi) range of time indices,
+        or None if the range does not start and end on month boundaries.
+        """
+        (lo, hi) = time_idx
+        months = [(ym, m_idx) for (ym, m_idx) in self.month_table() if m_idx[0] >= lo and m_idx[1] <= hi]
+        if not months or months[0][1][0] != lo or months[-1][1][1] != hi:
+            return None
+        return [ym for (ym, _) in months]
+
+    def period(self, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange):
+        """
+        Returns the sum and valid count of a period, for the given window of the grid.
+        :param time_idx: (lo, hi) time indices of the period, on month boundaries
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :return: (sum, count) 2-D arrays, or None if the store cannot answer
+        """
+        months = self.months_of(time_idx)
+        if months is None or not all(self.has_month(yr, mo) for (yr, mo) in months):
+            return None
+        total = np.zeros((lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]), dtype=np.float64)
+        count = np.zeros(total.shape, dtype=np.int32)
+        for (i, (yr, mo)) in enumerate(months):
+            total += self._plane(yr, mo, 'sum', lat_idx, lon_idx)
+            count += self._plane(yr, mo, 'count', lat_idx, lon_idx)
+            if i < len(months) - 1:
+                # the day between this month's indices and the next one's
+                tail = self._plane(yr, mo, 'tail', lat_idx, lon_idx)
+                valid = np.isfinite(tail)
+                total += np.where(valid, tail, 0.0)
+                count += valid
+        return (total, count)
+
+    def build_month(self, fetch, yr: int, mo: int, band_rows: int = 256) -> None:
+        """
+        Computes and stores the planes of one month from daily data.
+        The grid is processed in bands of latitudes to bound memory.
+        :param fetch: callable fetching a (time_idx, lat_idx, lon_idx) hyperslab of daily data
+        :param yr: year in range 1970..2014
+        :param mo: month in range 1..12
+        :param band_rows: latitudes processed at once
+        """
+        (m_lo, m_hi) = self.month_idx(yr, mo)
+        shape = (eco_constants.LAT_IDX_MAX + 1, eco_constants.LON_IDX_MAX + 1)
+        total = np.empty(shape, dtype=np.float64)
+        count = np.empty(shape, dtype=np.int16)
+        tail = np.empty(shape, dtype=np.float32)
+        for lat_lo in range(0, shape[0], band_rows):
+            lat_idx = (lat_lo, min(lat_lo + band_rows, shape[0]))
+            # the month's days, plus the tail day
+            block = fetch((m_lo, m_hi + 1), lat_idx, (0, shape[1]))
+            days = block[:m_hi - m_lo]
+            valid = np.isfinite(days)
+            total[lat_idx[0]:lat_idx[1]] = np.where(valid, days, 0.0).sum(axis=0, dtype=np.float64)
+            count[lat_idx[0]:lat_idx[1]] = valid.sum(axis=0)
+            tail[lat_idx[0]:lat_idx[1]] = block[m_hi - m_lo]
+
+        os.makedirs(self.path, exist_ok=True)
+        for (kind, data) in (('count', count), ('tail', tail), ('sum', total)):
+            path = self._plane_path(yr, mo, kind)
+            tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_path, path)
+        logging.getLogger(__name__).info('Built aggregates %s %04d-%02d', self.path, yr, mo)
+
+    def build(self, fetch, yr_range: Tuple[int, int], force: bool = False) -> int:
+        """
+        Incremental build: computes the months of a year range that are not stored yet.
+        :return: number of months built
+        """
+        (yr_lo, yr_hi) = yr_range
+        built = 0
+        for (yr, mo) in self.months():
+            if yr_lo <= yr <= yr_hi and (force or not self.has_month(yr, mo)):
+                self.build_month(fetch, yr, mo)
+                built += 1
+        return built
@@ -0,0 +1,113 @@
+import gzip
+import mimetypes
+import zlib
+from typing import IO, Iterable, Iterator, List, Optional
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+# extension of compressed files, and Content-Encoding they are served with, by compression
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class Compression(object):
+    """
+    Compression of output files on the fly, while they are written.
+    gzip is always available, zstd when the zstandard package is installed (pip install -e ".[zstd]").
+    Compressed files are named after their compression, e.g. out.csv.gz, which tells
+    the Content-Encoding they are served with. Levels are set in pywps.cfg (gzip_level, zstd_level).
+    """
+
+    @staticmethod
+    def available() -> List[str]:
+        """Returns the compressions that can be used here."""
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return ['gzip']
+        return ['gzip', 'zstd']
+
+    @staticmethod
+    def file_name(file_name: str, compression: str = None) -> str:
+        """
+        Returns the name of a file once compressed.
+        Example: f('out.csv', 'gzip') -> 'out.csv.gz', f('out.csv', 'none') -> 'out.csv'
+        """
+        return file_name + EXTENSIONS.get(compression, '')
+
+    @staticmethod
+    def open(file_name: str, compression: str = None) -> IO[str]:
+        """
+        Opens a text file for writing, compressed on the fly.
+        :param file_name: path of the file
+        :param compression: gzip or zstd; None or none to write it uncompressed
+        :return: file object
+        """
+        if compression in (None, 'none'):
+            return open(file_name, 'w')
+        if compression == 'gzip':
+            return gzip.open(file_name, 'wt', compresslevel=Settings.get_int('gzip_level', 6))
+        if compression == 'zstd':
+            zstandard = Compression._zstandard()
+            compressor = zstandard.ZstdCompressor(level=Settings.get_int('zstd_level', 3))
+            return zstandard.open(file_name, 'wt', cctx=compressor)
+        raise ValueError("Compression.open(): unknown compression {}".format(compression))
+
+    @staticmethod
+    def stream(chunks: Iterable[str], compression: str = None) -> Iterator[bytes]:
+        """
+        Encodes text chunks, compressing them on the fly, e.g. to stream a response.
+        :param chunks: text to encode, piece by piece
+        :param compression: gzip or zstd; None or none to leave it uncompressed
+        :return: bytes, as they are produced
+        """
+        if compression in (None, 'none'):
+            for chunk in chunks:
+                yield chunk.encode('utf-8')
+            return
+        if compression == 'gzip':
+            # wbits 31: with the gzip header and trailer
+            compressor = zlib.compressobj(Settings.get_int('gzip_level', 6), zlib.DEFLATED, 31)
+        elif compression == 'zstd':
+            compressor = Compression._zstandard().ZstdCompressor(level=Settings.get_int('zstd_level', 3)).compressobj()
+        else:
+            raise ValueError("Compression.stream(): unknown compression {}".format(compression))
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    @staticmethod
+    def encoding(file_name: str) -> Optional[str]:
+        """Returns the Content-Encoding of a file, after its name; None when it is not compressed."""
+        for (compression, extension) in EXTENSIONS.items():
+            if file_name.endswith(extension):
+                return compression
+        return None
+
+    @staticmethod
+    def media_type(file_name: str) -> str:
+        """Returns the media type of the content of a file, compressed or not, e.g. text/csv for out.csv.gz."""
+        encoding = Compression.encoding(file_name)
+        if encoding is not None:
+            file_name = file_name[:-len(EXTENSIONS[encoding])]
+        (media_type, _) = mimetypes.guess_type(file_name, strict=False)
+        return media_type or 'application/octet-stream'
+
+    @staticmethod
+    def decompressed(file_name: str) -> IO[bytes]:
+        """Opens a compressed file for reading its content, decompressed on the fly."""
+        encoding = Compression.encoding(file_name)
+        if encoding == 'gzip':
+            return gzip.open(file_name, 'rb')
+        if encoding == 'zstd':
+            return Compression._zstandard().open(file_name, 'rb')
+        return open(file_name, 'rb')
+
+    @staticmethod
+    def _zstandard():
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("The zstd compression requires the zstandard package")
+        return zstandard
@@ -1,32 +1,94 @@
 import csv
-from typing import List
+from typing import Dict, List
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.compression import Compression
 
 
 class CSVArrayWriter:
-    """Serializes a Python array into a csv file."""
+    """
+    Serializes a Python array into a csv file.
+    Columns are formatted a block of rows at a time with NumPy, and each block is written
+    with a single call, so memory is bounded by the block size whatever the number of rows.
+    The output is the one of csv.writer: minimal quoting, \\r\\n line endings,
+    and values formatted as str() formats them.
+    The file can be compressed while it is written, see Compression.
+    """
 
-    def __init__(self, file_name: str, field_names: List, data: List) -> None:
+    def __init__(self, file_name: str, field_names: List, data: List,
+                 precision: Dict[str, int] = None, chunk_rows: int = 65536, compression: str = None) -> None:
         """
         :para file_name: str, filename to write to
         :param field_names: list of names for the column headers
         :param data: List, Python Array with the data by columns
+        :param precision: optional number of decimals of some float columns, by header;
+                          other columns keep the shortest repr of their values
+        :param chunk_rows: number of rows formatted and written at once
+        :param compression: gzip or zstd to compress the file on the fly, None to write plain text
         """
         self.file_name = file_name
         self.field_names = field_names
         self.data = data
+        self.precision = precision or {}
+        self.chunk_rows = chunk_rows
+        self.compression = compression
 
     def write(self):
-        with open(self.file_name, 'w') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(self.field_names)
-            row_count = len(self.data[-1])
-            col_count = len(self.data)
-            row_range = range(row_count)
-            col_range = range(col_count)
-            for i in row_range:
-                # make a row with data from columns
-                row = [self.data[j][i] for j in col_range]  # data is by cols
-                writer.writerow(tuple(row))
+        with Compression.open(self.file_name, self.compression) as csvfile:
+            for block in self.blocks():
+                csvfile.write(block)
+
+    def blocks(self, header: bool = True):
+        """
+        Yields the csv text, header first, then one block of up to chunk_rows rows at a time.
+        :param header: False to leave the header out, e.g. when the rows follow earlier ones
+        """
+        columns = [np.asarray(column) for column in self.data]
+        precisions = [self.precision.get(name) for name in self.field_names]
+        if header:
+            yield self._format_rows([[self._quote(str(name))] for name in self.field_names])
+        row_count = len(columns[-1])
+        for lo in range(0, row_count, self.chunk_rows):
+            hi = min(lo + self.chunk_rows, row_count)
+            cells = [self._format_column(column[lo:hi], digits) for (column, digits) in zip(columns, precisions)]
+            yield self._format_rows(cells)
+
+    @staticmethod
+    def _format_column(column: np.ndarray, digits: int = None) -> List[str]:
+        """Formats a block of a column as csv fields."""
+        if column.dtype.kind in 'biuf' and len(column) > 1:
+            # coordinate columns repeat a few values: format each of them once,
+            # unless -0.0 is there, which np.unique does not tell from 0.0
+            if column.dtype.kind != 'f' or not np.any(np.signbit(column) & (column == 0)):
+                (values, inverse) = np.unique(column, return_inverse=True)
+                if len(values) <= len(column) // 4:
+                    fields = np.array(CSVArrayWriter._format_column(values, digits), dtype=object)
+                    return fields[inverse.reshape(-1)].tolist()
+        if digits is not None and column.dtype.kind == 'f':
+            return np.char.mod('%.{}f'.format(digits), column).tolist()
+        if column.dtype == np.float64:
+            # csv.writer formats floats with repr, the fastest way too
+            return list(map(repr, column.tolist()))
+        if column.dtype.kind in 'biuf':
+            # NumPy formats numbers as str() does, and they never need quoting
+            return column.astype(str).tolist()
+        return [CSVArrayWriter._quote('' if value is None else str(value)) for value in column.tolist()]
+
+    @staticmethod
+    def _quote(field: str) -> str:
+        """Quotes a field as csv.QUOTE_MINIMAL does."""
+        if ',' in field or '"' in field or '\r' in field or '\n' in field:
+            return '"' + field.replace('"', '""') + '"'
+        return field
+
+    @staticmethod
+    def _format_rows(cells: List[List[str]]) -> str:
+        """Joins formatted columns into csv lines."""
+        if len(cells) == 1:
+            # csv.writer quotes a row made of a single empty field
+            cells = [['""' if field == '' else field for field in cells[0]]]
+        return ''.join(','.join(row) + '\r\n' for row in zip(*cells))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+
+class DatasetRegistry(object):
+    """
+    Process-wide registry of opened datasets.
+    Datasets are opened lazily on first use, shared by every request
+    served by this process, and re-opened when their time-to-live expires
+    or when they are found to be unhealthy.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, ttl: float = 3600.0) -> None:
+        """
+        :param ttl: seconds a dataset handle is kept before being re-opened, 0 keeps it forever
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+        self._opening: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def instance(cls):
+        """Returns the registry of this process, created on first use with the dataset_ttl of pywps.cfg."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = DatasetRegistry(Settings.get_float('dataset_ttl', 3600.0))
+            return cls._instance
+
+    def get(self, key: str, opener: Callable[[], Any]) -> Any:
+        """
+        Returns the dataset registered under key, opening it with opener if needed.
+        Only one thread opens a given dataset; the others wait for it.
+        :param key: unique key for the dataset, usually its url
+        :param opener: callable without arguments returning a freshly opened dataset
+        :return: the dataset handle
+        """
+        handle = self._lookup(key)
+        if handle is not None:
+            return handle
+        with self._lock:
+            key_lock = self._opening.setdefault(key, threading.Lock())
+        with key_lock:
+            # somebody else may have opened it while we were waiting
+            handle = self._lookup(key)
+            if handle is None:
+                logging.getLogger(__name__).info('Opening dataset %s', key)
+                handle = opener()
+                with self._lock:
+                    self._entries[key] = (handle, time.monotonic())
+        return handle
+
+    def _lookup(self, key: str) -> Any:
+        """Returns the registered handle, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            (handle, opened_at) = entry
+            if self.ttl and time.monotonic() - opened_at > self.ttl:
+                del self._entries[key]
+                return None
+            return handle
+
+    def invalidate(self, key: str) -> None:
+        """Drops the handle registered under key, so the next get() re-opens it."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def check(self, key: str, probe: Callable[[Any], Any]) -> bool:
+        """
+        Health check: runs probe on the registered handle,
+        and invalidates it if the probe fails.
+        :param key: key of the dataset
+        :param probe: callable receiving the handle, e.g. reading a single value
+        :return: True if the handle is healthy or not opened yet
+        """
+        handle = self._lookup(key)
+        if handle is None:
+            return True
+        try:
+            probe(handle)
+            return True
+        except Exception as err:
+            logging.getLogger(__name__).warning('Dataset %s failed health check: %s', key, err)
+            self.invalidate(key)
+            return False
+
+    def clear(self) -> None:
+        """Drops all registered handles."""
+        with self._lock:
+            self._entries.clear()
@@ -1,3 +1,4 @@
+import datetime
 from typing import Tuple, List
 import numpy as np
 
@@ -45,16 +46,87 @@ class Indexers(object):
         """Given a date t, expressed in seconds,
            in range 1970-01-01 to 2014-12-31,
            returns the index on the time array.
+           Times within a day give the index of that day.
         """
         idx = -1
-        if eco_constants.TIME_MIN == t:
-            idx = eco_constants.TIME_IDX_MIN
-        elif eco_constants.TIME_MAX == t:
-            idx = eco_constants.TIME_IDX_MAX
-        elif eco_constants.TIME_MIN < t < eco_constants.TIME_MAX:
-            idx = round((t - eco_constants.TIME_MIN)/eco_constants.TIME_DELTA)
+        if eco_constants.TIME_MIN <= t < eco_constants.TIME_MAX + eco_constants.TIME_DELTA:
+            idx = min(int((t - eco_constants.TIME_MIN) // eco_constants.TIME_DELTA), eco_constants.TIME_IDX_MAX)
         return idx
 
+    @staticmethod
+    def date_idx(iso: str) -> int:
+        """
+        Returns the index on the time array of a date, counted in calendar days.
+        Example: f('1970-01-31') -> 30
+        :param iso: date in iso format, in range 1970-01-01 to 2014-12-31
+        :return: index, ValueError if out of range
+        """
+        idx = (datetime.date.fromisoformat(iso) - datetime.date(eco_constants.YEAR_MIN, 1, 1)).days
+        if not eco_constants.TIME_IDX_MIN <= idx <= eco_constants.TIME_IDX_MAX:
+            raise ValueError("Date {} is out of range {}..{}".format(iso, eco_constants.TIME_ISO_MIN,
+                                                                     eco_constants.TIME_ISO_MAX))
+        return idx
+
+    @staticmethod
+    def time_range_as_idx(time_range: Tuple[str, str]) -> Tuple[int, int]:
+        """
+        Converts an iso time range into the (lo, hi) indices used to slice the time array.
+        Example: f(('1970-01-01', '1970-01-31')) -> (0, 30)
+        :param time_range: (time_lo, time_hi) dates in iso format
+        :return: Tuple (time_lo_idx, time_hi_idx), ValueError if out of range
+        """
+        (time_lo, time_hi) = time_range
+        return (Indexers.date_idx(time_lo), Indexers.date_idx(time_hi))
+
+    @staticmethod
+    def lat_range_as_idx(lat_range: Tuple[float, float]) -> Tuple[int, int]:
+        """
+        Converts a latitude range into the (start, stop) indices used to slice the latitude array.
+        Latitudes are stored from the Equator southwards, so the northern edge comes first.
+        :param lat_range: (lat_lo, lat_hi) latitudes
+        :return: Tuple (lat_hi_idx, lat_lo_idx)
+        """
+        (lat_lo, lat_hi) = lat_range
+        return (Indexers.get_lat_idx(lat_hi), Indexers.get_lat_idx(lat_lo))
+
+    @staticmethod
+    def lon_range_as_idx(lon_range: Tuple[float, float]) -> Tuple[int, int]:
+        """
+        Converts a longitude range into the (start, stop) indices used to slice the longitude array.
+        :param lon_range: (lon_lo, lon_hi) longitudes
+        :return: Tuple (lon_lo_idx, lon_hi_idx)
+        """
+        (lon_lo, lon_hi) = lon_range
+        return (Indexers.get_lon_idx(lon_lo), Indexers.get_lon_idx(lon_hi))
+
+    @staticmethod
+    def year_start_idx(year: int) -> int:
+        """
+        Returns the index on the time array of the first day of a year.
+        Example: f(1971) -> 365
+        """
+        return (datetime.date(year, 1, 1) - datetime.date(eco_constants.YEAR_MIN, 1, 1)).days
+
+    @staticmethod
+    def time_idx_by_year(time_idx: Tuple[int, int]) -> List[Tuple[int, Tuple[int, int]]]:
+        """
+        Splits a (lo, hi) range of time indices at year boundaries.
+        Example: f((360, 370)) -> [(1970, (360, 365)), (1971, (365, 370))]
+        :param time_idx: (time_lo_idx, time_hi_idx), hi excluded
+        :return: List of (year, (lo, hi)) tuples
+        """
+        (time_lo_idx, time_hi_idx) = time_idx
+        result = []
+        year = eco_constants.YEAR_MIN
+        while Indexers.year_start_idx(year + 1) <= time_lo_idx:
+            year += 1
+        lo = time_lo_idx
+        while lo < time_hi_idx:
+            hi = min(Indexers.year_start_idx(year + 1), time_hi_idx)
+            result.append((year, (lo, hi)))
+            (year, lo) = (year + 1, hi)
+        return result
+
     @staticmethod
     def lat_as_vector(lat_range: Tuple[float, float]):
         """
@@ -84,6 +156,52 @@ class Indexers(object):
         v = np.linspace(start=lon_lo, stop=lon_hi, num=lon_size)
         return [round(n, 3) for n in v]
 
+    @staticmethod
+    def lat_idx_as_vector(lat_idx: Tuple[int, int]) -> List[float]:
+        """
+        Returns the latitudes of the cells in a range of latitude indices, as sliced from the data.
+        Example: f((0, 3)) -> [-9.005, -9.015, -9.025]
+        :param lat_idx: (start, stop) latitude indices, stop excluded
+        :return: a List of latitudes
+        """
+        (start, stop) = lat_idx
+        return [round(-(eco_constants.LAT_MIN + idx * eco_constants.LAT_DELTA), 3) for idx in range(start, stop)]
+
+    @staticmethod
+    def lon_idx_as_vector(lon_idx: Tuple[int, int]) -> List[float]:
+        """
+        Returns the longitudes of the cells in a range of longitude indices, as sliced from the data.
+        Example: f((0, 3)) -> [112.905, 112.915, 112.925]
+        :param lon_idx: (start, stop) longitude indices, stop excluded
+        :return: a List of longitudes
+        """
+        (start, stop) = lon_idx
+        return [round(eco_constants.LON_MIN + idx * eco_constants.LON_DELTA, 3) for idx in range(start, stop)]
+
+    @staticmethod
+    def lat_idx_as_range(lat_idx: Tuple[int, int]) -> Tuple[float, float]:
+        """
+        Converts a range of latitude indices back into the latitude range slicing them, see lat_range_as_idx.
+        Example: f((0, 3)) -> (-9.035, -9.005)
+        :param lat_idx: (start, stop) latitude indices, stop excluded
+        :return: Tuple (lat_lo, lat_hi)
+        """
+        (start, stop) = lat_idx
+        return (round(-(eco_constants.LAT_MIN + stop * eco_constants.LAT_DELTA), 3),
+                round(-(eco_constants.LAT_MIN + start * eco_constants.LAT_DELTA), 3))
+
+    @staticmethod
+    def lon_idx_as_range(lon_idx: Tuple[int, int]) -> Tuple[float, float]:
+        """
+        Converts a range of longitude indices back into the longitude range slicing them, see lon_range_as_idx.
+        Example: f((0, 3)) -> (112.905, 112.935)
+        :param lon_idx: (start, stop) longitude indices, stop excluded
+        :return: Tuple (lon_lo, lon_hi)
+        """
+        (start, stop) = lon_idx
+        return (round(eco_constants.LON_MIN + start * eco_constants.LON_DELTA, 3),
+                round(eco_constants.LON_MIN + stop * eco_constants.LON_DELTA, 3))
+
     @staticmethod
     def year_as_monthly_vector(year: int) -> List[str]:
         """
@@ -0,0 +1,84 @@
+from typing import Dict, List, Tuple
+
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.settings import Settings
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+
+IndexRange = Tuple[int, int]
+
+# lanes jobs are queued in, each with its own slots: small interactive queries, and large batch extractions
+LANES = ('interactive', 'batch')
+
+
+class JobCost(object):
+    """
+    Estimates the cost of a job before it runs, from its inputs alone:
+    the bytes of daily data to fetch (days x lat cells x lon cells x variables x item size),
+    plus its output rows, weighted as cost_row_bytes bytes each.
+    Jobs up to interactive_max_cost go to the interactive lane, larger ones to the batch lane.
+    """
+
+    @staticmethod
+    def slice_size(time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> Dict:
+        """
+        Returns the size of a (time, lat, lon) slice.
+        Example: f((0, 31), (10, 20), (0, 5)) -> {'time_size': 31, 'lat_size': 10, 'lon_size': 5,
+                                                  'dimensions': (31, 10, 5), 'total_size': 1550}
+        :param time_idx: (start, stop) time indices
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :return: dict with the size along every axis, the dimensions and the total number of values
+        """
+        dimensions = tuple(hi - lo for (lo, hi) in (time_idx, lat_idx, lon_idx))
+        return {
+            'time_size': dimensions[0],
+            'lat_size': dimensions[1],
+            'lon_size': dimensions[2],
+            'dimensions': dimensions,
+            'total_size': dimensions[0] * dimensions[1] * dimensions[2]
+        }
+
+    @staticmethod
+    def estimate(time_col: List[str],
+                 lat_range: Tuple[float, float],
+                 lon_range: Tuple[float, float],
+                 variables: int,
+                 region_mean: bool = False,
+                 itemsize: int = 4) -> Dict:
+        """
+        Estimates the cost of a job.
+        :param time_col: one label per period, e.g. 1990-01, 1990-q1 or 1990
+        :param lat_range: latitudes
+        :param lon_range: longitudes
+        :param variables: number of variables
+        :param region_mean: True for one output row per period, instead of one per cell
+        :param itemsize: bytes per daily value fetched
+        :return: dict with the days, cells, bytes to fetch, output rows, cost and lane of the job
+        Raises ValueError for a job without any day or cell, which cannot be estimated.
+        """
+        days = 0
+        for label in time_col:
+            (lo, hi) = Indexers.time_range_as_idx(TimeConverters.label2trange(label))
+            if hi <= lo:
+                raise ValueError("JobCost.estimate(): empty period {}".format(label))
+            days += hi - lo
+        size = JobCost.slice_size((0, days), Indexers.lat_range_as_idx(lat_range), Indexers.lon_range_as_idx(lon_range))
+        cells = size['lat_size'] * size['lon_size']
+        if days <= 0 or size['lat_size'] <= 0 or size['lon_size'] <= 0:
+            raise ValueError("JobCost.estimate(): no day or cell to fetch")
+        fetch_bytes = size['total_size'] * variables * itemsize
+        rows = len(time_col) * (1 if region_mean else cells)
+        cost = fetch_bytes + rows * Settings.get_int('cost_row_bytes', 64)
+        return {
+            'days': days,
+            'cells': cells,
+            'bytes': fetch_bytes,
+            'rows': rows,
+            'cost': cost,
+            'lane': JobCost.lane(cost)
+        }
+
+    @staticmethod
+    def lane(cost: int) -> str:
+        """Returns the lane of a job of the given cost."""
+        return LANES[0] if cost <= Settings.get_int('interactive_max_cost', 256 * 1024 ** 2) else LANES[1]
@@ -0,0 +1,103 @@
+import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+
+# (variable name, values, attributes)
+NetCDFVariable = Tuple[str, np.ndarray, Dict]
+
+
+class NetCDFArrayWriter:
+    """
+    Serializes gridded results into a NetCDF file, following the CF conventions.
+    Every result is a (time, lat, lon) variable, or a (time) variable for region means,
+    next to the lat, lon and time coordinate variables. Time holds the first day of each period,
+    with the days the results are computed over in time_bnds, and the period labels of the csv output
+    in a period variable.
+    Requires the netCDF4 package, e.g. pip install -e ".[netcdf]".
+    """
+
+    def __init__(self, file_name: str, time_name: str, time_col: List[str], lat_col: List[float],
+                 lon_col: List[float], variables: List[NetCDFVariable], gridded: bool = True,
+                 complevel: int = 4) -> None:
+        """
+        :param file_name: str, filename to write to
+        :param time_name: name of the periods, e.g. year-month
+        :param time_col: one label per period, e.g. 1990-01, 1990-q1 or 1990
+        :param lat_col: latitudes of the grid
+        :param lon_col: longitudes of the grid
+        :param variables: (name, values, attributes) of every result, values shaped (time, lat, lon),
+                          or (time) when not gridded
+        :param gridded: False for region means, which have no lat and lon dimensions
+        :param complevel: zlib compression level of the variables, 0 to store them uncompressed
+        """
+        self.file_name = file_name
+        self.time_name = time_name
+        self.time_col = time_col
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.variables = variables
+        self.gridded = gridded
+        self.complevel = complevel
+
+    def write(self):
+        try:
+            import netCDF4
+        except ImportError:
+            raise ImportError("The netcdf output requires the netCDF4 package")
+        with netCDF4.Dataset(self.file_name, 'w', format='NETCDF4') as ds:
+            ds.Conventions = 'CF-1.6'
+            ds.geospatial_lat_min = min(self.lat_col)
+            ds.geospatial_lat_max = max(self.lat_col)
+            ds.geospatial_lon_min = min(self.lon_col)
+            ds.geospatial_lon_max = max(self.lon_col)
+            dimensions = self._write_coordinates(ds)
+            for (name, values, attributes) in self.variables:
+                fill_value = np.nan if values.dtype.kind == 'f' else None
+                var = ds.createVariable(name, values.dtype, dimensions, fill_value=fill_value,
+                                        zlib=self.complevel > 0, complevel=max(self.complevel, 1))
+                var.setncatts(attributes)
+                var[:] = values
+
+    def _write_coordinates(self, ds) -> Tuple[str, ...]:
+        """Writes the coordinate variables, returns the dimensions of the result variables."""
+        (lo, hi) = self.time_bounds(self.time_col)
+        ds.createDimension('time', len(self.time_col))
+        ds.createDimension('nv', 2)
+        time = ds.createVariable('time', np.int32, ('time',))
+        time.setncatts({'standard_name': 'time', 'units': 'days since 1970-01-01',
+                        'calendar': 'standard', 'axis': 'T', 'bounds': 'time_bnds'})
+        time[:] = lo
+        ds.createVariable('time_bnds', np.int32, ('time', 'nv'))[:] = np.stack((lo, hi), axis=1)
+        period = ds.createVariable('period', str, ('time',))
+        period.long_name = self.time_name
+        period[:] = np.array(self.time_col, dtype=object)
+        if not self.gridded:
+            return ('time',)
+        ds.createDimension('lat', len(self.lat_col))
+        ds.createDimension('lon', len(self.lon_col))
+        lat = ds.createVariable('lat', np.float64, ('lat',))
+        lat.setncatts({'standard_name': 'latitude', 'units': 'degrees_north', 'axis': 'Y'})
+        lat[:] = self.lat_col
+        lon = ds.createVariable('lon', np.float64, ('lon',))
+        lon.setncatts({'standard_name': 'longitude', 'units': 'degrees_east', 'axis': 'X'})
+        lon[:] = self.lon_col
+        return ('time', 'lat', 'lon')
+
+    @staticmethod
+    def time_bounds(time_col: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converts period labels into the days since 1970-01-01 their results are computed over.
+        Results leave out the last day of every period (see Indexers.time_range_as_idx): it is the upper bound,
+        excluded as CF bounds are.
+        Example: f(["1970-01", "1970-02"]) -> ([0, 31], [30, 58])
+        :param time_col: one label per period
+        :return: (first day of each period, last day of each period)
+        """
+        epoch = datetime.date(1970, 1, 1)
+        bounds = [TimeConverters.label2trange(label) for label in time_col]
+        lo = [(datetime.date.fromisoformat(date_lo) - epoch).days for (date_lo, _) in bounds]
+        hi = [(datetime.date.fromisoformat(date_hi) - epoch).days for (_, date_hi) in bounds]
+        return (np.array(lo, dtype=np.int32), np.array(hi, dtype=np.int32))
@@ -0,0 +1,196 @@
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+IndexRange = Tuple[int, int]
+
+# (lat, lon) extent of the ANUClimate grids, as the largest stop index of a slice
+GRID_STOP = (eco_constants.LAT_IDX_MAX, eco_constants.LON_IDX_MAX)
+
+
+class PeriodCache(object):
+    """
+    Persistent on-disk cache of per-period results, e.g. the mean of every cell over a month.
+    The (lat, lon) index space is cut into fixed-size tiles, and the result of every period is stored
+    per tile, as a .npy file under root/<dataset hash>/<period>/, read back memory-mapped.
+    Periods are identified by their time indices, so months, quarters and years are all cached alike,
+    and overlapping requests only compute the periods they do not share.
+    The total size of the results is kept under max_bytes, evicting the least recently used.
+    Requests filling less than min_fill of the tiles they touch, e.g. point queries, bypass the cache.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self,
+                 root: str,
+                 max_bytes: int,
+                 tile_shape: Tuple[int, int] = (32, 32),
+                 min_fill: float = 0.0) -> None:
+        """
+        :param root: directory holding the results
+        :param max_bytes: byte budget for all the results
+        :param tile_shape: (lat, lon) size of one tile
+        :param min_fill: smallest fraction of the tiles a request must fill to go through the cache
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tile_shape = tile_shape
+        self.min_fill = min_fill
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bypasses': 0}
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # result path -> size in bytes, least recently used first
+        self._bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide period cache configured in pywps.cfg,
+        or None if period_cache_dir is not set.
+        """
+        root = Settings.get('period_cache_dir', '')
+        if not root:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance.root != root:
+                shape = tuple(int(n) for n in Settings.get('period_cache_tile', '32,32').split(','))
+                cls._instance = PeriodCache(root,
+                                            Settings.get_int('period_cache_bytes', 1024 ** 3),
+                                            shape,
+                                            Settings.get_float('period_cache_min_fill', 0.05))
+            return cls._instance
+
+    def _scan(self) -> None:
+        """Rebuilds the LRU index from the results already on disk, oldest first."""
+        results = []
+        for (dir_path, _, file_names) in os.walk(self.root):
+            for file_name in file_names:
+                if file_name.endswith('.npy'):
+                    path = os.path.join(dir_path, file_name)
+                    stat = os.stat(path)
+                    results.append((stat.st_mtime, path, stat.st_size))
+        for (_, path, size) in sorted(results):
+            self._lru[path] = size
+            self._bytes += size
+
+    def _tile_range(self, tile: int, axis: int) -> IndexRange:
+        """Returns the (start, stop) indices covered by a tile along an axis."""
+        size = self.tile_shape[axis]
+        return (tile * size, min((tile + 1) * size, GRID_STOP[axis]))
+
+    def _result_path(self, name: str, period: IndexRange, tile: Tuple[int, int]) -> str:
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, digest, '{}_{}'.format(*period), '{}_{}.npy'.format(*tile))
+
+    def periods(self,
+                name: str,
+                periods: List[IndexRange],
+                lat_idx: IndexRange,
+                lon_idx: IndexRange,
+                compute: Callable[[List[int], IndexRange, IndexRange], np.ndarray]) -> np.ndarray:
+        """
+        Returns the results of a list of periods for the given (start, stop) indices.
+        Periods found for every tile of the request are read from disk; the others are computed
+        over the tiles covering the request, and stored, in a single call to compute.
+        Requests filling less than min_fill of their tiles are computed as they are, without the cache.
+        :param name: unique name of the results, e.g. url#variable#statistics
+        :param periods: (start, stop) time indices of every period
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :param compute: callable receiving the positions of the missing periods in periods,
+                        and the (lat_idx, lon_idx) to compute them for, returning a (period, lat, lon) array
+        :return: NumPy.Array (of 3 dimensions: period, lat, lon)
+        """
+        request = (lat_idx, lon_idx)
+        tiles = list(itertools.product(*[range(lo // self.tile_shape[axis], (hi - 1) // self.tile_shape[axis] + 1)
+                                         for (axis, (lo, hi)) in enumerate(request)]))
+        tiles_size = sum(int(np.prod([hi - lo for (lo, hi) in
+                                      [self._tile_range(t, axis) for (axis, t) in enumerate(tile)]]))
+                         for tile in tiles)
+        if (lat_idx[1] - lat_idx[0]) * (lon_idx[1] - lon_idx[0]) < self.min_fill * tiles_size:
+            with self._lock:
+                self.stats['bypasses'] += 1
+            return compute(list(range(len(periods))), lat_idx, lon_idx)
+        found = [self._get_tiles(name, period, tiles) for period in periods]
+        missing = [i for (i, tile_data) in enumerate(found) if tile_data is None]
+        with self._lock:
+            self.stats['hits'] += len(periods) - len(missing)
+            self.stats['misses'] += len(missing)
+
+        computed = None
+        box = tuple((self._tile_range(tiles[0][axis], axis)[0], self._tile_range(tiles[-1][axis], axis)[1])
+                    for axis in range(2))
+        if missing:
+            computed = compute(missing, *box)
+            for (i, data) in zip(missing, computed):
+                found[i] = [self._store(self._result_path(name, periods[i], tile),
+                                        data[self._offsets(tile, box)])
+                            for tile in tiles]
+
+        result = None
+        for (i, tile_data) in enumerate(found):
+            for (tile, data) in zip(tiles, tile_data):
+                tile_ranges = [self._tile_range(t, axis) for (axis, t) in enumerate(tile)]
+                # part of the request covered by this tile, in tile and in result coordinates
+                src = tuple(slice(max(lo, t_lo) - t_lo, min(hi, t_hi) - t_lo)
+                            for ((lo, hi), (t_lo, t_hi)) in zip(request, tile_ranges))
+                dst = tuple(slice(max(lo, t_lo) - lo, min(hi, t_hi) - lo)
+                            for ((lo, hi), (t_lo, t_hi)) in zip(request, tile_ranges))
+                if result is None:
+                    result = np.empty((len(periods),) + tuple(hi - lo for (lo, hi) in request), dtype=data.dtype)
+                result[i][dst] = data[src]
+        return result
+
+    def _offsets(self, tile: Tuple[int, int], box) -> Tuple[slice, slice]:
+        """Returns the slices where a tile is in an array covering box."""
+        tile_ranges = [self._tile_range(t, axis) for (axis, t) in enumerate(tile)]
+        return tuple(slice(t_lo - b_lo, t_hi - b_lo) for ((t_lo, t_hi), (b_lo, _)) in zip(tile_ranges, box))
+
+    def _get_tiles(self, name: str, period: IndexRange, tiles: List[Tuple[int, int]]):
+        """Returns the results of a period for all the tiles, memory-mapped from disk, or None if any is missing."""
+        results = []
+        for tile in tiles:
+            path = self._result_path(name, period, tile)
+            try:
+                results.append(np.load(path, mmap_mode='r'))
+            except (FileNotFoundError, ValueError):
+                return None
+            with self._lock:
+                if path in self._lru:
+                    self._lru.move_to_end(path)
+            os.utime(path)  # keeps the order across restarts
+        return results
+
+    def _store(self, path: str, data: np.ndarray) -> np.ndarray:
+        """Writes a result atomically, then evicts old results beyond the byte budget."""
+        data = np.ascontiguousarray(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._lru.pop(path, 0)
+            self._lru[path] = size
+            while self._bytes > self.max_bytes and len(self._lru) > 1:
+                (old_path, old_size) = self._lru.popitem(last=False)
+                self._bytes -= old_size
+                self.stats['evictions'] += 1
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass  # evicted by another process
+        logging.getLogger(__name__).debug('Stored period result %s (%d bytes)', path, size)
+        return data
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import uuid
+from typing import Optional, Tuple
+
+import numpy as np
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+IndexRange = Tuple[int, int]
+
+
+class PrefixSumStore(object):
+    """
+    Precomputed cumulative sums over time of one variable, with matching valid-day counts:
+        sum[t] = sum of the valid values of days 0..t-1, accumulated in float64
+        count[t] = number of valid values of days 0..t-1
+    so the mean over any (lo, hi) range of time indices is
+        (sum[hi] - sum[lo]) / (count[hi] - count[lo])
+    i.e. two plane reads and a subtraction, whatever the length of the range.
+    The arrays are chunked on disk by year, and read memory-mapped:
+        <root>/<name>/region.json       (lat_idx, lon_idx) window of the grid covered
+        <root>/<name>/YYYY.sum.npy      sum[t] for the days t of the year, float64
+        <root>/<name>/YYYY.count.npy    count[t] for the days t of the year, int32
+    A full-grid store is very large, so a store may be built for a region only.
+    """
+
+    def __init__(self, root: str, name: str) -> None:
+        """
+        :param root: directory of the prefix-sum stores
+        :param name: name of the variable, e.g. Rainfall
+        """
+        self.path = os.path.join(root, name)
+
+    @staticmethod
+    def instance(name: str) -> Optional['PrefixSumStore']:
+        """Returns the store of a variable under prefix_sum_dir, or None if not configured."""
+        root = Settings.get('prefix_sum_dir', '')
+        if not root:
+            return None
+        return PrefixSumStore(root, name)
+
+    def _chunk_path(self, yr: int, kind: str) -> str:
+        return os.path.join(self.path, '{:04d}.{}.npy'.format(yr, kind))
+
+    def region(self) -> Optional[Tuple[IndexRange, IndexRange]]:
+        """Returns the (lat_idx, lon_idx) window covered by the store, None if not built."""
+        try:
+            with open(os.path.join(self.path, 'region.json')) as f:
+                (lat_idx, lon_idx) = json.load(f)
+            return (tuple(lat_idx), tuple(lon_idx))
+        except FileNotFoundError:
+            return None
+
+    def has_year(self, yr: int) -> bool:
+        # the sum chunk is written last
+        return os.path.exists(self._chunk_path(yr, 'sum'))
+
+    def _planes(self, t: int, lat_idx: IndexRange, lon_idx: IndexRange):
+        """Returns the (sum, count) planes at time index t, or None if not built."""
+        region = self.region()
+        (yr, _) = Indexers.time_idx_by_year((t, t + 1))[0]
+        if region is None or not self.has_year(yr):
+            return None
+        ((lat_lo, _), (lon_lo, _)) = region
+        day = t - Indexers.year_start_idx(yr)
+        window = (day, slice(lat_idx[0] - lat_lo, lat_idx[1] - lat_lo), slice(lon_idx[0] - lon_lo, lon_idx[1] - lon_lo))
+        return (np.load(self._chunk_path(yr, 'sum'), mmap_mode='r')[window],
+                np.load(self._chunk_path(yr, 'count'), mmap_mode='r')[window])
+
+    def covers(self, lat_idx: IndexRange, lon_idx: IndexRange) -> bool:
+        region = self.region()
+        if region is None:
+            return False
+        ((lat_lo, lat_hi), (lon_lo, lon_hi)) = region
+        return lat_lo <= lat_idx[0] and lat_idx[1] <= lat_hi and lon_lo <= lon_idx[0] and lon_idx[1] <= lon_hi
+
+    def period(self, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange):
+        """
+        Returns the sum and valid count of a period, for the given window of the grid.
+        :param time_idx: (lo, hi) time indices of the period
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :return: (sum, count) 2-D arrays, or None if the store cannot answer
+        """
+        if not self.covers(lat_idx, lon_idx):
+            return None
+        (lo, hi) = time_idx
+        planes_lo = self._planes(lo, lat_idx, lon_idx)
+        planes_hi = self._planes(hi, lat_idx, lon_idx)
+        if planes_lo is None or planes_hi is None:
+            return None
+        return (planes_hi[0] - planes_lo[0], planes_hi[1] - planes_lo[1])
+
+    def build(self, fetch, yr_hi: int, lat_idx: IndexRange, lon_idx: IndexRange) -> int:
+        """
+        Incremental build of the cumulative sums for a window of the grid, from 1970 to yr_hi.
+        Each year starts from the totals of the previous one, so the build resumes after
+        the last year stored; a store built for another window is rebuilt from scratch.
+        :param fetch: callable fetching a (time_idx, lat_idx, lon_idx) hyperslab of daily data
+        :param yr_hi: last year to build
+        :param lat_idx: (start, stop) latitude indices of the window
+        :param lon_idx: (start, stop) longitude indices of the window
+        :return: number of years built
+        """
+        shape = (lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0])
+        total = np.zeros(shape, dtype=np.float64)
+        count = np.zeros(shape, dtype=np.int32)
+        yr = eco_constants.YEAR_MIN
+
+        if self.region() == (tuple(lat_idx), tuple(lon_idx)):
+            while yr <= yr_hi and self.has_year(yr):
+                yr += 1
+            if yr > eco_constants.YEAR_MIN:
+                # carry on from the last stored planes, plus the last day they do not include
+                last = Indexers.year_start_idx(yr) - 1
+                (last_sum, last_count) = self._planes(last, lat_idx, lon_idx)
+                day = fetch((last, last + 1), lat_idx, lon_idx)[0]
+                valid = np.isfinite(day)
+                total = last_sum + np.where(valid, day, 0.0)
+                count = last_count + valid
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            for file_name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, file_name))
+            with open(os.path.join(self.path, 'region.json'), 'w') as f:
+                json.dump([list(lat_idx), list(lon_idx)], f)
+
+        built = 0
+        for yr in range(yr, yr_hi + 1):
+            lo = Indexers.year_start_idx(yr)
+            hi = min(Indexers.year_start_idx(yr + 1), eco_constants.TIME_IDX_MAX + 1)
+            days = fetch((lo, hi), lat_idx, lon_idx)
+            valid = np.isfinite(days)
+            # running totals along time, shifted by one day: sums[d] holds the days before d
+            running = np.cumsum(np.where(valid, days, 0.0), axis=0, dtype=np.float64)
+            running_count = np.cumsum(valid, axis=0, dtype=np.int32)
+            sums = np.empty(days.shape, dtype=np.float64)
+            counts = np.empty(days.shape, dtype=np.int32)
+            (sums[0], counts[0]) = (total, count)
+            sums[1:] = total + running[:-1]
+            counts[1:] = count + running_count[:-1]
+            total = total + running[-1]
+            count = count + running_count[-1]
+            self._save(self._chunk_path(yr, 'count'), counts)
+            self._save(self._chunk_path(yr, 'sum'), sums)
+            logging.getLogger(__name__).info('Built prefix sums %s %04d', self.path, yr)
+            built += 1
+        return built
+
+    @staticmethod
+    def _save(path: str, data: np.ndarray) -> None:
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+
+    def drift(self, fetch, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange) -> float:
+        """
+        Compares the mean of a range computed from the prefix sums with the direct computation.
+        :return: largest absolute difference over the cells with valid days,
+                 NaN if the store cannot answer or no cell has any valid day
+        """
+        period = self.period(time_idx, lat_idx, lon_idx)
+        if period is None:
+            return float('nan')
+        days = fetch(time_idx, lat_idx, lon_idx)
+        valid = np.isfinite(days)
+        (total, count) = period
+        # cells without any valid day have no mean to compare
+        with np.errstate(invalid='ignore', divide='ignore'):
+            direct = np.where(valid, days, 0.0).sum(axis=0, dtype=np.float64) / valid.sum(axis=0)
+            difference = np.abs(total / count - direct)
+        difference = difference[np.isfinite(difference)]
+        return float(difference.max()) if difference.size else float('nan')
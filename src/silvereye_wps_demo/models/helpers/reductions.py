@@ -0,0 +1,81 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+
+class Reductions(object):
+    """
+    Count-aware reductions over the time axis of daily data.
+    Missing cells are NaN (see mask_missing) and are skipped by counting the valid values,
+    rather than by building masked arrays. Data is kept in the storage type (float32 by default)
+    while sums are accumulated in the accumulator type (float64 by default), see pywps.cfg.
+    """
+
+    @staticmethod
+    def storage_dtype(native: np.dtype) -> np.dtype:
+        """
+        Returns the type daily data is kept in, given the native type of the dataset.
+        storage_dtype = native keeps floating point data as is, and stores integer data as float64.
+        """
+        name = Settings.get('storage_dtype', 'float32')
+        if name == 'native':
+            return native if np.issubdtype(native, np.floating) else np.dtype(np.float64)
+        return np.dtype(name)
+
+    @staticmethod
+    def accumulator_dtype() -> np.dtype:
+        """Returns the type sums are accumulated in."""
+        return np.dtype(Settings.get('accumulator_dtype', 'float64'))
+
+    @staticmethod
+    def mask_missing(block: np.ndarray, missing_values: Sequence[float], dtype: np.dtype) -> np.ndarray:
+        """
+        Converts fetched data to the storage type, with its fill and missing values replaced by NaN.
+        :param block: data as read from the backend
+        :param missing_values: values flagging missing cells, e.g. _FillValue
+        :param dtype: storage type, floating point
+        :return: NumPy.Array of type dtype, block itself when it needs no change
+        """
+        result = block.astype(dtype, copy=False)
+        if len(missing_values) > 0:
+            missing = np.isin(block, missing_values)
+            if missing.any():
+                if result is block:
+                    result = block.copy()
+                result[missing] = np.nan
+        return result
+
+    @staticmethod
+    def valid_sums(block: np.ndarray, axis=0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sums the valid values of a block along an axis.
+        :return: (sums in the accumulator type, number of valid values)
+        """
+        valid = np.isfinite(block)
+        sums = np.where(valid, block, 0).sum(axis=axis, dtype=Reductions.accumulator_dtype())
+        return (sums, valid.sum(axis=axis))
+
+    @staticmethod
+    def segment_sums(block: np.ndarray, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sums the valid values of a block between consecutive time indices, as np.add.reduceat does.
+        :param block: NumPy.Array (of 3 dimensions: time, lat, lon)
+        :param starts: start index of each segment; a segment ends where the next one starts
+        :return: (sums in the accumulator type, number of valid values), one plane per segment
+        """
+        valid = np.isfinite(block)
+        sums = np.add.reduceat(np.where(valid, block, 0), starts, axis=0, dtype=Reductions.accumulator_dtype())
+        return (sums, np.add.reduceat(valid, starts, axis=0, dtype=np.int32))
+
+    @staticmethod
+    def mean(block: np.ndarray) -> np.ndarray:
+        """
+        Mean of the valid values of a block along time, NaN where a cell has none.
+        :param block: NumPy.Array (of 3 dimensions: time, lat, lon)
+        :return: NumPy.Array (of 2 dimensions: lat, lon), of the type of block
+        """
+        (sums, counts) = Reductions.valid_sums(block)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (sums / counts).astype(block.dtype, copy=False)
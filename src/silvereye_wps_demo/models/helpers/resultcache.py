@@ -0,0 +1,188 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+
+class ResultCache(object):
+    """
+    Persistent on-disk cache of process outputs, addressed by the hash of their canonical request.
+    Every output is stored as root/<key[:2]>/<key>/<file name>, so it keeps the name it is served with.
+    The total size of the outputs is kept under max_bytes, evicting the least recently used;
+    on_evict is called with the path of every evicted output, e.g. to remove a copy stored elsewhere.
+    Outputs stored by other processes are accounted for by rescanning the directory every rescan_seconds.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self,
+                 root: str,
+                 max_bytes: int,
+                 on_evict: Callable[[str], None] = None,
+                 rescan_seconds: float = 60.0) -> None:
+        """
+        :param root: directory holding the outputs
+        :param max_bytes: byte budget for all the outputs
+        :param on_evict: callable receiving the path of an evicted output
+        :param rescan_seconds: interval between rescans of the directory, to account for other processes
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.rescan_seconds = rescan_seconds
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # output path -> size in bytes, least recently used first
+        self._bytes = 0
+        self._scanned_at = 0.0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    @classmethod
+    def instance(cls, on_evict: Callable[[str], None] = None):
+        """
+        Returns the process-wide result cache configured in pywps.cfg,
+        or None if result_cache_dir is not set.
+        :param on_evict: callable receiving the path of an evicted output, set on creation only
+        """
+        root = Settings.get('result_cache_dir', '')
+        if not root:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance.root != root:
+                cls._instance = ResultCache(root,
+                                            Settings.get_int('result_cache_bytes', 1024 ** 3),
+                                            on_evict,
+                                            Settings.get_float('result_cache_rescan', 60.0))
+            return cls._instance
+
+    @staticmethod
+    def key(request: Dict) -> str:
+        """
+        Returns the key of a request: the sha256 of its canonical JSON form.
+        Example: f({'b': 1, 'a': [2]}) == f({'a': [2], 'b': 1})
+        :param request: JSON serializable description of everything the output depends on
+        :return: str, hex digest
+        """
+        canonical = json.dumps(request, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _scan(self) -> None:
+        """
+        Rebuilds the LRU index from the outputs on disk, oldest first,
+        including the outputs stored or evicted by other processes since the last scan.
+        """
+        outputs = []
+        for (dir_path, _, file_names) in os.walk(self.root):
+            for file_name in file_names:
+                if not file_name.endswith('.tmp'):
+                    path = os.path.join(dir_path, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # evicted by another process
+                    outputs.append((stat.st_mtime, path, stat.st_size))
+        with self._lock:
+            self._lru = OrderedDict((path, size) for (_, path, size) in sorted(outputs))
+            self._bytes = sum(self._lru.values())
+            self._scanned_at = time.monotonic()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the path of the output stored for a key, None on a miss.
+        :param key: key of the request, see key()
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            file_names = [n for n in os.listdir(entry_dir) if not n.endswith('.tmp')]
+        except FileNotFoundError:
+            file_names = []
+        if not file_names:
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        path = os.path.join(entry_dir, file_names[0])
+        with self._lock:
+            self.stats['hits'] += 1
+            if path in self._lru:
+                self._lru.move_to_end(path)
+        try:
+            os.utime(path)  # keeps the order across restarts
+        except FileNotFoundError:
+            return None  # evicted by another process
+        return path
+
+    @staticmethod
+    def hold(path: str, dir_name: str) -> Optional[str]:
+        """
+        Holds a stored output for as long as it is used, whether evicted meanwhile or not:
+        returns a hard link to it in dir_name (a copy, across file systems), None if it was evicted already.
+        :param path: path of the stored output, as returned by get()
+        :param dir_name: directory of the link, e.g. the workdir of the request
+        """
+        held = os.path.join(dir_name, os.path.basename(path))
+        try:
+            try:
+                os.link(path, held)
+            except OSError as err:
+                if err.errno != errno.EXDEV:
+                    raise
+                shutil.copyfile(path, held)
+        except FileNotFoundError:
+            return None
+        return held
+
+    def put(self, key: str, file_name: str) -> str:
+        """
+        Stores a copy of an output file atomically, then evicts old outputs beyond the byte budget,
+        after a rescan if due.
+        :param key: key of the request, see key()
+        :param file_name: path of the output file
+        :return: path of the stored output
+        """
+        if time.monotonic() - self._scanned_at > self.rescan_seconds:
+            self._scan()
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        path = os.path.join(entry_dir, os.path.basename(file_name))
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        shutil.copyfile(file_name, tmp_path)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        evicted = []
+        with self._lock:
+            self._bytes += size - self._lru.pop(path, 0)
+            self._lru[path] = size
+            while self._bytes > self.max_bytes and len(self._lru) > 1:
+                (old_path, old_size) = self._lru.popitem(last=False)
+                self._bytes -= old_size
+                self.stats['evictions'] += 1
+                evicted.append(old_path)
+        for old_path in evicted:
+            self._evict(old_path)
+        logging.getLogger(__name__).debug('Stored result %s (%d bytes)', path, size)
+        return path
+
+    def _evict(self, path: str) -> None:
+        if self.on_evict is not None:
+            try:
+                self.on_evict(path)
+            except Exception as err:
+                logging.getLogger(__name__).warning('Could not evict the copy of %s: %s', path, err)
+        try:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass  # evicted by another process
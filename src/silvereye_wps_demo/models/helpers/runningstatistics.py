@@ -0,0 +1,68 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.reductions import Reductions
+
+# statistics available per cell and period, in output order
+STATISTICS = ['mean', 'min', 'max', 'std', 'count']
+
+
+class RunningStatistics(object):
+    """
+    Per-cell statistics of a period, accumulated block by block along time,
+    so one fetched block feeds every requested statistic at once:
+        mean and std (population) from running sums of values and squares,
+        min and max from running extremes,
+        count as the number of valid (finite) days.
+    Invalid days are skipped; a cell without any valid day gets NaN, and a count of 0.
+    """
+
+    def __init__(self, shape: Tuple[int, int], statistics: List[str]) -> None:
+        """
+        :param shape: (lat, lon) shape of the planes
+        :param statistics: names of the statistics to compute, from STATISTICS
+        """
+        self.statistics = statistics
+        accumulator = Reductions.accumulator_dtype()
+        self.total = np.zeros(shape, dtype=accumulator)
+        self.squares = np.zeros(shape, dtype=accumulator) if 'std' in statistics else None
+        self.low = np.full(shape, np.inf) if 'min' in statistics else None
+        self.high = np.full(shape, -np.inf) if 'max' in statistics else None
+        self.valid = np.zeros(shape, dtype=np.int64)
+
+    def add(self, block: np.ndarray) -> None:
+        """
+        Accumulates daily planes.
+        :param block: NumPy.Array (of 3 dimensions: time, lat, lon)
+        """
+        if block.shape[0] == 0:
+            return
+        valid = np.isfinite(block)
+        values = np.where(valid, block, 0)
+        self.total += values.sum(axis=0, dtype=self.total.dtype)
+        if self.squares is not None:
+            self.squares += np.einsum('ijk,ijk->jk', values, values, dtype=self.squares.dtype)
+        if self.low is not None:
+            # fmin and fmax skip NaN
+            np.fmin(self.low, np.fmin.reduce(block, axis=0), out=self.low)
+        if self.high is not None:
+            np.fmax(self.high, np.fmax.reduce(block, axis=0), out=self.high)
+        self.valid += valid.sum(axis=0)
+
+    def result(self, name: str) -> np.ndarray:
+        """Returns one statistic of the days accumulated so far, as a 2-D float64 or int64 array."""
+        empty = self.valid == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if name == 'mean':
+                return self.total / self.valid
+            if name == 'std':
+                mean = self.total / self.valid
+                return np.sqrt(np.maximum(self.squares / self.valid - mean * mean, 0.0))
+        if name == 'min':
+            return np.where(empty, np.nan, self.low)
+        if name == 'max':
+            return np.where(empty, np.nan, self.high)
+        if name == 'count':
+            return self.valid
+        raise ValueError("RunningStatistics.result(): unknown statistic {}".format(name))
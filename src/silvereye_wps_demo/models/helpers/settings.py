@@ -0,0 +1,41 @@
+from pywps import configuration as wpsconfig
+
+
+class Settings(object):
+    """
+    Typed access to the [silvereye] section of pywps.cfg.
+    Missing or empty options fall back to the given default.
+    """
+    SECTION = 'silvereye'
+
+    @staticmethod
+    def get(option: str, default: str = '', section: str = SECTION) -> str:
+        """
+        Returns the raw value of an option.
+        :param option: option name
+        :param default: value to return if the option is not set
+        :param section: configuration section, defaults to [silvereye]
+        :return: str
+        """
+        value = wpsconfig.get_config_value(section, option)
+        if value == '' or value is None:
+            return default
+        return value
+
+    @staticmethod
+    def get_int(option: str, default: int, section: str = SECTION) -> int:
+        """Returns the value of an option as int."""
+        return int(Settings.get(option, default, section))
+
+    @staticmethod
+    def get_float(option: str, default: float, section: str = SECTION) -> float:
+        """Returns the value of an option as float."""
+        return float(Settings.get(option, default, section))
+
+    @staticmethod
+    def get_bool(option: str, default: bool, section: str = SECTION) -> bool:
+        """Returns the value of an option as bool."""
+        value = Settings.get(option, default, section)
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'yes', 'on', 'true')
+        return bool(value)
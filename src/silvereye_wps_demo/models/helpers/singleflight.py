@@ -0,0 +1,199 @@
+import fcntl
+import glob
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+IndexRange = Tuple[int, int]
+Fetcher = Callable[[IndexRange, IndexRange, IndexRange], np.ndarray]
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical or contained fetches running at the same time in this process.
+    The first caller fetches; later callers asking for the same hyperslab,
+    or for a part of it, wait for that fetch and get their view of its result.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight = {}  # (name, time_idx, lat_idx, lon_idx) -> Future
+
+    def fetch(self,
+              name: str,
+              time_idx: IndexRange,
+              lat_idx: IndexRange,
+              lon_idx: IndexRange,
+              fetch: Fetcher) -> np.ndarray:
+        """
+        Returns the data for the given (start, stop) indices,
+        sharing an in-flight fetch of the same dataset that contains them if there is one.
+        :param name: unique name of the dataset variable
+        :param fetch: callable doing the actual fetch of a (time_idx, lat_idx, lon_idx) hyperslab
+        :return: NumPy.Array (of 3 dimensions: time, lat, lon)
+        """
+        request = (time_idx, lat_idx, lon_idx)
+        with self._lock:
+            for (key, future) in self._in_flight.items():
+                if key[0] == name and self._contains(key[1:], request):
+                    break
+            else:
+                key = (name,) + request
+                future = None
+                leader = Future()
+                self._in_flight[key] = leader
+
+        if future is not None:
+            # result() re-raises the leader's failure
+            return future.result()[self._offsets(key[1:], request)]
+
+        try:
+            data = fetch(time_idx, lat_idx, lon_idx)
+            leader.set_result(data)
+            return data
+        except BaseException as err:
+            leader.set_exception(err)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    @staticmethod
+    def _contains(outer, inner) -> bool:
+        return all(o_lo <= i_lo and i_hi <= o_hi for ((o_lo, o_hi), (i_lo, i_hi)) in zip(outer, inner))
+
+    @staticmethod
+    def _offsets(outer, inner) -> Tuple[slice, slice, slice]:
+        return tuple(slice(i_lo - o_lo, i_hi - o_lo) for ((o_lo, _), (i_lo, i_hi)) in zip(outer, inner))
+
+
+class FileSingleFlight(object):
+    """
+    Cross-process variant of SingleFlight, for the multiprocessing processing mode.
+    Identical fetches are serialized with a lock file per hyperslab: the first process
+    fetches, the others leave a marker file saying they wait, then wait on the lock.
+    The result is left in a shared .npy file only when there are waiters, for them to read it.
+    The lock file is removed by its holder once done; a process that locked a removed file
+    notices it and locks the new one. Result and marker files are pruned after ttl seconds.
+    """
+    _instances = {}  # directory -> FileSingleFlight
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory: str, ttl: float = 60.0) -> None:
+        """
+        :param directory: directory shared by the processes, for lock and result files
+        :param ttl: seconds a result file is kept for late followers
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self._pruned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the file single-flight of single_flight_dir in pywps.cfg, created once per directory,
+        or None if single_flight_dir is not set.
+        """
+        directory = Settings.get('single_flight_dir', '')
+        if not directory:
+            return None
+        with cls._instances_lock:
+            if directory not in cls._instances:
+                cls._instances[directory] = FileSingleFlight(directory, Settings.get_float('single_flight_ttl', 60.0))
+            return cls._instances[directory]
+
+    def fetch(self,
+              name: str,
+              time_idx: IndexRange,
+              lat_idx: IndexRange,
+              lon_idx: IndexRange,
+              fetch: Fetcher) -> np.ndarray:
+        """Same as SingleFlight.fetch, for identical requests only."""
+        digest = hashlib.sha1(repr((name, time_idx, lat_idx, lon_idx)).encode('utf-8')).hexdigest()
+        path = os.path.join(self.directory, digest)
+        (lock_path, result_path) = (path + '.lock', path + '.npy')
+        marker_path = None
+        lock_file = self._lock(lock_path, blocking=False)
+        if lock_file is None:
+            # another process is fetching: ask for its result, and wait for it
+            marker_path = '{}.{}.wait'.format(path, uuid.uuid4().hex)
+            open(marker_path, 'w').close()
+            lock_file = self._lock(lock_path)
+        try:
+            if marker_path is not None:
+                os.remove(marker_path)
+                if self._is_fresh(result_path):
+                    try:
+                        return np.load(result_path)
+                    except (FileNotFoundError, ValueError):
+                        pass  # pruned meanwhile: fetched below
+            data = fetch(time_idx, lat_idx, lon_idx)
+            if glob.glob(glob.escape(path) + '.*.wait'):
+                tmp_path = '{}.{}.tmp'.format(result_path, uuid.uuid4().hex)
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, data)
+                os.replace(tmp_path, result_path)
+            return data
+        finally:
+            # removed while locked, whether the fetch succeeded or not; see _lock
+            os.remove(lock_path)
+            lock_file.close()
+            self._prune()
+
+    @staticmethod
+    def _lock(path: str, blocking: bool = True):
+        """
+        Opens and locks a lock file, waiting for its holder if blocking.
+        Holders remove the file once done: a lock taken on a file no longer at path is dropped,
+        and the file at path locked instead, so that all processes lock the same file.
+        :return: the locked file, or None if not blocking and another process holds it
+        """
+        while True:
+            lock_file = open(path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            try:
+                (locked, current) = (os.fstat(lock_file.fileno()), os.stat(path))
+                if (locked.st_dev, locked.st_ino) == (current.st_dev, current.st_ino):
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def _is_fresh(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) < self.ttl
+        except FileNotFoundError:
+            return False
+
+    def _prune(self) -> None:
+        """Removes the result and marker files older than ttl, at most once every ttl seconds. Lock files are kept."""
+        now = time.time()
+        if now - self._pruned_at < self.ttl:
+            return
+        self._pruned_at = now
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(('.npy', '.wait', '.tmp')):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                if now - os.path.getmtime(path) >= self.ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass  # pruned by another process
+
+
+# coalesces fetches across the threads of this process
+single_flight = SingleFlight()
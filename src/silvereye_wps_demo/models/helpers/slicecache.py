@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+IndexRange = Tuple[int, int]
+
+
+class SliceCache(object):
+    """
+    Bounded in-process LRU cache of recently fetched slices.
+    Slices are keyed by dataset name, including the type data is kept in, and grid indices,
+    so requests whose coordinates snap to the same cells share an entry. The budget is in bytes, not in entries.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        :param max_bytes: byte budget for all cached slices
+        """
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (name, time_idx, lat_idx, lon_idx) -> array, least recent first
+        self._bytes = 0
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide slice cache configured in pywps.cfg,
+        or None if slice_cache_bytes is 0.
+        """
+        max_bytes = Settings.get_int('slice_cache_bytes', 512 * 1024 ** 2)
+        if max_bytes <= 0:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = SliceCache(max_bytes)
+            cls._instance.max_bytes = max_bytes
+            return cls._instance
+
+    def get(self,
+            name: str,
+            time_idx: IndexRange,
+            lat_idx: IndexRange,
+            lon_idx: IndexRange) -> Optional[np.ndarray]:
+        """
+        Returns the cached slice for the given (start, stop) indices,
+        or a view into a cached slice that contains them. None on a miss.
+        """
+        request = (time_idx, lat_idx, lon_idx)
+        with self._lock:
+            key = (name,) + request
+            data = self._entries.get(key)
+            if data is None:
+                for (entry_key, entry) in reversed(self._entries.items()):
+                    if entry_key[0] == name and self._contains(entry_key[1:], request):
+                        (key, data) = (entry_key, entry[self._offsets(entry_key[1:], request)])
+                        break
+            if data is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return data
+
+    def put(self,
+            name: str,
+            time_idx: IndexRange,
+            lat_idx: IndexRange,
+            lon_idx: IndexRange,
+            data: np.ndarray) -> None:
+        """
+        Stores a read-only copy of a slice, evicting the least recently used ones beyond the byte budget.
+        The copy holds just the slice, not the array it may be a view of, and callers keep their own data writable.
+        """
+        if data.nbytes > self.max_bytes:
+            return
+        data = np.array(data)
+        data.flags.writeable = False  # shared between requests
+        key = (name, time_idx, lat_idx, lon_idx)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = data
+            self._bytes += data.nbytes
+            while self._bytes > self.max_bytes:
+                (_, old) = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+                self.stats['evictions'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @staticmethod
+    def _contains(outer, inner) -> bool:
+        return all(o_lo <= i_lo and i_hi <= o_hi for ((o_lo, o_hi), (i_lo, i_hi)) in zip(outer, inner))
+
+    @staticmethod
+    def _offsets(outer, inner) -> Tuple[slice, slice, slice]:
+        return tuple(slice(i_lo - o_lo, i_hi - o_lo) for ((o_lo, _), (i_lo, i_hi)) in zip(outer, inner))
@@ -0,0 +1,113 @@
+import logging
+import os
+import uuid
+from typing import Optional, Tuple
+
+import numpy as np
+
+from silvereye_wps_demo.models.helpers.aggregatestore import MonthlyAggregateStore
+
+IndexRange = Tuple[int, int]
+
+
+class SummedAreaTables(object):
+    """
+    Summed-area tables of the monthly aggregate planes, for region means.
+    For a plane P, the table S has one more row and column, with S[i, j] = P[:i, :j].sum(),
+    so the sum of P over any rectangle is 4 lookups:
+        S[i1, j1] - S[i0, j1] - S[i1, j0] + S[i0, j0]
+    Tables are stored next to the monthly planes they are built from, and read memory-mapped:
+        YYYY-MM.sum.sat.npy        table of the sum plane, float64
+        YYYY-MM.count.sat.npy      table of the count plane, int32
+        YYYY-MM.tailsum.sat.npy    table of the valid values of the tail plane, float64
+        YYYY-MM.tailcount.sat.npy  table of the valid cells of the tail plane, int32
+    The region mean of a period is the mean of all the valid daily values in the rectangle,
+    which is the mean of the cell means when cells have no missing days.
+    """
+
+    def __init__(self, store: MonthlyAggregateStore) -> None:
+        """
+        :param store: monthly aggregate store the tables are built from
+        """
+        self.store = store
+
+    @staticmethod
+    def instance(name: str) -> Optional['SummedAreaTables']:
+        """Returns the tables of a variable, next to its monthly aggregates, or None if not configured."""
+        store = MonthlyAggregateStore.instance(name)
+        if store is None:
+            return None
+        return SummedAreaTables(store)
+
+    def _table_path(self, yr: int, mo: int, kind: str) -> str:
+        return os.path.join(self.store.path, '{:04d}-{:02d}.{}.sat.npy'.format(yr, mo, kind))
+
+    def has_month(self, yr: int, mo: int) -> bool:
+        # the sum table is written last
+        return os.path.exists(self._table_path(yr, mo, 'sum'))
+
+    def _rect(self, yr: int, mo: int, kind: str, lat_idx: IndexRange, lon_idx: IndexRange):
+        """Sum of a plane over the (lat_idx, lon_idx) rectangle, from its table."""
+        table = np.load(self._table_path(yr, mo, kind), mmap_mode='r')
+        ((i0, i1), (j0, j1)) = (lat_idx, lon_idx)
+        return table[i1, j1] - table[i0, j1] - table[i1, j0] + table[i0, j0]
+
+    def region_period(self, time_idx: IndexRange, lat_idx: IndexRange, lon_idx: IndexRange):
+        """
+        Returns the sum and count of the valid daily values of a period over a rectangle.
+        :param time_idx: (lo, hi) time indices of the period, on month boundaries
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :return: (sum, count) scalars, or None if the tables cannot answer
+        """
+        months = self.store.months_of(time_idx)
+        if months is None or not all(self.has_month(yr, mo) for (yr, mo) in months):
+            return None
+        total = 0.0
+        count = 0
+        for (i, (yr, mo)) in enumerate(months):
+            total += float(self._rect(yr, mo, 'sum', lat_idx, lon_idx))
+            count += int(self._rect(yr, mo, 'count', lat_idx, lon_idx))
+            if i < len(months) - 1:
+                # the day between this month's indices and the next one's
+                total += float(self._rect(yr, mo, 'tailsum', lat_idx, lon_idx))
+                count += int(self._rect(yr, mo, 'tailcount', lat_idx, lon_idx))
+        return (total, count)
+
+    @staticmethod
+    def table(plane: np.ndarray, dtype) -> np.ndarray:
+        """Returns the summed-area table of a 2-D plane."""
+        table = np.zeros((plane.shape[0] + 1, plane.shape[1] + 1), dtype=dtype)
+        np.cumsum(plane, axis=0, dtype=dtype, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+        return table
+
+    def build_month(self, yr: int, mo: int) -> None:
+        """Computes and stores the tables of one month, from its aggregate planes."""
+        planes = {kind: np.load(self.store._plane_path(yr, mo, kind), mmap_mode='r')
+                  for kind in ('sum', 'count', 'tail')}
+        valid = np.isfinite(planes['tail'])
+        tables = (('count', self.table(planes['count'], np.int32)),
+                  ('tailsum', self.table(np.where(valid, planes['tail'], 0.0), np.float64)),
+                  ('tailcount', self.table(valid, np.int32)),
+                  ('sum', self.table(planes['sum'], np.float64)))
+        for (kind, data) in tables:
+            path = self._table_path(yr, mo, kind)
+            tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_path, path)
+        logging.getLogger(__name__).info('Built summed-area tables %s %04d-%02d', self.store.path, yr, mo)
+
+    def build(self, yr_range: Tuple[int, int], force: bool = False) -> int:
+        """
+        Incremental build: computes the tables of the stored months of a year range that have none yet.
+        :return: number of months built
+        """
+        (yr_lo, yr_hi) = yr_range
+        built = 0
+        for (yr, mo) in self.store.months():
+            if yr_lo <= yr <= yr_hi and self.store.has_month(yr, mo) and (force or not self.has_month(yr, mo)):
+                self.build_month(yr, mo)
+                built += 1
+        return built
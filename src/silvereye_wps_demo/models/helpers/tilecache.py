@@ -0,0 +1,214 @@
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Tuple
+
+import numpy as np
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+IndexRange = Tuple[int, int]
+
+# full extent of the ANUClimate grids, as (time, lat, lon) sizes
+GRID_SHAPE = (eco_constants.TIME_IDX_MAX + 1,
+              eco_constants.LAT_IDX_MAX + 1,
+              eco_constants.LON_IDX_MAX + 1)
+
+
+class TileCache(object):
+    """
+    Persistent on-disk cache of fetched data.
+    The (time, lat, lon) index space is cut into fixed-size tiles,
+    each stored as a .npy file under root/<dataset hash>/ and read back memory-mapped.
+    The total size of the tiles is kept under max_bytes, evicting the least recently used.
+    Tiles stored by other processes are accounted for by rescanning the directory every rescan_seconds.
+    Requests filling less than min_fill of the tiles they touch, e.g. point queries, bypass the cache.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self,
+                 root: str,
+                 max_bytes: int,
+                 tile_shape: Tuple[int, int, int] = (366, 128, 128),
+                 min_fill: float = 0.0,
+                 rescan_seconds: float = 60.0) -> None:
+        """
+        :param root: directory holding the tiles
+        :param max_bytes: byte budget for all the tiles
+        :param tile_shape: (time, lat, lon) size of one tile
+        :param min_fill: smallest fraction of the tiles a request must fill to go through the cache
+        :param rescan_seconds: interval between rescans of the directory, to account for other processes
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tile_shape = tile_shape
+        self.min_fill = min_fill
+        self.rescan_seconds = rescan_seconds
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bypasses': 0}
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # tile path -> size in bytes, least recently used first
+        self._bytes = 0
+        self._scanned_at = 0.0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide tile cache configured in pywps.cfg,
+        or None if tile_cache_dir is not set.
+        """
+        root = Settings.get('tile_cache_dir', '')
+        if not root:
+            return None
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance.root != root:
+                shape = tuple(int(n) for n in Settings.get('tile_cache_shape', '366,128,128').split(','))
+                cls._instance = TileCache(root,
+                                          Settings.get_int('tile_cache_bytes', 10 * 1024 ** 3),
+                                          shape,
+                                          Settings.get_float('tile_cache_min_fill', 0.05),
+                                          Settings.get_float('tile_cache_rescan', 60.0))
+            return cls._instance
+
+    def _scan(self) -> None:
+        """
+        Rebuilds the LRU index from the tiles on disk, oldest first,
+        including the tiles stored or evicted by other processes since the last scan.
+        """
+        tiles = []
+        for (dir_path, _, file_names) in os.walk(self.root):
+            for file_name in file_names:
+                if file_name.endswith('.npy'):
+                    path = os.path.join(dir_path, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # evicted by another process
+                    tiles.append((stat.st_mtime, path, stat.st_size))
+        with self._lock:
+            self._lru = OrderedDict((path, size) for (_, path, size) in sorted(tiles))
+            self._bytes = sum(self._lru.values())
+            self._scanned_at = time.monotonic()
+
+    def _tile_range(self, tile: int, axis: int) -> IndexRange:
+        """Returns the (start, stop) indices covered by a tile along an axis."""
+        size = self.tile_shape[axis]
+        return (tile * size, min((tile + 1) * size, GRID_SHAPE[axis]))
+
+    def _tile_path(self, name: str, tile: Tuple[int, int, int]) -> str:
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, digest, '{}_{}_{}.npy'.format(*tile))
+
+    def read(self,
+             name: str,
+             time_idx: IndexRange,
+             lat_idx: IndexRange,
+             lon_idx: IndexRange,
+             fetch: Callable[[IndexRange, IndexRange, IndexRange], np.ndarray]) -> np.ndarray:
+        """
+        Returns the data for the given (start, stop) indices.
+        Tiles found on disk are read memory-mapped; missing tiles are fetched whole, concurrently, and stored.
+        Requests filling less than min_fill of their tiles are fetched as they are, without the cache.
+        A request falling in a single tile is returned as a read-only view of that tile.
+        :param name: unique name of the dataset variable and the type it is kept in, e.g. url#variable#float32
+        :param time_idx: (start, stop) time indices
+        :param lat_idx: (start, stop) latitude indices
+        :param lon_idx: (start, stop) longitude indices
+        :param fetch: callable fetching a (time_idx, lat_idx, lon_idx) hyperslab from upstream
+        :return: NumPy.Array (of 3 dimensions: time, lat, lon)
+        """
+        request = (time_idx, lat_idx, lon_idx)
+        tiles_per_axis = [range(lo // self.tile_shape[axis], (hi - 1) // self.tile_shape[axis] + 1)
+                          for (axis, (lo, hi)) in enumerate(request)]
+        tiles = list(itertools.product(*tiles_per_axis))
+        tiles_ranges = [[self._tile_range(t, axis) for (axis, t) in enumerate(tile)] for tile in tiles]
+
+        tiles_size = sum(int(np.prod([hi - lo for (lo, hi) in ranges])) for ranges in tiles_ranges)
+        if int(np.prod([hi - lo for (lo, hi) in request])) < self.min_fill * tiles_size:
+            with self._lock:
+                self.stats['bypasses'] += 1
+            return fetch(time_idx, lat_idx, lon_idx)
+
+        found = [self._load_tile(name, tile) for tile in tiles]
+        missing = [i for (i, data) in enumerate(found) if data is None]
+        if missing:
+            with self._lock:
+                self.stats['misses'] += len(missing)
+
+            def fetch_tile(i):
+                data = np.ascontiguousarray(fetch(*tiles_ranges[i]))
+                self._store(self._tile_path(name, tiles[i]), data)
+                return data
+
+            # fetches go through the connection slots of the upstream server, see EcoMeasure._fetch_block
+            workers = min(Settings.get_int('fetch_workers', 4), len(missing))
+            if workers <= 1:
+                fetched = [fetch_tile(i) for i in missing]
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tile') as executor:
+                    fetched = list(executor.map(fetch_tile, missing))
+            for (i, data) in zip(missing, fetched):
+                found[i] = data
+
+        result = None
+        for (data, tile_ranges) in zip(found, tiles_ranges):
+            # part of the request covered by this tile, in tile and in result coordinates
+            src = tuple(slice(max(lo, t_lo) - t_lo, min(hi, t_hi) - t_lo)
+                        for ((lo, hi), (t_lo, t_hi)) in zip(request, tile_ranges))
+            if len(tiles) == 1:
+                return data[src]
+            if result is None:
+                result = np.empty(tuple(hi - lo for (lo, hi) in request), dtype=data.dtype)
+            dst = tuple(slice(max(lo, t_lo) - lo, min(hi, t_hi) - lo)
+                        for ((lo, hi), (t_lo, t_hi)) in zip(request, tile_ranges))
+            result[dst] = data[src]
+        return result
+
+    def _load_tile(self, name: str, tile: Tuple[int, int, int]):
+        """Returns a tile memory-mapped from disk, or None if it is not stored."""
+        path = self._tile_path(name, tile)
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        with self._lock:
+            self.stats['hits'] += 1
+            if path in self._lru:
+                self._lru.move_to_end(path)
+        try:
+            os.utime(path)  # keeps the order across restarts and processes
+        except FileNotFoundError:
+            pass  # evicted by another process, the mapping stays valid
+        return data
+
+    def _store(self, path: str, data: np.ndarray) -> None:
+        """Writes a tile atomically, then evicts old tiles beyond the byte budget, after a rescan if due."""
+        if time.monotonic() - self._scanned_at > self.rescan_seconds:
+            self._scan()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._lru.pop(path, 0)
+            self._lru[path] = size
+            while self._bytes > self.max_bytes and len(self._lru) > 1:
+                (old_path, old_size) = self._lru.popitem(last=False)
+                self._bytes -= old_size
+                self.stats['evictions'] += 1
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass  # evicted by another process
+        logging.getLogger(__name__).debug('Stored tile %s (%d bytes)', path, size)
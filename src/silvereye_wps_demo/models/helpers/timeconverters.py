@@ -12,18 +12,18 @@ class TimeConverters(object):
         :param ts: date in timestamp format
         :return: date in iso format '1970-12-31'
         """
-        return datetime.date.fromtimestamp(ts).isoformat()
+        return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).date().isoformat()
 
     @staticmethod
     def iso2ts(iso: str = '1970-01-01') -> float:
         """
-        Convert date from isoformat to timestamp.
+        Convert date from isoformat to timestamp, as on the time axis of the datasets: whole days since 1970-01-01,
+        whatever the timezone of the server.
         Example: f('1970-01-01') -> 0.0
         :param iso: date in iso format
         :return: date in timestamp format
         """
-        offset = 10 * 60 * 60   # correction for Brisbane AEST
-        return datetime.datetime.fromisoformat(iso).timestamp() + offset
+        return datetime.datetime.fromisoformat(iso).replace(tzinfo=datetime.timezone.utc).timestamp()
 
     @staticmethod
     def ym2trange(yr: int, mo: int) -> Tuple:
@@ -92,3 +92,19 @@ class TimeConverters(object):
         return ("{:04d}-{}".format(yr, qtr_lo),
                 "{:04d}-{}".format(yr, qtr_hi))
 
+    @staticmethod
+    def label2trange(label: str) -> Tuple:
+        """
+        Converts a period label, as output in reports, to tuple with lo and hi date values in iso format.
+        Example: f("2000") -> ("2000-01-01", "2000-12-31"), f("2000-q2") -> ("2000-04-01", "2000-06-30"),
+                 f("2000-06") -> ("2000-06-01", "2000-06-30")
+        :param label: str in "YYYY", "YYYY-MM" or "YYYY-qN" format
+        :return: Tuple (date_lo_iso, date_hi_iso)
+        """
+        parts = label.split("-")
+        if len(parts) == 1:
+            return TimeConverters.y2trange(int(parts[0]))
+        if parts[1].startswith("q"):
+            return TimeConverters.yq2trange(int(parts[0]), int(parts[1][1:]))
+        return TimeConverters.ym2trange(int(parts[0]), int(parts[1]))
+
@@ -0,0 +1,36 @@
+import threading
+from typing import Dict
+from urllib.parse import urlparse
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+
+class UpstreamLimiter(object):
+    """
+    Limits the number of concurrent requests sent to each upstream server,
+    across all threads of this process.
+    Usage:
+        with UpstreamLimiter.slot(url):
+            ...  # talk to the server
+    """
+    _lock = threading.Lock()
+    _semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    @staticmethod
+    def upstream(url: str) -> str:
+        """Returns the server part of a url; local paths all share one upstream."""
+        return urlparse(url).netloc or 'local'
+
+    @classmethod
+    def slot(cls, url: str) -> threading.BoundedSemaphore:
+        """
+        Returns the semaphore guarding the upstream of url,
+        sized by max_connections in pywps.cfg.
+        """
+        upstream = cls.upstream(url)
+        with cls._lock:
+            semaphore = cls._semaphores.get(upstream)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(Settings.get_int('max_connections', 8))
+                cls._semaphores[upstream] = semaphore
+            return semaphore
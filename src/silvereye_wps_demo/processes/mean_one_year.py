@@ -8,15 +8,19 @@ import os
 import numpy as np
 
 from silvereye_wps_demo.models.ecocomposer import EcoComposer
+from silvereye_wps_demo.models.helpers.compression import Compression
+from silvereye_wps_demo.pywps.resultcache import cached_result
+from silvereye_wps_demo.pywps.streaming import StreamingProcess
 
-from pywps import Process
 from pywps import ComplexInput, ComplexOutput, LiteralInput, Format, BoundingBoxInput
 from pywps.validator.mode import MODE
 
 data = ['rainfall', 'temp_max', 'temp_min', 'vapour_pressure', 'solar_radiation']
+statistics = ['mean', 'min', 'max', 'std', 'count']
+compressions = ['none'] + Compression.available()
 
 
-class MeanOneYear(Process):
+class MeanOneYear(StreamingProcess):
     def __init__(self):
         inputs = [
             LiteralInput(
@@ -49,12 +53,28 @@ class MeanOneYear(Process):
                 data_type='float', min_occurs=1, max_occurs=1,
                 mode=MODE.SIMPLE, allowed_values=[[112.905, 153.995]]
             ),
+            LiteralInput(
+                'region_mean', 'Output one mean over the whole region per period, instead of one per cell',
+                data_type='boolean', min_occurs=0, max_occurs=1,
+                mode=MODE.SIMPLE, default=False
+            ),
+            LiteralInput(
+                'statistics', 'Statistics to extract per cell, as extra columns',
+                data_type='string', min_occurs=0, max_occurs=len(statistics),
+                mode=MODE.SIMPLE, allowed_values=statistics, default='mean'
+            ),
+            LiteralInput(
+                'compression', 'Compression of the csv output, applied while it is written',
+                data_type='string', min_occurs=0, max_occurs=1,
+                mode=MODE.SIMPLE, allowed_values=compressions, default='none'
+            ),
         ]
 
         outputs = [
             ComplexOutput('output', 'Metadata',
                           as_reference=True,
-                          supported_formats=[Format('text/csv')]),
+                          supported_formats=[Format('text/csv'),
+                                             Format('application/x-netcdf', extension='.nc')]),
         ]
 
         super(MeanOneYear, self).__init__(
@@ -69,6 +89,11 @@ class MeanOneYear(Process):
             store_supported=True,
             status_supported=True)
 
+    def periods(self, request):
+        """Returns the labels of the periods of a request, to estimate its cost."""
+        return ["{:04d}".format(request.inputs['year'][0].data)]
+
+    @cached_result
     def _handler(self, request, response):
         # log = logging.getLogger(__name__)
 
@@ -77,14 +102,18 @@ class MeanOneYear(Process):
         lat_max = request.inputs['lat_max'][0].data
         lon_min = request.inputs['lon_min'][0].data
         lon_max = request.inputs['lon_max'][0].data
-        out_csv = os.path.join(self.workdir, 'out.csv')
+        netcdf = response.outputs['output'].data_format.mime_type == 'application/x-netcdf'
+        compression = request.inputs['compression'][0].data if 'compression' in request.inputs else 'none'
+        out_file = self.output_file('out.nc' if netcdf else Compression.file_name('out.csv', compression))
         variables = [v.data for v in request.inputs['variables']]
+        region_mean = 'region_mean' in request.inputs and request.inputs['region_mean'][0].data
+        stats = [s.data for s in request.inputs['statistics']] if 'statistics' in request.inputs else ['mean']
 
-        worker = EcoComposer(variables)
-        worker.process_one_year(out_csv,
-                                yr,
-                                (lat_min, lat_max),
-                                (lon_min, lon_max))
+        worker = EcoComposer(variables, region_mean, stats, 'netcdf' if netcdf else 'csv', compression)
+        result = worker.process_one_year(out_file,
+                                         yr,
+                                         (lat_min, lat_max),
+                                         (lon_min, lon_max))
 
-        response.outputs['output'].file = out_csv
+        self.set_output(response, out_file, result, compression)
         return response
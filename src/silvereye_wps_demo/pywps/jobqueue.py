@@ -0,0 +1,134 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from pywps.exceptions import ServerBusy
+
+from silvereye_wps_demo.models.helpers.jobcost import LANES
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+LOGGER = logging.getLogger(__name__)
+
+
+class JobQueue(object):
+    """
+    Queue of the jobs of a server process, with one separate lane per class of jobs (see JobCost):
+    small interactive queries, and large batch extractions. Every lane has its own slots, never lent
+    to another lane, and runs at most that many jobs at once (lane_interactive_jobs, lane_batch_jobs
+    in pywps.cfg): a few large jobs cannot hold up the small ones. Jobs waiting in a lane start in order
+    of arrival. Jobs beyond queue_limit waiting in a lane, asynchronous (submit) and synchronous (acquire)
+    alike, or waiting more than wait_seconds for a slot, raise ServerBusy.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, limits: Dict[str, int], queue_limit: int = 0, wait_seconds: Optional[float] = None) -> None:
+        """
+        :param limits: number of jobs every lane runs at once
+        :param queue_limit: number of jobs waiting in every lane at most, submitted or acquiring, 0 for no limit
+        :param wait_seconds: longest wait for a slot in acquire, None to wait as long as it takes
+        """
+        self.limits = limits
+        self.queue_limit = queue_limit
+        self.wait_seconds = wait_seconds
+        self.running = {lane: 0 for lane in LANES}
+        self.waiting = {lane: deque() for lane in LANES}
+        self.acquiring = {lane: 0 for lane in LANES}
+        self._condition = threading.Condition()
+
+    @classmethod
+    def instance(cls):
+        """Returns the job queue of this server process, with the lane limits configured in pywps.cfg."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                wait_seconds = Settings.get_float('lane_wait_seconds', 60.0)
+                cls._instance = JobQueue({lane: max(Settings.get_int('lane_{}_jobs'.format(lane), 1), 1)
+                                          for lane in LANES},
+                                         queue_limit=max(Settings.get_int('lane_queue_jobs', 30), 0),
+                                         wait_seconds=wait_seconds if wait_seconds > 0 else None)
+            return cls._instance
+
+    @staticmethod
+    def lane(process, wps_request) -> str:
+        """
+        Returns the lane of a request, after the cost the process estimates for it.
+        Requests that cannot be estimated go to the batch lane.
+        """
+        try:
+            cost = process.cost(wps_request)
+        except Exception as err:
+            LOGGER.warning('Could not estimate the cost of a request to %s: %s', process.identifier, err)
+            return LANES[-1]
+        LOGGER.info('Request %s to %s: %d bytes to fetch, %d rows, %s lane',
+                    process.uuid, process.identifier, cost['bytes'], cost['rows'], cost['lane'])
+        return cost['lane']
+
+    def submit(self, lane: str, start: Callable[[Callable[[], None]], None]) -> None:
+        """
+        Queues a job in a lane, and starts it if the lane runs fewer jobs than its limit.
+        :param lane: lane of the job
+        :param start: callable starting the job, receiving the callable to call once the job has ended
+        Raises ServerBusy when queue_limit jobs wait in the lane already.
+        """
+        with self._condition:
+            if 0 < self.queue_limit <= self._queued(lane):
+                raise ServerBusy('Maximum number of jobs waiting in the {} lane reached. '
+                                 'Please try later.'.format(lane))
+            self.waiting[lane].append(start)
+        self._dispatch()
+
+    def acquire(self, lane: str) -> None:
+        """
+        Waits for a lane to run fewer jobs than its limit, then takes one of its slots, e.g. for synchronous jobs.
+        Raises ServerBusy when queue_limit jobs wait in the lane already, or when no slot is free within wait_seconds.
+        """
+        with self._condition:
+            if self.running[lane] >= self.limits[lane]:
+                if 0 < self.queue_limit <= self._queued(lane):
+                    raise ServerBusy('Maximum number of jobs waiting in the {} lane reached. '
+                                     'Please try later.'.format(lane))
+                self.acquiring[lane] += 1
+                try:
+                    free = self._condition.wait_for(lambda: self.running[lane] < self.limits[lane], self.wait_seconds)
+                finally:
+                    self.acquiring[lane] -= 1
+                if not free:
+                    raise ServerBusy('No free slot in the {} lane. Please try later.'.format(lane))
+            self.running[lane] += 1
+
+    def _queued(self, lane: str) -> int:
+        """Number of jobs waiting in a lane: submitted, and acquiring a slot."""
+        return len(self.waiting[lane]) + self.acquiring[lane]
+
+    def release(self, lane: str) -> None:
+        """Gives back a slot of a lane, once its job has ended, and starts the next waiting jobs."""
+        with self._condition:
+            self.running[lane] -= 1
+            self._condition.notify_all()
+        self._dispatch()
+
+    @contextmanager
+    def slot(self, lane: str):
+        """Holds a slot of a lane for the duration of the block."""
+        self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def _dispatch(self) -> None:
+        """Starts waiting jobs, lane by lane, while their lanes have free slots."""
+        started = []
+        with self._condition:
+            for lane in LANES:
+                while self.waiting[lane] and self.running[lane] < self.limits[lane]:
+                    self.running[lane] += 1
+                    started.append((lane, self.waiting[lane].popleft()))
+        for (lane, start) in started:
+            try:
+                start(lambda lane=lane: self.release(lane))
+            except Exception:
+                LOGGER.exception('Could not start a job of the %s lane', lane)
+                self.release(lane)
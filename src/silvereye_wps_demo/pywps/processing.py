@@ -1,4 +1,23 @@
+import copy
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from pywps import configuration as config
+from pywps import WPSRequest
+from pywps.exceptions import ServerBusy
 from pywps.processing import Processing
+from pywps.response.execute import ExecuteResponse
+from pywps.response.status import WPS_STATUS
+
+from silvereye_wps_demo.models.helpers.settings import Settings
+from silvereye_wps_demo.pywps.jobqueue import JobQueue
+
+LOGGER = logging.getLogger(__name__)
 
 
 class ThreadProcessing(Processing):
@@ -14,3 +33,185 @@ class ThreadProcessing(Processing):
             args=(self.job.wps_request, self.job.wps_response)
         )
         process.start()
+
+
+class PoolProcessing(Processing):
+    """
+    :class:`PoolProcessing` runs jobs in a pool of long-lived worker processes instead of a fresh process
+    per job: dataset handles, caches and imported modules stay warm between jobs. The pool holds pool_workers
+    processes, each replaced by a fresh one after pool_recycle_jobs jobs (0: never). Jobs are sent to workers
+    as their process identifier and request, workers running them with their own copy of the process,
+    as pywps does with stored requests. Jobs wait in the lane of their estimated cost of the JobQueue
+    until it has a free slot.
+    Workers, replacements included, are forked from a forkserver which only imported the service, never from
+    the running server: they cannot inherit the locks, semaphores and caches of its request threads.
+    A watchdog fails the jobs of workers which died while running them (killed, out of memory), which the pool
+    itself would never report, and gives their slots back.
+    """
+    SERVICE_MODULE = 'silvereye_wps_demo.views.wps'
+    _pool = None
+    _service = None
+    # (uuid, pid) of the jobs workers start, and (result, done, response) of the jobs sent, by uuid
+    _started = None
+    _jobs = {}
+    _pids = {}
+    _suspects = set()
+    _lock = threading.Lock()
+
+    def start(self):
+        process = self.job.process
+        lane = JobQueue.lane(process, self.job.wps_request)
+        self.job.wps_response._update_status(WPS_STATUS.ACCEPTED, 'Queued in the {} lane'.format(lane), 0)
+        try:
+            JobQueue.instance().submit(lane, self._send)
+        except ServerBusy as err:
+            self.job.wps_response._update_status(WPS_STATUS.FAILED, str(err), 100)
+            raise
+
+    def _send(self, done) -> None:
+        """Sends the job to the worker pool, calling done once it has ended."""
+        process = self.job.process
+        uuid = str(process.uuid)
+        pool = PoolProcessing.pool()
+        LOGGER.debug('Sending request %s to the worker pool', uuid)
+
+        def failed(err):
+            LOGGER.error('Worker pool job failed: %s', err)
+            PoolProcessing._ended(uuid)
+
+        with PoolProcessing._lock:
+            PoolProcessing._jobs[uuid] = (None, done, self.job.wps_response)
+        result = pool.apply_async(_run_job, (process.identifier, uuid, process.workdir, self.job.wps_request.json),
+                                  callback=lambda _: PoolProcessing._ended(uuid), error_callback=failed)
+        with PoolProcessing._lock:
+            if uuid in PoolProcessing._jobs:
+                PoolProcessing._jobs[uuid] = (result, done, self.job.wps_response)
+
+    @classmethod
+    def _ended(cls, uuid: str):
+        """Calls done of a job once it has ended, once only: from the pool callbacks or the watchdog."""
+        with cls._lock:
+            job = cls._jobs.pop(uuid, None)
+            cls._pids.pop(uuid, None)
+            cls._suspects.discard(uuid)
+        if job is not None:
+            job[1]()
+        return job
+
+    @classmethod
+    def check(cls) -> None:
+        """
+        One pass of the watchdog: fails the pending jobs whose worker has died, seen dead on two passes in a row
+        so that the results a recycled worker sent just before exiting are delivered first.
+        """
+        while not cls._started.empty():
+            (uuid, pid) = cls._started.get()
+            with cls._lock:
+                if uuid in cls._jobs:
+                    cls._pids[uuid] = pid
+        with cls._lock:
+            dead = [uuid for (uuid, pid) in cls._pids.items()
+                    if not _alive(pid) and not (cls._jobs[uuid][0] and cls._jobs[uuid][0].ready())]
+            lost = [uuid for uuid in dead if uuid in cls._suspects]
+            cls._suspects = set(dead) - set(lost)
+        for uuid in lost:
+            job = cls._ended(uuid)
+            if job is not None:
+                LOGGER.error('Worker of request %s died while running it', uuid)
+                job[2]._update_status(WPS_STATUS.FAILED, 'The worker running the request died', 100)
+
+    @classmethod
+    def _watch(cls, seconds: float) -> None:
+        while True:
+            time.sleep(seconds)
+            try:
+                cls.check()
+            except Exception:
+                LOGGER.exception('Worker pool watchdog failed')
+
+    @classmethod
+    def pool(cls):
+        """
+        Returns the worker pool of this server process, started on first use: at startup,
+        unless the application was created otherwise. Its workers import the service themselves.
+        """
+        with cls._lock:
+            if cls._pool is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([cls.SERVICE_MODULE])
+                cls._started = context.SimpleQueue()
+                recycle = Settings.get_int('pool_recycle_jobs', 100)
+                cls._pool = context.Pool(processes=Settings.get_int('pool_workers', 4),
+                                         initializer=_init_worker, initargs=(cls.SERVICE_MODULE, cls._started),
+                                         maxtasksperchild=recycle if recycle > 0 else None)
+                threading.Thread(target=cls._watch, args=(Settings.get_float('pool_watchdog_seconds', 10.0),),
+                                 name='pool-watchdog', daemon=True).start()
+            return cls._pool
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _init_worker(service_module: str, started) -> None:
+    """
+    Prepares a new worker: takes the service from its module, imported by the forkserver,
+    then opens the dataset handles of every variable when pool_open_datasets is set.
+    :param service_module: module of the pywps service
+    :param started: queue of the (uuid, pid) of the jobs the worker starts, for the watchdog of the server
+    """
+    PoolProcessing._service = importlib.import_module(service_module).service
+    PoolProcessing._started = started
+    if not Settings.get_bool('pool_open_datasets', False):
+        return
+    from silvereye_wps_demo.models.ecocomposer import EcoComposer
+    composer = EcoComposer(["rainfall", "solar_radiation", "temp_max", "temp_min", "vapour_pressure"])
+    for (name, instance) in composer.instances.items():
+        try:
+            instance.ds()
+        except Exception as err:
+            LOGGER.warning('Could not open the dataset of %s: %s', name, err)
+
+
+def _run_job(identifier: str, uuid: str, workdir: str, request_json: str) -> None:
+    """
+    Runs a job in a pool worker, as pywps runs stored requests.
+    :param identifier: identifier of the process
+    :param uuid: uuid of the request
+    :param workdir: working directory created for the request
+    :param request_json: the request, as serialized by WPSRequest.json
+    """
+    PoolProcessing._started.put((uuid, os.getpid()))
+    service = PoolProcessing._service
+    wps_request = WPSRequest()
+    wps_request.restore_json(json.loads(request_json))
+    process = copy.deepcopy(service.processes[identifier])
+    process.service = service
+    process.set_workdir(workdir)
+    process._set_uuid(uuid)
+    process._setup_status_storage()
+    process.async_ = True
+    process.setup_outputs_from_wps_request(wps_request)
+    wps_response = ExecuteResponse(wps_request, process=process, uuid=uuid)
+    wps_response.store_status_file = True
+    process._run_process(wps_request, wps_response)
+
+
+def create(process, wps_request, wps_response):
+    """
+    Returns the processing of a job for the mode configured in pywps.cfg ([processing] mode),
+    when it is one of the modes of this package, registered as pywps_processing entry points;
+    None for the modes of pywps itself.
+    """
+    modes = {'threads': ThreadProcessing, 'pool': PoolProcessing}
+    mode = config.get_config_value('processing', 'mode')
+    if mode not in modes:
+        return None
+    return modes[mode](process, wps_request, wps_response)
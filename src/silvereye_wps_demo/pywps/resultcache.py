@@ -0,0 +1,138 @@
+import functools
+import logging
+import os
+import os.path
+
+from pywps import configuration as config
+
+from silvereye_wps_demo.models.ecocomposer import EcoComposer
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.resultcache import ResultCache
+from silvereye_wps_demo.models.helpers.runningstatistics import STATISTICS
+from silvereye_wps_demo.models.helpers.settings import Settings
+
+LOGGER = logging.getLogger(__name__)
+
+# inputs keyed by the indices they snap to, rather than by their values
+COORDINATES = ('lat_min', 'lat_max', 'lon_min', 'lon_max')
+
+
+def cached_result(handler):
+    """
+    Puts the result cache in front of a process handler.
+    A request already answered gets the stored output, without running the handler: a reference to it,
+    stored once in SwiftStorage, or else the file itself, held until FileStorage has copied or linked it.
+    Other requests run the handler, and their output is stored for the next ones;
+    with SwiftStorage, it is uploaded once, to the cache, and referenced there.
+    Streamed outputs are never cached. The cache is configured in pywps.cfg (result_cache_dir).
+    """
+    @functools.wraps(handler)
+    def wrapper(process, request, response):
+        cache = _cache()
+        if cache is None or process.streamed:
+            return handler(process, request, response)
+        key = request_key(process, request, response)
+        output = response.outputs['output']
+        path = cache.get(key)
+        if path is not None and _set_cached_output(output, path, request.raw, process.workdir):
+            LOGGER.info('Result cache hit for %s: %s', process.identifier, path)
+            return response
+
+        # a miss, or an output evicted since: computed again
+        response = handler(process, request, response)
+        try:
+            if not _swift():
+                cache.put(key, output.file)
+                return response
+            # kept in the container until evicted, for hits to be a reference to it
+            storage = _swift_storage()
+            object_name = _object_name(key, output.file)
+            headers = storage.headers(output.file, output.data_format.mime_type, expires=False)
+            if not storage.upload(output.file, object_name, headers):
+                return response
+            cache.put(key, output.file)
+            if not request.raw:
+                # referenced in the container, instead of uploaded a second time by SwiftStorage
+                output.url = storage.url(object_name)
+        except Exception as err:
+            # the output is fine, it will just be computed again next time
+            LOGGER.warning('Could not cache the output of %s: %s', process.identifier, err)
+        return response
+    return wrapper
+
+
+def request_key(process, request, response) -> str:
+    """
+    Returns the key of the output of a request: the hash of its canonical form.
+    Coordinates are snapped to the grid, statistics put in order and omitted inputs set to their defaults,
+    so requests with the same output share the same key. The datasets and dataset_version are part of it.
+    :param process: the pywps process
+    :param request: the pywps request
+    :param response: the pywps response, telling the output format
+    :return: str
+    """
+    inputs = {name: [i.data for i in values] for (name, values) in request.inputs.items()
+              if name not in COORDINATES}
+    for inpt in process.inputs:
+        if inpt.identifier not in inputs and getattr(inpt, 'default', None) is not None:
+            inputs[inpt.identifier] = [inpt.default]
+    if 'statistics' in inputs:
+        inputs['statistics'] = [s for s in STATISTICS if s in inputs['statistics']]
+    lat_range = (request.inputs['lat_min'][0].data, request.inputs['lat_max'][0].data)
+    lon_range = (request.inputs['lon_min'][0].data, request.inputs['lon_max'][0].data)
+    mime_type = response.outputs['output'].data_format.mime_type
+    canonical = {
+        'process': [process.identifier, process.version],
+        'inputs': inputs,
+        'lat_idx': Indexers.lat_range_as_idx(lat_range),
+        'lon_idx': Indexers.lon_range_as_idx(lon_range),
+        'format': mime_type,
+        'datasets': [EcoComposer.dataset(variable) for variable in inputs['variables']],
+        'dataset_version': Settings.get('dataset_version', ''),
+        'dtypes': [Settings.get('storage_dtype', 'float32'), Settings.get('accumulator_dtype', 'float64')],
+    }
+    if mime_type != 'application/x-netcdf' and not inputs.get('region_mean', [False])[0]:
+        # the lat and lon columns of the csv output are spaced out between the requested values
+        canonical['coordinates'] = [lat_range, lon_range]
+    return ResultCache.key(canonical)
+
+
+def _set_cached_output(output, path: str, raw: bool, workdir: str) -> bool:
+    """
+    Sets a stored output as the output of the process: a reference to it in SwiftStorage, or the file itself.
+    Files are held in the workdir (see ResultCache.hold), then copied or linked by FileStorage to the output
+    of the request like any output, so that served outputs outlive their eviction.
+    :return: False if the output was evicted already, to be computed again
+    """
+    if not raw and _swift():
+        output.url = _swift_storage().url(_object_name(os.path.basename(os.path.dirname(path)), path))
+        return True
+    held = ResultCache.hold(path, workdir)
+    if held is None:
+        return False
+    output.file = held
+    return True
+
+
+def _cache():
+    return ResultCache.instance(on_evict=_evict)
+
+
+def _evict(path: str) -> None:
+    """Deletes the copy of an evicted output kept in the Swift container."""
+    if _swift():
+        _swift_storage().delete(_object_name(os.path.basename(os.path.dirname(path)), path))
+
+
+def _object_name(key: str, file_name: str) -> str:
+    """Returns the name of the object holding a stored output in the Swift container."""
+    return '/'.join(('results', key, os.path.basename(file_name)))
+
+
+def _swift() -> bool:
+    return config.get_config_value('server', 'storage') == 'SwiftStorage'
+
+
+def _swift_storage():
+    from silvereye_wps_demo.pywps.swiftstorage import SwiftStorage
+    return SwiftStorage()
@@ -0,0 +1,159 @@
+import logging
+import os
+import os.path
+from typing import Dict, List
+
+from pywps import Process
+from pywps import configuration as config
+from pywps import dblog
+from pywps.app.exceptions import ProcessError
+from pywps.exceptions import NoApplicableCode
+from pywps.response import get_response
+from pywps.response.status import WPS_STATUS
+from werkzeug.wrappers import Response
+
+from silvereye_wps_demo.models.helpers.compression import Compression
+from silvereye_wps_demo.models.helpers.jobcost import JobCost
+from silvereye_wps_demo.models.helpers.settings import Settings
+from silvereye_wps_demo.pywps.jobqueue import JobQueue
+from silvereye_wps_demo.pywps.processing import create as create_processing
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StreamingProcess(Process):
+    """
+    Process streaming its csv output straight to the client.
+    Synchronous requests for the raw csv output (RawDataOutput=output, in text/csv) get it as
+    a streamed HTTP response, produced block by block as periods are computed, instead of
+    writing it to the workdir first, for pywps to read it back once the whole job is done.
+    Other requests are run by pywps as usual, asynchronous ones with the processing modes
+    of this package (threads, pool) when configured.
+    Handlers get the path of their output file with output_file(), None when the output is streamed,
+    and hand the result of the EcoComposer over with set_output().
+    Synchronous requests wait for a slot of their lane of the JobQueue, after the cost estimated by cost().
+    """
+
+    streamed = False
+    _chunks = None
+    _encoding = None
+    _lane = None
+    _finished = False
+
+    def execute(self, wps_request, uuid):
+        if not self._is_streamed(wps_request):
+            return super(StreamingProcess, self).execute(wps_request, uuid)
+
+        self._set_uuid(uuid)
+        self.streamed = True
+        wps_response = get_response('execute')(wps_request, process=self, uuid=self.uuid)
+        self._lane = JobQueue.lane(self, wps_request)
+        JobQueue.instance().acquire(self._lane)
+        try:
+            dblog.store_status(self.uuid, WPS_STATUS.STARTED, 'PyWPS Process started', 0)
+            self.handler(wps_request, wps_response)
+        except Exception as e:
+            self._finish(WPS_STATUS.FAILED, 'Process error: {}'.format(e))
+            LOGGER.exception('Process error')
+            raise NoApplicableCode(str(e) if isinstance(e, ProcessError) else
+                                   'Process failed, please check server error log')
+
+        headers = {'Content-Disposition': 'attachment; filename="output.csv"'}
+        if self._encoding is not None:
+            headers['Content-Encoding'] = self._encoding
+        response = Response(self._respond(), mimetype='text/csv', headers=headers)
+        # closing a generator before its first block does not run its finally: a response closed unread,
+        # e.g. when the client is gone, ends the process here instead
+        response.call_on_close(lambda: self._finish(WPS_STATUS.FAILED, 'Process interrupted before streaming'))
+        return response
+
+    def _execute_process(self, async_, wps_request, wps_response):
+        """
+        Runs synchronous jobs once their lane has a free slot, and sends asynchronous ones to be queued
+        in their lane in pool mode: the lanes admit them instead of parallelprocesses, which still limits
+        asynchronous jobs in the other processing modes.
+        """
+        if async_ and config.get_config_value('processing', 'mode') != 'pool':
+            return super(StreamingProcess, self)._execute_process(async_, wps_request, wps_response)
+        if async_:
+            self._run_async(wps_request, wps_response)
+            return wps_response
+        with JobQueue.instance().slot(JobQueue.lane(self, wps_request)):
+            wps_response._update_status(WPS_STATUS.ACCEPTED, 'PyWPS Request accepted', 0)
+            return self._run_process(wps_request, wps_response)
+
+    def _run_async(self, wps_request, wps_response):
+        """Runs an asynchronous job with the processing mode of this package configured, if any, see processing."""
+        processing = create_processing(self, wps_request, wps_response)
+        if processing is None:
+            return super(StreamingProcess, self)._run_async(wps_request, wps_response)
+        LOGGER.debug('Starting process for request: %s', self.uuid)
+        processing.start()
+
+    def periods(self, wps_request) -> List[str]:
+        """Returns the labels of the periods of a request, e.g. ['1990-01', '1990-02'], to estimate its cost."""
+        raise NotImplementedError
+
+    def cost(self, wps_request) -> Dict:
+        """Estimates the cost of a request before it runs, and its lane, see JobCost.estimate."""
+        inputs = wps_request.inputs
+        region_mean = 'region_mean' in inputs and bool(inputs['region_mean'][0].data)
+        return JobCost.estimate(self.periods(wps_request),
+                                (inputs['lat_min'][0].data, inputs['lat_max'][0].data),
+                                (inputs['lon_min'][0].data, inputs['lon_max'][0].data),
+                                len(inputs['variables']),
+                                region_mean)
+
+    def _is_streamed(self, wps_request) -> bool:
+        """Tells whether a request gets its output streamed: a synchronous one for the raw csv output."""
+        if not Settings.get_bool('stream_output', True):
+            return False
+        if not wps_request.raw or wps_request.store_execute == 'true' or 'output' not in wps_request.outputs:
+            return False
+        return wps_request.outputs['output'].get('mimetype') in (None, '', 'text/csv')
+
+    def output_file(self, file_name: str):
+        """
+        Returns the path of an output file in the workdir, None when the output is streamed.
+        :param file_name: name of the file, e.g. out.csv
+        """
+        return None if self.streamed else os.path.join(self.workdir, file_name)
+
+    def set_output(self, response, file_name: str, result, compression: str = 'none') -> None:
+        """
+        Sets the output of the process.
+        :param response: the pywps response
+        :param file_name: the output file, as returned by output_file()
+        :param result: the result of the EcoComposer, an iterator over the csv text when streamed
+        :param compression: gzip or zstd to compress the streamed output on the fly
+        """
+        if not self.streamed:
+            response.outputs['output'].file = file_name
+            return
+        self._chunks = Compression.stream(result, compression)
+        self._encoding = None if compression == 'none' else compression
+
+    def _respond(self):
+        """Yields the output, then records the end of the process, however it ends."""
+        (status, message) = (WPS_STATUS.FAILED, 'Process interrupted while streaming')
+        try:
+            yield from self._chunks
+            (status, message) = (WPS_STATUS.SUCCEEDED, 'PyWPS Process {} finished'.format(self.title))
+        except Exception as e:
+            # the response has started already: it ends here, short
+            LOGGER.exception('Process error while streaming')
+            message = 'Process error: {}'.format(e)
+            raise
+        finally:
+            self._finish(status, message)
+
+    def _finish(self, status, message: str) -> None:
+        """Records the end of the process and gives its lane slot back, once, however it ends first."""
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            dblog.store_status(self.uuid, status, message, 100)
+        finally:
+            JobQueue.instance().release(self._lane)
+            self.clean()
@@ -8,6 +8,8 @@ from pywps.inout.storage import CachedStorage
 
 from swiftclient.service import SwiftService, SwiftUploadObject
 
+from silvereye_wps_demo.models.helpers.compression import Compression
+
 
 def get_temp_url_key():
     # TODO: we could just read temp_url_key from container as well
@@ -41,24 +43,66 @@ class SwiftStorage(CachedStorage):
         (file_dir, file_name) = os.path.split(prefix)
         output_name = file_name + suffix
 
-        swift = SwiftService({'use_slo': True, 'segment_size': 5 * 1024 * 1024 * 1024})
+        headers = self.headers(output_name, output.data_format.mime_type)
         object_name = '/'.join((request_uuid, output_name))
+        log.info('Storing file output to %s', object_name)
+        self.upload(output.file, object_name, headers)
+
+        return (10, object_name, self.url(object_name))
+
+    @staticmethod
+    def headers(output_name: str, mime_type: str, expires: bool = True) -> dict:
+        """
+        Returns the headers an output is uploaded with.
+        :param output_name: name of the output, telling whether it is compressed
+        :param mime_type: media type of its content
+        :param expires: False to keep it until it is deleted, instead of 7 days
+        """
+        headers = {}
+        if expires:
+            headers['X-Delete-After'] = str(60 * 60 * 24 * 7)  # 7 days
+        encoding = Compression.encoding(output_name)
+        if encoding is not None:
+            # served as its content, e.g. text/csv, for clients to decompress
+            headers['Content-Type'] = mime_type
+            headers['Content-Encoding'] = encoding
+        return headers
+
+    def upload(self, file_name: str, object_name: str, headers: dict = None) -> bool:
+        """
+        Uploads a file to the container.
+        :param file_name: path of the file
+        :param object_name: name of the object
+        :param headers: headers of the object, e.g. X-Delete-After
+        :return: True if it was uploaded
+        """
+        log = logging.getLogger(__name__)
+        swift = SwiftService({'use_slo': True, 'segment_size': 5 * 1024 * 1024 * 1024})
         upload = SwiftUploadObject(
-            output.file,
+            file_name,
             object_name,
             options={
-                'header': {
-                    'X-Delete-After': str(60 * 60 * 24 * 7)  # 7 days
-                }
+                'header': headers or {}
             }
         )
-        log.info('Storing file output to %s', object_name)
         response = swift.upload(self.container, [upload])
         # We have to consume the reponse otherwise the object won't get uploaded
+        success = True
         for res in response:
             if res['success']:
                 # res['action'] = ('create_container', 'upload_object')
                 continue
             log.error('FAIL: %s', res)
+            success = False
+        return success
+
+    def delete(self, object_name: str) -> None:
+        """Deletes an object from the container."""
+        swift = SwiftService()
+        for res in swift.delete(self.container, [object_name]):
+            if not res['success']:
+                logging.getLogger(__name__).error('FAIL: %s', res)
 
-        return (10, object_name, self.output_url.rstrip('/') + '/' + object_name)
+    def url(self, object_name: str) -> str:
+        """Returns the url an object is served at."""
+        return self.output_url.rstrip('/') + '/' + object_name
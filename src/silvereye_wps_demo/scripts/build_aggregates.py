@@ -0,0 +1,69 @@
+"""
+Builds the monthly aggregate stores (per-cell monthly sums and valid-day counts)
+used when reduction_source = aggregate.
+The build is incremental: months already stored are skipped unless --force is given.
+With --tables, also builds the summed-area tables of the stored months, used for region means.
+With --prefix-sums, builds the prefix-sum stores used when reduction_source = prefix instead,
+for the region given by --lat and --lon, and checks their drift against daily data.
+"""
+import argparse
+import logging
+import time
+
+from pywps import configuration as wpsconfig
+
+from silvereye_wps_demo.models.ecocomposer import EcoComposer
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+
+variables = ['rainfall', 'temp_max', 'temp_min', 'vapour_pressure', 'solar_radiation']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the Silvereye monthly aggregate stores.')
+    parser.add_argument('variables', nargs='*', default=variables, choices=variables,
+                        help='variables to build, all by default')
+    parser.add_argument('-c', '--config', default='/etc/silvereye/pywps.cfg', help='pywps configuration file')
+    parser.add_argument('-y', '--years', type=int, nargs=2, metavar=('YEAR_MIN', 'YEAR_MAX'),
+                        default=(eco_constants.YEAR_MIN, eco_constants.YEAR_MAX), help='range of years to build')
+    parser.add_argument('-f', '--force', action='store_true', help='rebuild months already stored')
+    parser.add_argument('-t', '--tables', action='store_true',
+                        help='also build the summed-area tables of the monthly aggregates, for region means')
+    parser.add_argument('-p', '--prefix-sums', action='store_true',
+                        help='build the prefix-sum stores from 1970 to YEAR_MAX instead of the monthly aggregates')
+    parser.add_argument('--lat', type=float, nargs=2, metavar=('LAT_LO', 'LAT_HI'),
+                        help='latitudes of the prefix-sum region')
+    parser.add_argument('--lon', type=float, nargs=2, metavar=('LON_LO', 'LON_HI'),
+                        help='longitudes of the prefix-sum region')
+    args = parser.parse_args(argv)
+    if args.prefix_sums and (args.lat is None or args.lon is None):
+        parser.error('--prefix-sums requires --lat and --lon')
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-5.5s [%(name)s][%(threadName)s] %(message)s')
+    log = logging.getLogger(__name__)
+    wpsconfig.load_configuration([args.config])
+
+    composer = EcoComposer(args.variables)
+    for v in args.variables:
+        started = time.monotonic()
+        if args.prefix_sums:
+            measure = composer.instances[v]
+            (lat_range, lon_range) = (tuple(args.lat), tuple(args.lon))
+            built = measure.build_prefix_sums(args.years[1], lat_range, lon_range)
+            log.info('%s: built %d years of prefix sums in %.1f s', v, built, time.monotonic() - started)
+            # the longest range accumulates the most rounding error
+            time_range = (eco_constants.TIME_ISO_MIN, '{:04d}-12-31'.format(args.years[1]))
+            log.info('%s: prefix-sum drift over %s: %g', v, time_range,
+                     measure.prefix_sum_drift(time_range, lat_range, lon_range))
+        else:
+            built = composer.instances[v].build_aggregates(tuple(args.years), args.force)
+            log.info('%s: built %d months in %.1f s', v, built, time.monotonic() - started)
+            if args.tables:
+                started = time.monotonic()
+                built = composer.instances[v].build_region_tables(tuple(args.years), args.force)
+                log.info('%s: built tables for %d months in %.1f s', v, built, time.monotonic() - started)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+"""
+Pre-warms the slice and tile caches for popular regions and periods.
+
+The manifest is a JSON list of entries such as:
+[
+    {
+        "name": "Gold Coast",
+        "variables": ["rainfall", "temp_max"],
+        "years": [1990, 2014],
+        "lat_range": [-28.16, -27.72],
+        "lon_range": [153.19, 153.53]
+    }
+]
+Every year of every variable of every entry is fetched once, by up to --workers threads.
+Only the on-disk tile cache (tile_cache_dir) outlives this command, so it should be configured.
+"""
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pywps import configuration as wpsconfig
+
+from silvereye_wps_demo.models.ecocomposer import EcoComposer
+from silvereye_wps_demo.models.helpers.tilecache import TileCache
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+
+
+def _tasks(manifest):
+    """Yields one (label, measure, time_range, lat_range, lon_range) task per entry, variable and year."""
+    for entry in manifest:
+        composer = EcoComposer(entry['variables'])
+        (yr_lo, yr_hi) = entry['years']
+        for v in entry['variables']:
+            for yr in range(yr_lo, yr_hi + 1):
+                label = '{} {} {}'.format(entry.get('name', ''), v, yr).strip()
+                yield (label,
+                       composer.instances[v],
+                       TimeConverters.y2trange(yr),
+                       tuple(entry['lat_range']),
+                       tuple(entry['lon_range']))
+
+
+def _warm(measure, time_range, lat_range, lon_range) -> int:
+    """Fetches one slice through the caches, and returns its size only, so that it is not kept in memory."""
+    return measure.slice(time_range, lat_range, lon_range).nbytes
+
+
+def prewarm(manifest, workers: int) -> dict:
+    """
+    Fetches everything listed in the manifest through the caches.
+    :param manifest: list of entries, see module docstring
+    :param workers: number of concurrent fetches
+    :return: dict with counts of slices, bytes and seconds
+    """
+    log = logging.getLogger(__name__)
+    totals = {'slices': 0, 'failed': 0, 'bytes': 0}
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prewarm') as executor:
+        futures = {executor.submit(_warm, measure, time_range, lat_range, lon_range): label
+                   for (label, measure, time_range, lat_range, lon_range) in _tasks(manifest)}
+        for future in as_completed(futures):
+            # dropped once handled, so that completed futures do not pile up
+            label = futures.pop(future)
+            try:
+                nbytes = future.result()
+            except Exception as err:
+                log.error('%s: %s', label, err)
+                totals['failed'] += 1
+                continue
+            totals['slices'] += 1
+            totals['bytes'] += nbytes
+            elapsed = time.monotonic() - started
+            log.info('%s: %d bytes, %.1f MB/s overall',
+                     label, nbytes, totals['bytes'] / 1024 ** 2 / max(elapsed, 1e-6))
+    totals['seconds'] = time.monotonic() - started
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-warm the Silvereye WPS data caches.')
+    parser.add_argument('manifest', help='JSON file listing regions, variables and years')
+    parser.add_argument('-c', '--config', default='/etc/silvereye/pywps.cfg', help='pywps configuration file')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='concurrent fetches')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-5.5s [%(name)s][%(threadName)s] %(message)s')
+    log = logging.getLogger(__name__)
+    wpsconfig.load_configuration([args.config])
+    if TileCache.instance() is None:
+        log.warning('tile_cache_dir is not configured: nothing will outlive this command')
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    totals = prewarm(manifest, args.workers)
+
+    seconds = max(totals['seconds'], 1e-6)
+    log.info('Fetched %d slices (%d failed), %.1f MB in %.1f s: %.1f MB/s, %.2f slices/s',
+             totals['slices'], totals['failed'], totals['bytes'] / 1024 ** 2, totals['seconds'],
+             totals['bytes'] / 1024 ** 2 / seconds, totals['slices'] / seconds)
+    cache = TileCache.instance()
+    if cache is not None:
+        log.info('Tile cache: %s', cache.stats)
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
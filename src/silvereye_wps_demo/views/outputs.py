@@ -3,11 +3,12 @@ import os.path
 
 from pyramid.httpexceptions import HTTPFound
 from pyramid.view import view_config
-from pyramid.response import FileResponse
+from pyramid.response import FileIter, FileResponse, Response
 
 from swiftclient.utils import generate_temp_url
 from pywps import configuration as config
 
+from silvereye_wps_demo.models.helpers.compression import Compression
 from silvereye_wps_demo.pywps.swiftstorage import get_temp_url_key
 
 
@@ -35,5 +36,15 @@ def outputs(request):
     # Default to just serving the file for FileStorage
     output_dir = config.get_config_value('server', 'outputpath') + "/"
     path = os.path.join(output_dir, '/'.join(request.matchdict['filename']))
-    response = FileResponse(path, request)
+    encoding = Compression.encoding(path)
+    if encoding is None:
+        return FileResponse(path, request)
+    # compressed outputs are served as their content, e.g. text/csv, with a Content-Encoding,
+    # or decompressed here for clients not accepting it: either way, caches must tell them apart
+    content_type = Compression.media_type(path)
+    if request.accept_encoding.acceptable_offers([encoding]):
+        response = FileResponse(path, request, content_type=content_type, content_encoding=encoding)
+    else:
+        response = Response(app_iter=FileIter(Compression.decompressed(path)), content_type=content_type)
+    response.vary = ('Accept-Encoding',)
     return response
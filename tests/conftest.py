@@ -0,0 +1,100 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from pywps import configuration
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.backends.base import Backend
+from silvereye_wps_demo.models.helpers.datasetregistry import DatasetRegistry
+from silvereye_wps_demo.models.rainfall import Rainfall
+
+
+class FakeBackend(Backend):
+    """
+    Daily data computed from the (time, lat, lon) indices, in float32, without any server.
+    Cells listed in missing hold the fill value on every day. Every read is recorded in reads.
+    """
+    FILL_VALUE = -999.0
+
+    def __init__(self, missing=()):
+        Backend.__init__(self, 'http://fake/rainfall', 'lwe_thickness_of_precipitation_amount')
+        self.missing = missing
+        self.reads = []
+
+    @property
+    def shape(self):
+        return (eco_constants.TIME_IDX_MAX + 1, eco_constants.LAT_IDX_MAX + 1, eco_constants.LON_IDX_MAX + 1)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    @property
+    def attributes(self):
+        return {'_FillValue': self.FILL_VALUE, 'units': 'mm'}
+
+    @staticmethod
+    def data(time_idx, lat_idx, lon_idx) -> np.ndarray:
+        """Returns the values of a hyperslab, the same whatever the way it is read."""
+        t = np.arange(*time_idx, dtype=np.float64)[:, None, None]
+        lat = np.arange(*lat_idx, dtype=np.float64)[None, :, None]
+        lon = np.arange(*lon_idx, dtype=np.float64)[None, None, :]
+        return (np.sin(t * 0.37 + lat * 0.011 + lon * 0.007) * 10 + 20 + t / 1000).astype(np.float32)
+
+    def read(self, time_idx, lat_idx, lon_idx):
+        self.reads.append((tuple(time_idx), tuple(lat_idx), tuple(lon_idx)))
+        block = self.data(time_idx, lat_idx, lon_idx)
+        for (lat, lon) in self.missing:
+            if lat_idx[0] <= lat < lat_idx[1] and lon_idx[0] <= lon < lon_idx[1]:
+                block[:, lat - lat_idx[0], lon - lon_idx[0]] = self.FILL_VALUE
+        return block
+
+
+@pytest.fixture
+def config():
+    """
+    Loads the default pywps configuration, with the caches of the package disabled,
+    and returns a setter of [silvereye] options: config('fetch_mode', 'span').
+    """
+    configuration.load_configuration([])
+    configuration.CONFIG.add_section('silvereye')
+
+    def set_option(option, value, section='silvereye'):
+        if not configuration.CONFIG.has_section(section):
+            configuration.CONFIG.add_section(section)
+        configuration.CONFIG.set(section, option, str(value))
+
+    set_option('slice_cache_bytes', 0)
+    set_option('variable_workers', 1)
+    yield set_option
+    configuration.load_configuration([])
+
+
+@pytest.fixture
+def utc():
+    """Runs a test with the server in UTC, as the Docker image is."""
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = previous
+    time.tzset()
+
+
+@pytest.fixture
+def backend(request):
+    """The backend of measure: a FakeBackend, or the one given by parametrize(..., indirect=True)."""
+    return getattr(request, 'param', None) or FakeBackend()
+
+
+@pytest.fixture
+def measure(config, backend, monkeypatch):
+    """A Rainfall measure reading from backend, with a registry of its own."""
+    monkeypatch.setattr(DatasetRegistry, '_instance', DatasetRegistry())
+    monkeypatch.setattr(Rainfall, '_open', lambda self: backend)
+    return Rainfall()
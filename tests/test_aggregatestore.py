@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.aggregatestore import MonthlyAggregateStore
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+from tests.conftest import FakeBackend
+
+# cells without any valid day, and with some
+MISSING = [(1, 2)]
+GAPS = (3, 4)
+
+
+def daily(time_idx, lat_idx, lon_idx):
+    """Daily data as EcoMeasure fetches it: fill values as NaN, here on some days of GAPS too."""
+    block = FakeBackend(missing=MISSING).read(time_idx, lat_idx, lon_idx).astype(np.float64)
+    block[block == FakeBackend.FILL_VALUE] = np.nan
+    if lat_idx[0] <= GAPS[0] < lat_idx[1] and lon_idx[0] <= GAPS[1] < lon_idx[1]:
+        days = np.arange(*time_idx)
+        block[days % 3 == 0, GAPS[0] - lat_idx[0], GAPS[1] - lon_idx[0]] = np.nan
+    return block
+
+
+@pytest.fixture
+def grid(monkeypatch):
+    """A grid of 6 x 7 cells, for full grid builds to stay small."""
+    monkeypatch.setattr(eco_constants, 'LAT_IDX_MAX', 5)
+    monkeypatch.setattr(eco_constants, 'LON_IDX_MAX', 6)
+    return ((0, 6), (0, 7))
+
+
+def direct(time_idx, lat_idx, lon_idx):
+    """Sum and valid count of the days of a period, straight from the daily data."""
+    block = daily(time_idx, lat_idx, lon_idx)
+    valid = np.isfinite(block)
+    return (np.where(valid, block, 0.0).sum(axis=0), valid.sum(axis=0))
+
+
+@pytest.mark.parametrize('time_range', [
+    TimeConverters.ym2trange(1990, 2),
+    TimeConverters.yq2trange(1990, 3),
+    TimeConverters.y2trange(1990),
+    ('1990-11-01', '1991-02-28'),
+])
+def test_periods_match_daily_data(grid, tmp_path, time_range):
+    store = MonthlyAggregateStore(str(tmp_path), 'Rainfall')
+    store.build(daily, (1990, 1991))
+    time_idx = Indexers.time_range_as_idx(time_range)
+    window = ((1, 5), (2, 7))
+    (total, count) = store.period(time_idx, *window)
+    (expected_total, expected_count) = direct(time_idx, *window)
+    np.testing.assert_allclose(total, expected_total, rtol=1e-12)
+    np.testing.assert_array_equal(count, expected_count)
+    assert (count[MISSING[0][0] - 1, MISSING[0][1] - 2]) == 0
+
+
+def test_tail_is_the_day_after_the_month(grid, tmp_path):
+    store = MonthlyAggregateStore(str(tmp_path), 'Rainfall')
+    store.build_month(daily, 1990, 1)
+    (lo, hi) = MonthlyAggregateStore.month_idx(1990, 1)
+    tail = np.load(store._plane_path(1990, 1, 'tail'))
+    np.testing.assert_array_equal(tail, daily((hi, hi + 1), *grid)[0].astype(np.float32))
+    # the last day of the month, left out of its sum
+    assert hi - lo == 30
+
+
+def test_unaligned_or_missing_periods_are_not_answered(grid, tmp_path):
+    store = MonthlyAggregateStore(str(tmp_path), 'Rainfall')
+    store.build_month(daily, 1990, 1)
+    (lo, hi) = MonthlyAggregateStore.month_idx(1990, 1)
+    assert store.period((lo + 1, hi), *grid) is None
+    assert store.period(Indexers.time_range_as_idx(TimeConverters.ym2trange(1990, 2)), *grid) is None
+
+
+def test_build_resumes(grid, tmp_path):
+    store = MonthlyAggregateStore(str(tmp_path), 'Rainfall')
+    assert store.build(daily, (1990, 1990)) == 12
+    assert store.build(daily, (1990, 1991)) == 12
+    assert store.build(daily, (1990, 1991)) == 0
+    assert store.build(daily, (1991, 1991), force=True) == 12
+    time_idx = Indexers.time_range_as_idx(('1990-01-01', '1991-12-31'))
+    (total, count) = store.period(time_idx, *grid)
+    np.testing.assert_allclose(total, direct(time_idx, *grid)[0], rtol=1e-12)
+    np.testing.assert_array_equal(count, direct(time_idx, *grid)[1])
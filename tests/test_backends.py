@@ -0,0 +1,96 @@
+import json
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.backends import NpyMirrorBackend
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+from silvereye_wps_demo.models.rainfall import Rainfall
+from tests.conftest import FakeBackend
+
+
+class RemoteBackend(FakeBackend):
+    """A remote backend recording whether it was opened, and whether reads held its slot."""
+
+    def __init__(self):
+        FakeBackend.__init__(self)
+        (self.opened, self.holding, self.read_in_slot) = (0, False, [])
+
+    def open(self):
+        self.opened += 1
+        return self
+
+    @contextmanager
+    def slot(self):
+        self.holding = True
+        yield
+        self.holding = False
+
+    def read(self, time_idx, lat_idx, lon_idx):
+        self.read_in_slot.append(self.holding)
+        return FakeBackend.read(self, time_idx, lat_idx, lon_idx)
+
+
+@pytest.fixture
+def mirror(config, tmp_path):
+    """An npy mirror of 1990 and 1991, over the first 3 x 4 cells, with a remote fallback."""
+    for year in (1990, 1991):
+        days = (Indexers.year_start_idx(year), Indexers.year_start_idx(year + 1))
+        np.save(str(tmp_path / '{}.npy'.format(year)), FakeBackend.data(days, (0, 3), (0, 4)))
+    with open(str(tmp_path / NpyMirrorBackend.ATTRIBUTES_FILE), 'w') as f:
+        json.dump({'units': 'mm'}, f)
+    return NpyMirrorBackend(str(tmp_path), 'rain', fallback=RemoteBackend())
+
+
+def test_complete_mirror_does_not_open_the_fallback(mirror):
+    mirror.open()
+    time_idx = (Indexers.year_start_idx(1990) + 100, Indexers.year_start_idx(1991) + 100)
+    np.testing.assert_array_equal(mirror.read(time_idx, (0, 3), (1, 4)), FakeBackend.data(time_idx, (0, 3), (1, 4)))
+    assert mirror.fallback.opened == 0
+
+
+def test_missing_years_are_read_from_the_fallback_in_its_slot(mirror):
+    mirror.open()
+    time_idx = (Indexers.year_start_idx(1991) + 300, Indexers.year_start_idx(1992) + 10)
+    np.testing.assert_array_equal(mirror.read(time_idx, (0, 3), (0, 4)), FakeBackend.data(time_idx, (0, 3), (0, 4)))
+    mirror.read(time_idx, (0, 3), (0, 4))
+    assert mirror.fallback.opened == 1
+    assert mirror.fallback.read_in_slot == [True, True]
+
+
+def test_attributes_from_the_fallback_without_attributes_file(mirror, tmp_path):
+    (tmp_path / NpyMirrorBackend.ATTRIBUTES_FILE).unlink()
+    mirror.open()
+    assert mirror.attributes == FakeBackend().attributes
+    assert mirror.fallback.opened == 1
+
+
+@pytest.mark.parametrize('fill_value, attributes', [(None, {'_FillValue': -9999.0}), (-9999.0, {})])
+def test_mirror_fill_values_are_skipped(utc, measure, tmp_path, monkeypatch, fill_value, attributes):
+    # the first cells of the grid, the mirror holding no more
+    (lat_range, lon_range) = ((-9.06, -9.01), (112.91, 112.96))
+    (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(lat_range), Indexers.lon_range_as_idx(lon_range))
+    days = (Indexers.year_start_idx(1990), Indexers.year_start_idx(1991))
+    data = FakeBackend.data(days, (0, lat_idx[1]), (0, lon_idx[1]))
+    data[:, 1, 2] = -9999.0
+    data[::3, 3, 4] = -9999.0
+    np.save(str(tmp_path / '1990.npy'), data)
+    with open(str(tmp_path / NpyMirrorBackend.ATTRIBUTES_FILE), 'w') as f:
+        json.dump(attributes, f)
+    mirror = NpyMirrorBackend(str(tmp_path), 'rain', fill_value=fill_value)
+    monkeypatch.setattr(Rainfall, '_open', lambda self: mirror.open())
+
+    time_ranges = [TimeConverters.ym2trange(1990, mo) for mo in range(1, 12)]
+    means = measure.period_means(time_ranges, lat_range, lon_range)
+    valid = np.where(data == -9999.0, np.nan, data.astype(np.float64))
+    for (i, time_range) in enumerate(time_ranges):
+        (lo, hi) = np.subtract(Indexers.time_range_as_idx(time_range), days[0])
+        with warnings.catch_warnings():
+            # the cell without any valid day
+            warnings.simplefilter('ignore', RuntimeWarning)
+            expected = np.nanmean(valid[lo:hi], axis=0)
+        np.testing.assert_allclose(means[i], expected, rtol=1e-6)
+    assert np.isnan(means[:, 1, 2]).all()
@@ -0,0 +1,72 @@
+import csv
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.csvarraywriter import CSVArrayWriter
+
+STRINGS = ['', 'a', 'a,b', 'say "hi"', 'two\nlines', 'cr\r', ' padded ', '1990-q1', None]
+
+
+def random_columns(rng, rows):
+    """Columns of every kind the writer formats: floats with repeats, NaN, inf and -0.0, ints, strings."""
+    floats = rng.normal(scale=100, size=rows)
+    floats[rng.random(rows) < 0.1] = np.nan
+    floats[rng.random(rows) < 0.05] = rng.choice([np.inf, -np.inf, -0.0, 0.0, 1e-300, 1e300])
+    coordinates = np.round(rng.choice(rng.uniform(-44, -9, size=3), size=rows), 2)
+    with np.errstate(over='ignore'):
+        # 1e300 is inf in float32
+        floats32 = floats.astype(np.float32)
+    return {
+        'float64': floats,
+        'coordinate': coordinates,
+        'float32': floats32,
+        'int': rng.integers(-10 ** 6, 10 ** 6, size=rows),
+        'repeated_int': rng.integers(0, 3, size=rows),
+        'string': [STRINGS[i] for i in rng.integers(0, len(STRINGS), size=rows)],
+        'label': np.array(['1990-{:02d}'.format(i) for i in rng.integers(1, 13, size=rows)]),
+    }
+
+
+def expected(field_names, data, precision=None):
+    """The csv text csv.writer writes, values with a precision formatted beforehand."""
+    precision = precision or {}
+    columns = [[('%.{}f'.format(precision[name])) % value for value in column] if name in precision else column
+               for (name, column) in zip(field_names, data)]
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(field_names)
+    writer.writerows(zip(*columns))
+    return text.getvalue()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_blocks_match_csv_writer(seed):
+    rng = np.random.default_rng(seed)
+    columns = random_columns(rng, int(rng.integers(0, 200)))
+    field_names = list(rng.permutation(list(columns)))[:int(rng.integers(1, len(columns) + 1))]
+    data = [columns[name] for name in field_names]
+    precision = {name: int(rng.integers(0, 6)) for name in field_names
+                 if name in ('float64', 'float32', 'coordinate') and rng.random() < 0.5}
+    writer = CSVArrayWriter('unused.csv', field_names, data, precision, chunk_rows=int(rng.integers(1, 50)))
+    assert ''.join(writer.blocks()) == expected(field_names, data, precision)
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_file_matches_csv_writer(tmp_path, compression):
+    columns = random_columns(np.random.default_rng(0), 1000)
+    (field_names, data) = (['period', 'lat', 'rainfall'], [columns['label'], columns['coordinate'], columns['float64']])
+    file_name = str(tmp_path / 'out.csv')
+    CSVArrayWriter(file_name, field_names, data, chunk_rows=64, compression=compression).write()
+    with open(file_name, 'rb') as f:
+        written = f.read()
+    if compression == 'gzip':
+        written = gzip.decompress(written)
+    assert written == expected(field_names, data).encode()
+
+
+def test_single_empty_field_is_quoted():
+    writer = CSVArrayWriter('unused.csv', ['name'], [['', 'a', None]])
+    assert ''.join(writer.blocks()) == expected(['name'], [['', 'a', None]])
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from silvereye_wps_demo.models.helpers import datasetregistry
+from silvereye_wps_demo.models.helpers.datasetregistry import DatasetRegistry
+
+
+class Opener(object):
+    """Opens numbered handles, failing the first fail_times calls."""
+
+    def __init__(self, fail_times=0):
+        self.calls = 0
+        self.fail_times = fail_times
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise IOError('upstream unavailable')
+        return 'handle {}'.format(self.calls)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock of the registry moved by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(datasetregistry.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_handles_are_reused(clock):
+    registry = DatasetRegistry(ttl=60.0)
+    opener = Opener()
+    assert registry.get('rain', opener) == 'handle 1'
+    clock[0] += 59
+    assert registry.get('rain', opener) == 'handle 1'
+    assert opener.calls == 1
+
+
+def test_handles_expire_after_the_ttl(clock):
+    registry = DatasetRegistry(ttl=60.0)
+    opener = Opener()
+    registry.get('rain', opener)
+    clock[0] += 61
+    assert registry.get('rain', opener) == 'handle 2'
+    # kept forever without ttl
+    registry = DatasetRegistry(ttl=0)
+    registry.get('rain', opener)
+    clock[0] += 10 ** 6
+    assert registry.get('rain', opener) == 'handle 3'
+
+
+def test_reopened_after_an_error():
+    registry = DatasetRegistry()
+    opener = Opener(fail_times=1)
+    with pytest.raises(IOError):
+        registry.get('rain', opener)
+    assert registry.get('rain', opener) == 'handle 2'
+    # failing health checks drop the handle
+    assert not registry.check('rain', lambda handle: 1 / 0)
+    assert registry.get('rain', opener) == 'handle 3'
+    registry.invalidate('rain')
+    assert registry.get('rain', opener) == 'handle 4'
+
+
+def test_concurrent_gets_open_once():
+    registry = DatasetRegistry()
+    opener = Opener()
+    threads = [threading.Thread(target=registry.get, args=('rain', opener)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert opener.calls == 1
+
+
+def test_instance_takes_the_ttl_once(config, monkeypatch):
+    monkeypatch.setattr(DatasetRegistry, '_instance', None)
+    config('dataset_ttl', 120)
+    registry = DatasetRegistry.instance()
+    config('dataset_ttl', 5)
+    assert DatasetRegistry.instance() is registry
+    assert registry.ttl == 120.0
@@ -0,0 +1,90 @@
+import csv
+import threading
+
+import numpy as np
+
+from silvereye_wps_demo.models.ecocomposer import EcoComposer
+from silvereye_wps_demo.models.ecomeasure import EcoMeasure
+from silvereye_wps_demo.models.helpers.datasetregistry import DatasetRegistry
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from tests.conftest import FakeBackend
+
+# more requested coordinates than cells along both axes: 27 latitudes and 26 longitudes for 25 x 25 cells
+LAT_RANGE = (-28.25, -28.0)
+LON_RANGE = (152.8, 153.05)
+
+
+def rows(tmp_path, process, *args):
+    """Runs a process of the composer into a csv file, and returns its rows, header first."""
+    file_name = str(tmp_path / 'output.csv')
+    getattr(EcoComposer(['rainfall']), process)(file_name, *args, LAT_RANGE, LON_RANGE)
+    with open(file_name, newline='') as f:
+        return list(csv.reader(f))
+
+
+def shape():
+    """(lat, lon) numbers of cells of the region."""
+    (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(LAT_RANGE), Indexers.lon_range_as_idx(LON_RANGE))
+    return (lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0])
+
+
+def cells():
+    return shape()[0] * shape()[1]
+
+
+def test_every_period_lists_the_same_cells(utc, measure, tmp_path):
+    (header, *body) = rows(tmp_path, 'process_years', (1990, 1991))
+    assert header == ['year', 'lat', 'lon', 'Rainfall']
+    assert len(body) == 2 * cells()
+    labels = [tuple(row[1:3]) for row in body]
+    assert labels[:cells()] == labels[cells():]
+    assert len(set(labels[:cells()])) == cells()
+    # labelled with the requested coordinates
+    assert float(body[0][1]) == Indexers.lat_as_vector(LAT_RANGE)[0]
+    assert float(body[0][2]) == Indexers.lon_as_vector(LON_RANGE)[0]
+    assert all(row[3] for row in body)
+
+
+def test_single_period_without_time_column(utc, measure, tmp_path):
+    (header, *body) = rows(tmp_path, 'process_one_year_one_quarter', 1990, 1)
+    assert header == ['lat', 'lon', 'Rainfall']
+    assert len(body) == cells()
+    # one row of cells per latitude
+    lats = [row[0] for row in body]
+    assert lats == [lat for lat in dict.fromkeys(lats) for _ in range(shape()[1])]
+    assert len(set(lats)) == shape()[0]
+
+
+class VariableBackend(FakeBackend):
+    """The fake data shifted by an offset of its own, recording the threads reading it."""
+
+    def __init__(self, offset, threads):
+        FakeBackend.__init__(self)
+        (self.offset, self.threads) = (offset, threads)
+
+    def read(self, time_idx, lat_idx, lon_idx):
+        self.threads.add(threading.current_thread().name)
+        return FakeBackend.read(self, time_idx, lat_idx, lon_idx) + np.float32(self.offset)
+
+
+def test_concurrent_variables_match_sequential(utc, config, tmp_path, monkeypatch):
+    offsets = {'VapourPressure': 100, 'Rainfall': 200, 'TempMax': 300}
+    threads = set()
+    monkeypatch.setattr(EcoMeasure, '_open', lambda self: VariableBackend(offsets[self.data['name']], threads))
+    # each variable fetched in one part, by the thread processing it
+    config('fetch_chunk_days', 1000)
+    outputs = []
+    for workers in (1, 3):
+        config('variable_workers', workers)
+        monkeypatch.setattr(DatasetRegistry, '_instance', DatasetRegistry())
+        file_name = str(tmp_path / 'output{}.csv'.format(workers))
+        EcoComposer(['vapour_pressure', 'rainfall', 'temp_max']).process_years_all_months(
+            file_name, (1990, 1991), LAT_RANGE, LON_RANGE)
+        with open(file_name, newline='') as f:
+            outputs.append(list(csv.reader(f)))
+    assert outputs[0] == outputs[1]
+    assert any(name.startswith('variable') for name in threads)
+    # columns in the requested order
+    (header, first) = outputs[1][:2]
+    assert header[3:] == ['VapourPressure', 'Rainfall', 'TempMax']
+    assert [int(float(value)) // 100 for value in first[3:]] == [1, 2, 3]
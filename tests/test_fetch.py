@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.ecomeasure import EcoMeasure
+from tests.conftest import FakeBackend
+
+
+class TooLarge(Exception):
+    """An error as raised by requests for a response the server rejects for its size."""
+
+    def __init__(self, message):
+        Exception.__init__(self, message)
+        self.response = type('Response', (), {'status_code': 413})()
+
+
+class LimitedBackend(FakeBackend):
+    """Rejects reads of more than max_days days with an HTTP 413."""
+
+    def __init__(self, max_days):
+        FakeBackend.__init__(self)
+        self.max_days = max_days
+        self.rejected = []
+
+    def read(self, time_idx, lat_idx, lon_idx):
+        if time_idx[1] - time_idx[0] > self.max_days:
+            self.rejected.append(tuple(time_idx))
+            try:
+                raise TooLarge('413 Client Error')
+            except TooLarge as err:
+                # as pydap re-raises HTTP errors, without their response
+                raise RuntimeError('Failed to fetch data') from err
+        return FakeBackend.read(self, time_idx, lat_idx, lon_idx)
+
+
+class DownBackend(FakeBackend):
+    """Fails every read, as an unavailable server does."""
+
+    def read(self, time_idx, lat_idx, lon_idx):
+        self.reads.append((tuple(time_idx), tuple(lat_idx), tuple(lon_idx)))
+        raise TimeoutError('Read timed out')
+
+
+@pytest.mark.parametrize('backend', [LimitedBackend(max_days=40)], indirect=True)
+def test_parts_rejected_as_too_large_are_split(measure, backend):
+    result = measure._fetch((0, 150), (0, 2), (0, 3))
+    np.testing.assert_array_equal(result, FakeBackend.data((0, 150), (0, 2), (0, 3)))
+    assert backend.rejected[0] == (0, 150)
+    assert all(hi - lo <= 40 for (lo, hi) in [read[0] for read in backend.reads])
+
+
+@pytest.mark.parametrize('backend', [LimitedBackend(max_days=1)], indirect=True)
+def test_splitting_is_bounded(measure, backend, config):
+    config('fetch_split_depth', 2)
+    with pytest.raises(RuntimeError):
+        measure._fetch((0, 64), (0, 1), (0, 1))
+    # halved twice, then the first failure is raised
+    assert backend.rejected == [(0, 64), (0, 32), (0, 16)]
+
+
+@pytest.mark.parametrize('backend', [DownBackend()], indirect=True)
+def test_other_failures_are_not_split(measure, backend):
+    with pytest.raises(TimeoutError):
+        measure._fetch((0, 150), (0, 20), (0, 30))
+    # the read and its retry after re-opening the backend
+    assert len(backend.reads) == 2
+
+
+def covers(parts, box):
+    """Whether parts tile box exactly, in order along time."""
+    size = int(np.prod([hi - lo for (lo, hi) in box]))
+    seen = np.zeros([hi - lo for (lo, hi) in box], dtype=np.int32)
+    origin = [lo for (lo, _) in box]
+    for part in parts:
+        seen[EcoMeasure._offsets(part, origin)] += 1
+    return (seen == 1).all() and sum(int(np.prod([hi - lo for (lo, hi) in part])) for part in parts) == size
+
+
+def test_plan_chunks_long_ranges(config):
+    config('fetch_chunk_days', 100)
+    box = ((10, 345), (0, 20), (0, 30))
+    parts = EcoMeasure._plan(box, 4)
+    assert [part[0] for part in parts] == [(10, 110), (110, 210), (210, 310), (310, 345)]
+    assert covers(parts, box)
+
+
+@pytest.mark.parametrize('max_bytes', [4, 400, 4000, 30000])
+def test_plan_splits_large_parts(config, max_bytes):
+    config('max_response_bytes', max_bytes)
+    box = ((0, 50), (3, 20), (5, 30))
+    parts = EcoMeasure._plan(box, 4)
+    assert covers(parts, box)
+    assert all(np.prod([hi - lo for (lo, hi) in part]) * 4 <= max_bytes for part in parts)
+
+
+def test_split_stops_at_single_values():
+    assert EcoMeasure._split(((0, 1), (0, 1), (0, 1)), 0) == [((0, 1), (0, 1), (0, 1))]
+
+
+@pytest.mark.parametrize('backend', [LimitedBackend(max_days=20)], indirect=True)
+def test_chunks_are_fetched_concurrently(measure, backend, config):
+    config('fetch_chunk_days', 30)
+    config('fetch_workers', 4)
+    result = measure._fetch((5, 200), (0, 2), (0, 3))
+    np.testing.assert_array_equal(result, FakeBackend.data((5, 200), (0, 2), (0, 3)))
+    # every chunk of 30 days rejected, then halved; the last one, of 15 days, accepted
+    assert sorted(backend.rejected) == [(lo, lo + 30) for lo in range(5, 185, 30)]
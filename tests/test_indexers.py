@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+from tests.conftest import FakeBackend
+
+
+@pytest.mark.parametrize('time_range, expected', [
+    (('1970-01-01', '1970-01-31'), (0, 30)),
+    (('2014-01-01', '2014-12-31'), (16071, eco_constants.TIME_IDX_MAX)),
+    (('2012-01-01', '2014-12-31'), (15340, eco_constants.TIME_IDX_MAX)),
+])
+def test_time_range_as_idx_in_utc(utc, time_range, expected):
+    assert Indexers.time_range_as_idx(time_range) == expected
+
+
+def test_time_range_as_idx_rejects_out_of_range(utc):
+    with pytest.raises(ValueError):
+        Indexers.time_range_as_idx(('2014-12-01', '2015-01-31'))
+
+
+def test_get_time_idx_clamps_within_last_day(utc):
+    assert Indexers.get_time_idx(TimeConverters.iso2ts('2014-12-31')) == eco_constants.TIME_IDX_MAX
+    assert Indexers.get_time_idx(eco_constants.TIME_MAX + 36000) == eco_constants.TIME_IDX_MAX
+    assert Indexers.get_time_idx(eco_constants.TIME_MAX + eco_constants.TIME_DELTA) == -1
+
+
+def test_iso2ts_is_timezone_independent(utc):
+    assert TimeConverters.iso2ts('1970-01-01') == 0.0
+    assert TimeConverters.iso2ts(eco_constants.TIME_ISO_MAX) == eco_constants.TIME_MAX
+    assert TimeConverters.ts2iso(eco_constants.TIME_MAX) == eco_constants.TIME_ISO_MAX
+
+
+def test_fetch_rejects_indices_outside_the_grid(measure):
+    with pytest.raises(ValueError):
+        measure._fetch((16000, -1), (0, 2), (0, 2))
+
+
+LAT_RANGE = (-28.2, -28.0)
+LON_RANGE = (152.85, 153.0)
+
+
+def expected_mean(time_range):
+    (lo, hi) = Indexers.time_range_as_idx(time_range)
+    return FakeBackend.data((lo, hi), Indexers.lat_range_as_idx(LAT_RANGE),
+                            Indexers.lon_range_as_idx(LON_RANGE)).astype(np.float64).mean(axis=0)
+
+
+def test_mean_by_year_2014_in_utc(utc, measure):
+    result = measure.mean_by_year(2014, LAT_RANGE, LON_RANGE)
+    np.testing.assert_allclose(result, expected_mean(('2014-01-01', '2014-12-31')), rtol=1e-6)
+
+
+@pytest.mark.parametrize('fetch_mode', ['span', 'period'])
+def test_mean_years_to_2014_in_utc(utc, measure, config, fetch_mode):
+    config('fetch_mode', fetch_mode)
+    years = (2012, 2014)
+    result = measure.mean_years(years, LAT_RANGE, LON_RANGE).reshape((3, -1))
+    for (i, year) in enumerate(range(years[0], years[1] + 1)):
+        np.testing.assert_allclose(result[i], expected_mean(TimeConverters.y2trange(year)).reshape(-1), rtol=1e-6)
+
+
+def test_mean_one_year_all_months_2014_in_utc(utc, measure):
+    result = measure.mean_one_year_all_months(2014, LAT_RANGE, LON_RANGE).reshape((12, -1))
+    np.testing.assert_allclose(result[-1], expected_mean(TimeConverters.ym2trange(2014, 12)).reshape(-1), rtol=1e-6)
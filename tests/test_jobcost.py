@@ -0,0 +1,46 @@
+import pytest
+
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.jobcost import JobCost
+
+CONTINENT = ((-43.735, -9.005), (112.905, 153.995))
+
+
+def test_last_year_on_the_continent_is_batch(utc, config):
+    cost = JobCost.estimate(Indexers.years_as_vector((2014, 2014)), *CONTINENT, 5)
+    assert cost['days'] == 364
+    assert cost['bytes'] > 0
+    assert cost['lane'] == 'batch'
+
+
+def test_small_query_is_interactive(utc, config):
+    cost = JobCost.estimate(['2014-01'], (-28.2, -28.0), (152.85, 153.0), 1)
+    assert cost['lane'] == 'interactive'
+
+
+def test_empty_jobs_are_rejected(config):
+    with pytest.raises(ValueError):
+        JobCost.estimate(['2014-01'], (-28.0, -28.0), (153.0, 153.0), 1)
+
+
+@pytest.mark.parametrize('region_mean', [False, True])
+def test_estimate(utc, config, region_mean):
+    config('cost_row_bytes', 10)
+    config('interactive_max_cost', 10 ** 6)
+    (lat_range, lon_range) = ((-28.2, -28.0), (152.85, 153.0))
+    (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(lat_range), Indexers.lon_range_as_idx(lon_range))
+    cells = (lat_idx[1] - lat_idx[0]) * (lon_idx[1] - lon_idx[0])
+    cost = JobCost.estimate(['1990-01', '1990-02', '1990-q2'], lat_range, lon_range, 3, region_mean, itemsize=8)
+    # the days EcoMeasure.slice fetches: every period but its last day
+    assert cost['days'] == 30 + 27 + 90
+    assert cost['cells'] == cells
+    assert cost['bytes'] == 147 * cells * 3 * 8
+    assert cost['rows'] == (3 if region_mean else 3 * cells)
+    assert cost['cost'] == cost['bytes'] + cost['rows'] * 10
+    assert cost['lane'] == ('interactive' if cost['cost'] <= 10 ** 6 else 'batch')
+
+
+def test_lane_threshold(config):
+    config('interactive_max_cost', 1000)
+    assert JobCost.lane(1000) == 'interactive'
+    assert JobCost.lane(1001) == 'batch'
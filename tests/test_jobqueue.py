@@ -0,0 +1,134 @@
+import threading
+import time
+import uuid
+
+import pytest
+from pywps import ComplexOutput, Format, WPSRequest, dblog
+from pywps.exceptions import NoApplicableCode, ServerBusy
+
+from silvereye_wps_demo.pywps.jobqueue import JobQueue
+from silvereye_wps_demo.pywps.streaming import StreamingProcess
+
+
+class Echo(StreamingProcess):
+    """Streams a few fixed rows, or fails in its handler."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        super(Echo, self).__init__(self._handler, identifier='echo', title='Echo', inputs=[],
+                                   outputs=[ComplexOutput('output', 'Output', supported_formats=[Format('text/csv')])])
+
+    def _handler(self, request, response):
+        if self.fail:
+            raise RuntimeError('handler failed')
+        self.set_output(response, self.output_file('out.csv'), iter(['a,b\r\n', '1,2\r\n']))
+        return response
+
+    def cost(self, wps_request):
+        return {'bytes': 0, 'rows': 2, 'lane': 'interactive'}
+
+    def _is_streamed(self, wps_request):
+        return True
+
+
+@pytest.fixture
+def queue(config, monkeypatch):
+    """A job queue of its own, running one job per lane."""
+    queue = JobQueue({'interactive': 1, 'batch': 1})
+    monkeypatch.setattr(JobQueue, '_instance', queue)
+    return queue
+
+
+def execute(process):
+    """Executes a request as the pywps service does, logging it first."""
+    wps_request = WPSRequest()
+    (wps_request.operation, wps_request.version, wps_request.identifier) = ('execute', '1.0.0', 'echo')
+    request_uuid = uuid.uuid1()
+    dblog.log_request(request_uuid, wps_request)
+    return process.execute(wps_request, request_uuid)
+
+
+def test_slot_released_once_streamed(queue):
+    response = execute(Echo())
+    assert queue.running['interactive'] == 1
+    assert b''.join(response.response) == b'a,b\r\n1,2\r\n'
+    response.close()
+    assert queue.running['interactive'] == 0
+
+
+def test_slot_released_when_closed_unread(queue):
+    response = execute(Echo())
+    assert dblog.get_process_counts()[0] == 1
+    response.close()
+    assert queue.running['interactive'] == 0
+    # no longer recorded as running
+    assert dblog.get_process_counts()[0] == 0
+
+
+def test_slot_released_when_closed_midway(queue):
+    response = execute(Echo())
+    next(iter(response.response))
+    response.close()
+    assert queue.running['interactive'] == 0
+
+
+def test_slot_released_on_handler_error(queue):
+    with pytest.raises(NoApplicableCode):
+        execute(Echo(fail=True))
+    assert queue.running['interactive'] == 0
+
+
+def test_submit_releases_failed_starts(queue):
+    def start(done):
+        raise RuntimeError('could not start')
+    queue.submit('batch', start)
+    assert queue.running['batch'] == 0
+    assert not queue.waiting['batch']
+
+
+def test_queue_limit():
+    queue = JobQueue({'interactive': 1, 'batch': 1}, queue_limit=1)
+    queue.submit('batch', lambda done: None)
+    queue.submit('batch', lambda done: None)
+    with pytest.raises(ServerBusy):
+        queue.submit('batch', lambda done: None)
+    assert len(queue.waiting['batch']) == 1
+
+
+def test_acquire_times_out():
+    queue = JobQueue({'interactive': 1, 'batch': 1}, wait_seconds=0.01)
+    queue.acquire('interactive')
+    with pytest.raises(ServerBusy):
+        queue.acquire('interactive')
+    assert queue.running['interactive'] == 1
+
+
+def test_synchronous_waiters_count_against_the_queue_limit():
+    queue = JobQueue({'interactive': 1, 'batch': 1}, queue_limit=1, wait_seconds=5)
+    queue.acquire('batch')
+    waiter = threading.Thread(target=queue.acquire, args=('batch',))
+    waiter.start()
+    while not queue.acquiring['batch']:
+        time.sleep(0.01)
+    with pytest.raises(ServerBusy):
+        queue.acquire('batch')
+    with pytest.raises(ServerBusy):
+        queue.submit('batch', lambda done: None)
+    # other lanes are separate
+    queue.acquire('interactive')
+    queue.release('batch')
+    waiter.join()
+    assert (queue.running['batch'], queue.acquiring['batch']) == (1, 0)
+
+
+def test_lanes_are_separate():
+    queue = JobQueue({'interactive': 1, 'batch': 1})
+    started = []
+    queue.submit('batch', started.append)
+    queue.submit('batch', started.append)
+    queue.submit('interactive', started.append)
+    # the interactive job runs in its own slot, the second batch job waits for the batch one
+    assert len(started) == 2
+    assert len(queue.waiting['batch']) == 1
+    started[0]()
+    assert len(started) == 3
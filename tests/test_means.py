@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.ecomeasure import EcoMeasure
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+from tests.conftest import FakeBackend
+
+LAT_RANGE = (-28.2, -28.0)
+LON_RANGE = (152.85, 153.0)
+(LAT_IDX, LON_IDX) = (Indexers.lat_range_as_idx(LAT_RANGE), Indexers.lon_range_as_idx(LON_RANGE))
+# a cell without any valid day, in global and in region indices
+MISSING = (LAT_IDX[0] + 1, LON_IDX[0] + 2)
+MISSING_CELL = (1, 2)
+
+
+def reference_means(time_ranges):
+    """Means of every period, in float64, straight from the fake data."""
+    (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(LAT_RANGE), Indexers.lon_range_as_idx(LON_RANGE))
+    return np.array([FakeBackend.data(Indexers.time_range_as_idx(tr), lat_idx, lon_idx).astype(np.float64).mean(axis=0)
+                     for tr in time_ranges])
+
+
+def test_segment_starts():
+    time_ranges = [TimeConverters.ym2trange(1990, mo) for mo in (1, 2)]
+    (span_lo, span_hi) = Indexers.time_range_as_idx((time_ranges[0][0], time_ranges[-1][1]))
+    assert list(EcoMeasure._segment_starts(time_ranges, span_lo, span_hi - span_lo)) == [0, 30, 31]
+
+
+@pytest.mark.parametrize('time_ranges', [
+    [TimeConverters.ym2trange(1990, 2), TimeConverters.ym2trange(1990, 1)],
+    [('1990-01-01', '1990-01-01'), TimeConverters.ym2trange(1990, 2)],
+])
+def test_segment_starts_rejects_invalid_periods(time_ranges):
+    with pytest.raises(ValueError):
+        EcoMeasure._segment_starts(time_ranges, Indexers.date_idx(time_ranges[0][0]), 58)
+
+
+@pytest.mark.parametrize('years', [(1990, 1992), (2012, 2014)])
+def test_span_matches_period_fetches(utc, measure, config, backend, years):
+    time_ranges = [TimeConverters.ym2trange(yr, mo) for yr in range(years[0], years[1] + 1) for mo in range(1, 13)]
+    spanned = measure.mean_years_all_months(years, LAT_RANGE, LON_RANGE)
+    # the whole span in fetch_chunk_days parts, versus one fetch per period
+    assert len(backend.reads) == 3
+    config('fetch_mode', 'period')
+    by_period = measure.mean_years_all_months(years, LAT_RANGE, LON_RANGE)
+    assert len(backend.reads) == 3 + 36
+    np.testing.assert_allclose(spanned, by_period, rtol=1e-6)
+    np.testing.assert_allclose(spanned, reference_means(time_ranges).reshape(-1), rtol=1e-6)
+
+
+@pytest.mark.parametrize('backend', [FakeBackend(missing=[MISSING])], indirect=True)
+def test_streamed_reductions_match_span(utc, measure, config, backend):
+    time_ranges = [TimeConverters.yq2trange(yr, q) for yr in (1990, 1991) for q in range(1, 5)]
+    means = measure.period_means(time_ranges, LAT_RANGE, LON_RANGE)
+    statistics = measure.period_statistics(time_ranges, LAT_RANGE, LON_RANGE, ['mean', 'min', 'max', 'count'])
+    measure.region_mean = True
+    region_means = measure.mean_periods(time_ranges, LAT_RANGE, LON_RANGE)
+    measure.region_mean = False
+    reads = len(backend.reads)
+
+    config('stream_threshold_bytes', 1)
+    config('stream_chunk_days', 7)
+    np.testing.assert_allclose(measure.period_means(time_ranges, LAT_RANGE, LON_RANGE), means, rtol=1e-6)
+    assert np.isnan(means[:, MISSING_CELL[0], MISSING_CELL[1]]).all()
+    streamed = measure.period_statistics(time_ranges, LAT_RANGE, LON_RANGE, ['mean', 'min', 'max', 'count'])
+    for name in ('mean', 'min', 'max', 'count'):
+        np.testing.assert_allclose(streamed[name], statistics[name], rtol=1e-6, err_msg=name)
+    measure.region_mean = True
+    np.testing.assert_allclose(measure.mean_periods(time_ranges, LAT_RANGE, LON_RANGE), region_means, rtol=1e-6)
+    # every read of the streamed reductions is one chunk at most
+    assert max(hi - lo for ((lo, hi), _, _) in backend.reads[reads:]) <= 7
+
+
+@pytest.mark.parametrize('span_days', [3660, 100])
+@pytest.mark.parametrize('backend', [FakeBackend(missing=[MISSING])], indirect=True)
+def test_filled_buffers_match_periods_one_at_a_time(utc, measure, config, span_days):
+    config('span_days', span_days)
+    # whole spans of periods, several span groups, and a gap between groups
+    time_ranges = ([TimeConverters.ym2trange(1990, mo) for mo in range(1, 13)] +
+                   [TimeConverters.yq2trange(1992, q) for q in range(1, 5)])
+    expected = np.array([measure._mean_period(time_range, LAT_RANGE, LON_RANGE) for time_range in time_ranges])
+    np.testing.assert_allclose(measure.mean_periods(time_ranges, LAT_RANGE, LON_RANGE), expected.reshape(-1),
+                               rtol=1e-6)
+    out = np.full(expected.shape, -1.0)
+    assert measure.period_means(time_ranges, LAT_RANGE, LON_RANGE, out) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-6)
+    statistics = measure.period_statistics(time_ranges, LAT_RANGE, LON_RANGE, ['mean', 'count'])
+    np.testing.assert_allclose(statistics['mean'], expected, rtol=1e-6)
+    assert (statistics['count'][:, MISSING_CELL[0], MISSING_CELL[1]] == 0).all()
+
+    measure.region_mean = True
+    expected = np.concatenate([measure._mean_period(time_range, LAT_RANGE, LON_RANGE) for time_range in time_ranges])
+    np.testing.assert_allclose(measure.mean_periods(time_ranges, LAT_RANGE, LON_RANGE), expected, rtol=1e-6)
+    assert np.isfinite(expected).all()
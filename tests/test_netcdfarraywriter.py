@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.ecocomposer import EcoComposer
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.netcdfarraywriter import NetCDFArrayWriter
+from tests.conftest import FakeBackend
+
+LAT_RANGE = (-28.2, -28.0)
+LON_RANGE = (152.85, 153.0)
+
+
+def test_time_bounds():
+    (lo, hi) = NetCDFArrayWriter.time_bounds(["1970-01", "1970-02", "1971", "1970-q2"])
+    np.testing.assert_array_equal(lo, [0, 31, 365, 90])
+    np.testing.assert_array_equal(hi, [30, 58, 729, 180])
+
+
+def test_bounds_match_the_data(utc, measure, tmp_path):
+    netCDF4 = pytest.importorskip('netCDF4')
+    file_name = str(tmp_path / 'output.nc')
+    EcoComposer(['rainfall'], output_format='netcdf').process_years_all_months(file_name, (1990, 1991),
+                                                                               LAT_RANGE, LON_RANGE)
+    (lat_idx, lon_idx) = (Indexers.lat_range_as_idx(LAT_RANGE), Indexers.lon_range_as_idx(LON_RANGE))
+    with netCDF4.Dataset(file_name) as ds:
+        bounds = ds.variables['time_bnds'][:]
+        np.testing.assert_array_equal(ds.variables['time'][:], bounds[:, 0])
+        means = ds.variables['Rainfall'][:]
+        periods = list(ds.variables['period'][:])
+    assert len(periods) == 24
+    for (i, (lo, hi)) in enumerate(bounds):
+        # time indices are days since 1970-01-01
+        expected = FakeBackend.data((lo, hi), lat_idx, lon_idx).astype(np.float64).mean(axis=0)
+        np.testing.assert_allclose(means[i], expected, rtol=1e-6, err_msg=periods[i])
@@ -0,0 +1,40 @@
+import gzip
+
+import pytest
+from pyramid.request import Request
+
+from silvereye_wps_demo.views.outputs import outputs
+
+ROWS = b'period,lat,lon,rainfall\r\n1990-01,-28.0,153.0,1.5\r\n'
+
+
+@pytest.fixture
+def get(config, tmp_path):
+    """Gets an output stored with FileStorage, accepting the given content encodings."""
+    config('outputpath', str(tmp_path), section='server')
+    (tmp_path / 'job').mkdir()
+    with gzip.open(str(tmp_path / 'job' / 'output.csv.gz'), 'wb') as f:
+        f.write(ROWS)
+
+    def get(accept_encoding):
+        request = Request.blank('/outputs/job/output.csv.gz', headers={'Accept-Encoding': accept_encoding})
+        request.matchdict = {'filename': ('job', 'output.csv.gz')}
+        response = outputs(request)
+        return (response, b''.join(response.app_iter))
+    return get
+
+
+def test_served_compressed(get):
+    (response, body) = get('gzip, deflate')
+    assert response.content_encoding == 'gzip'
+    assert response.content_type == 'text/csv'
+    assert gzip.decompress(body) == ROWS
+    assert response.vary == ('Accept-Encoding',)
+
+
+def test_decompressed_for_other_clients(get):
+    (response, body) = get('identity')
+    assert response.content_encoding is None
+    assert response.content_type == 'text/csv'
+    assert body == ROWS
+    assert response.vary == ('Accept-Encoding',)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.periodcache import PeriodCache
+
+# a region filling its cache tiles, and a single cell
+REGION = ((-28.2, -27.9), (152.85, 153.2))
+POINT = ((-28.0, -27.99), (153.0, 153.015))
+
+
+@pytest.fixture
+def cache(tmp_path, config, monkeypatch):
+    """Enables the period cache, returning its instance getter."""
+    monkeypatch.setattr(PeriodCache, '_instance', None)
+    return lambda: config('period_cache_dir', str(tmp_path / 'periods')) or PeriodCache.instance()
+
+
+def test_round_trip(utc, measure, backend, cache):
+    expected = measure.mean_years_one_month((1990, 1991), 1, *REGION)
+    cache()
+    first = measure.mean_years_one_month((1990, 1991), 1, *REGION)
+    reads = len(backend.reads)
+    second = measure.mean_years_one_month((1990, 1991), 1, *REGION)
+    assert len(backend.reads) == reads
+    assert cache().stats['misses'] == 2
+    assert cache().stats['hits'] == 2
+    np.testing.assert_allclose(first, expected, rtol=1e-6)
+    np.testing.assert_array_equal(second, first)
+
+
+def test_point_queries_bypass_the_cache(utc, measure, backend, cache):
+    cache()
+    first = measure.mean_years_one_month((1990, 1991), 1, *POINT)
+    second = measure.mean_years_one_month((1990, 1991), 1, *POINT)
+    np.testing.assert_array_equal(second, first)
+    assert cache().stats['bypasses'] == 2
+    assert cache().stats['misses'] == 0
+    # only the cells requested were fetched, not the tiles around them
+    request = (Indexers.lat_range_as_idx(POINT[0]), Indexers.lon_range_as_idx(POINT[1]))
+    assert all(read[1:] == request for read in backend.reads)
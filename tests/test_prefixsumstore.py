@@ -0,0 +1,63 @@
+import math
+import warnings
+
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.prefixsumstore import PrefixSumStore
+from tests.test_aggregatestore import MISSING, daily, direct
+
+WINDOW = ((0, 4), (0, 5))
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A store of WINDOW, up to 1971."""
+    store = PrefixSumStore(str(tmp_path), 'Rainfall')
+    assert store.build(daily, 1971, *WINDOW) == 2
+    return store
+
+
+@pytest.mark.parametrize('time_range', [
+    ('1970-01-01', '1970-01-02'),
+    ('1970-03-05', '1970-09-17'),
+    ('1970-12-31', '1971-01-01'),
+    ('1970-02-10', '1971-12-31'),
+])
+def test_periods_match_daily_data(store, time_range):
+    time_idx = Indexers.time_range_as_idx(time_range)
+    (total, count) = store.period(time_idx, (1, 4), (2, 5))
+    (expected_total, expected_count) = direct(time_idx, (1, 4), (2, 5))
+    np.testing.assert_allclose(total, expected_total, rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(count, expected_count)
+
+
+def test_uncovered_requests_are_not_answered(store):
+    assert store.period(Indexers.time_range_as_idx(('1970-01-01', '1970-02-01')), (0, 5), (0, 5)) is None
+    assert store.period(Indexers.time_range_as_idx(('1971-06-01', '1972-02-01')), *WINDOW) is None
+
+
+def test_build_resumes(store):
+    # carries on from the totals of 1971, the last day of which its planes leave out
+    assert store.build(daily, 1972, *WINDOW) == 1
+    assert store.build(daily, 1972, *WINDOW) == 0
+    time_idx = Indexers.time_range_as_idx(('1971-12-01', '1972-12-31'))
+    (total, count) = store.period(time_idx, *WINDOW)
+    np.testing.assert_allclose(total, direct(time_idx, *WINDOW)[0], rtol=1e-9)
+    np.testing.assert_array_equal(count, direct(time_idx, *WINDOW)[1])
+
+
+def test_other_windows_are_rebuilt(store):
+    assert store.build(daily, 1970, (0, 3), (0, 5)) == 1
+    assert store.region() == ((0, 3), (0, 5))
+    assert not store.has_year(1971)
+
+
+def test_drift_skips_cells_without_valid_days(store):
+    time_idx = Indexers.time_range_as_idx(('1970-01-01', '1971-06-30'))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert store.drift(daily, time_idx, *WINDOW) < 1e-9
+        cell = ((MISSING[0][0], MISSING[0][0] + 1), (MISSING[0][1], MISSING[0][1] + 1))
+        assert math.isnan(store.drift(daily, time_idx, *cell))
@@ -0,0 +1,18 @@
+from silvereye_wps_demo.models.ecomeasure import EcoMeasure
+from silvereye_wps_demo.models.helpers.datasetregistry import DatasetRegistry
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.scripts.prewarm import prewarm
+from tests.conftest import FakeBackend
+
+
+def test_prewarm_counts_slices_and_bytes(config, monkeypatch):
+    monkeypatch.setattr(DatasetRegistry, '_instance', DatasetRegistry())
+    monkeypatch.setattr(EcoMeasure, '_open', lambda self: FakeBackend())
+    manifest = [{'name': 'Gold Coast', 'variables': ['rainfall', 'temp_max'], 'years': [1990, 1991],
+                 'lat_range': [-28.16, -28.0], 'lon_range': [153.19, 153.3]}]
+    totals = prewarm(manifest, 2)
+    assert (totals['slices'], totals['failed']) == (4, 0)
+    (lat_idx, lon_idx) = (Indexers.lat_range_as_idx((-28.16, -28.0)), Indexers.lon_range_as_idx((153.19, 153.3)))
+    cells = (lat_idx[1] - lat_idx[0]) * (lon_idx[1] - lon_idx[0])
+    # 364 days per year, see Indexers.time_range_as_idx, in float32
+    assert totals['bytes'] == 4 * 364 * cells * 4
@@ -0,0 +1,76 @@
+import os
+import queue
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+from pywps.response.status import WPS_STATUS
+
+from silvereye_wps_demo.pywps import processing
+from silvereye_wps_demo.pywps.processing import PoolProcessing
+
+
+@pytest.fixture
+def pool_state(monkeypatch):
+    """The jobs of the pool of a server process, as workers start them, without any pool."""
+    started = queue.SimpleQueue()
+    for (name, value) in (('_started', started), ('_jobs', {}), ('_pids', {}), ('_suspects', set())):
+        monkeypatch.setattr(PoolProcessing, name, value)
+    return started
+
+
+def send(uuid, ended, statuses, ready=False):
+    """Records a job as sent to the pool, done and status updates appended to ended and statuses."""
+    response = SimpleNamespace(_update_status=lambda status, message, percent: statuses.append(status))
+    PoolProcessing._jobs[uuid] = (SimpleNamespace(ready=lambda: ready), lambda: ended.append(uuid), response)
+
+
+def test_watchdog_fails_jobs_of_dead_workers(pool_state):
+    worker = subprocess.Popen(['true'])
+    worker.wait()
+    (ended, statuses) = ([], [])
+    send('lost', ended, statuses)
+    send('running', ended, statuses)
+    pool_state.put(('lost', worker.pid))
+    pool_state.put(('running', os.getpid()))
+    PoolProcessing.check()
+    # a recycled worker may have sent its result just before exiting
+    assert ended == []
+    PoolProcessing.check()
+    assert ended == ['lost']
+    assert statuses == [WPS_STATUS.FAILED]
+    PoolProcessing.check()
+    assert ended == ['lost']
+    assert list(PoolProcessing._jobs) == ['running']
+
+
+def test_jobs_end_once(pool_state):
+    worker = subprocess.Popen(['true'])
+    worker.wait()
+    (ended, statuses) = ([], [])
+    send('done', ended, statuses)
+    pool_state.put(('done', worker.pid))
+    PoolProcessing.check()
+    PoolProcessing._ended('done')
+    PoolProcessing.check()
+    PoolProcessing._ended('done')
+    assert ended == ['done']
+    assert statuses == []
+
+
+def test_workers_are_not_forked_from_the_server(config, monkeypatch):
+    config('pool_workers', 1)
+    config('pool_watchdog_seconds', 3600)
+    monkeypatch.setattr(PoolProcessing, '_pool', None)
+    monkeypatch.setattr(PoolProcessing, '_started', None)
+    pool = PoolProcessing.pool()
+    try:
+        assert pool.apply(os.getppid) != os.getpid()
+        assert pool.apply(_has_service)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _has_service():
+    return processing.PoolProcessing._service is not None
@@ -0,0 +1,124 @@
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from silvereye_wps_demo.models.helpers.resultcache import ResultCache
+from silvereye_wps_demo.pywps import resultcache
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_round_trip_and_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10)
+    first = cache.put('a' * 64, write(tmp_path / 'out.csv', 'x' * 6))
+    assert cache.get('a' * 64) == first
+    assert read(first) == 'x' * 6
+    cache.put('b' * 64, write(tmp_path / 'out.csv', 'y' * 6))
+    assert cache.get('a' * 64) is None
+    assert read(cache.get('b' * 64)) == 'y' * 6
+    assert cache.stats == {'hits': 2, 'misses': 1, 'evictions': 1}
+
+
+def test_budget_accounts_for_other_processes(tmp_path):
+    (first, second) = (ResultCache(str(tmp_path / 'cache'), max_bytes=10, rescan_seconds=0),
+                       ResultCache(str(tmp_path / 'cache'), max_bytes=10, rescan_seconds=0))
+    path = first.put('a' * 64, write(tmp_path / 'out.csv', 'x' * 6))
+    second.put('b' * 64, write(tmp_path / 'out.csv', 'y' * 6))
+    assert not os.path.exists(path)
+    assert second.stats['evictions'] == 1
+
+
+def test_scan_skips_outputs_evicted_meanwhile(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=100)
+    path = cache.put('a' * 64, write(tmp_path / 'out.csv', 'x' * 6))
+    kept = cache.put('b' * 64, write(tmp_path / 'out.csv', 'y' * 6))
+    stat = os.stat
+
+    def evicted(name, *args, **kwargs):
+        if name == path:
+            raise FileNotFoundError(name)
+        return stat(name, *args, **kwargs)
+    monkeypatch.setattr(os, 'stat', evicted)
+    cache._scan()
+    assert list(cache._lru) == [kept]
+    assert cache._bytes == 6
+
+
+def test_held_outputs_outlive_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10)
+    path = cache.put('a' * 64, write(tmp_path / 'out.csv', 'x' * 6))
+    os.makedirs(str(tmp_path / 'workdir'))
+    held = ResultCache.hold(path, str(tmp_path / 'workdir'))
+    cache.put('b' * 64, write(tmp_path / 'out.csv', 'y' * 6))
+    assert not os.path.exists(path)
+    assert read(held) == 'x' * 6
+    assert ResultCache.hold(path, str(tmp_path / 'workdir')) is None
+
+
+@pytest.fixture
+def handler_process(tmp_path, config, monkeypatch):
+    """A raw output request through the result cache, its handler counting its runs."""
+    config('result_cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(ResultCache, '_instance', None)
+    monkeypatch.setattr(resultcache, 'request_key', lambda process, request, response: 'k' * 64)
+    runs = []
+
+    @resultcache.cached_result
+    def handler(process, request, response):
+        runs.append(process.workdir)
+        response.outputs['output'].file = write(os.path.join(process.workdir, 'out.csv'), 'rows')
+        return response
+
+    def run(raw=True):
+        workdir = tmp_path / uuid.uuid4().hex
+        os.makedirs(str(workdir))
+        process = SimpleNamespace(identifier='echo', streamed=False, workdir=str(workdir))
+        response = SimpleNamespace(outputs={'output': SimpleNamespace(file=None, url=None)})
+        return handler(process, SimpleNamespace(raw=raw), response).outputs['output']
+    return (run, runs)
+
+
+def test_cached_result(handler_process):
+    (run, runs) = handler_process
+    first = run()
+    second = run()
+    assert len(runs) == 1
+    assert read(second.file) == 'rows'
+    # held in its own workdir, not served from the cache
+    assert os.path.dirname(second.file) != os.path.dirname(first.file)
+    assert not second.file.startswith(ResultCache.instance().root)
+
+
+def test_evicted_results_are_computed_again(handler_process, monkeypatch):
+    (run, runs) = handler_process
+    run()
+    cache = ResultCache.instance()
+    path = cache.get('k' * 64)
+    os.remove(path)
+    # evicted by another process between get() and its use
+    monkeypatch.setattr(cache, 'get', lambda key: path)
+    assert read(run().file) == 'rows'
+    assert len(runs) == 2
+
+
+def test_file_storage_hits_are_held(handler_process, config, tmp_path):
+    (run, runs) = handler_process
+    # even with the cache within outputpath, hits are not referenced in place, to outlive their eviction
+    config('outputpath', str(tmp_path), section='server')
+    run(raw=False)
+    output = run(raw=False)
+    assert len(runs) == 1
+    assert output.url is None
+    assert not output.file.startswith(ResultCache.instance().root)
+    assert read(output.file) == 'rows'
@@ -0,0 +1,95 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.singleflight import FileSingleFlight, SingleFlight
+from tests.conftest import FakeBackend
+
+REQUEST = ((0, 10), (0, 3), (0, 4))
+
+
+class SlowFetch(object):
+    """Fetches from the fake data once released, recording every call."""
+
+    def __init__(self):
+        (self.calls, self.started, self.release) = ([], threading.Event(), threading.Event())
+
+    def __call__(self, time_idx, lat_idx, lon_idx):
+        self.calls.append((time_idx, lat_idx, lon_idx))
+        self.started.set()
+        self.release.wait(5)
+        return FakeBackend.data(time_idx, lat_idx, lon_idx)
+
+
+def run(target, *args):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(target(*args)))
+    thread.start()
+    return (thread, results)
+
+
+def test_contained_fetches_share_one_fetch():
+    flight = SingleFlight()
+    fetch = SlowFetch()
+    (leader, _) = run(flight.fetch, 'rain', *REQUEST, fetch)
+    fetch.started.wait(5)
+    (follower, results) = run(flight.fetch, 'rain', (2, 5), (1, 3), (0, 4), fetch)
+    fetch.release.set()
+    leader.join()
+    follower.join()
+    assert len(fetch.calls) == 1
+    np.testing.assert_array_equal(results[0], FakeBackend.data((2, 5), (1, 3), (0, 4)))
+
+
+def test_file_fetch_without_waiters_leaves_no_file(tmp_path):
+    fetch = SlowFetch()
+    fetch.release.set()
+    data = FileSingleFlight(str(tmp_path)).fetch('rain', *REQUEST, fetch)
+    np.testing.assert_array_equal(data, FakeBackend.data(*REQUEST))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_file_waiters_read_the_leader_result(tmp_path):
+    fetch = SlowFetch()
+    (leader, _) = run(FileSingleFlight(str(tmp_path)).fetch, 'rain', *REQUEST, fetch)
+    fetch.started.wait(5)
+    waiters = [run(FileSingleFlight(str(tmp_path)).fetch, 'rain', *REQUEST, fetch) for _ in range(3)]
+    while len([name for name in os.listdir(str(tmp_path)) if name.endswith('.wait')]) < 3:
+        threading.Event().wait(0.01)
+    fetch.release.set()
+    leader.join()
+    for (thread, results) in waiters:
+        thread.join()
+        np.testing.assert_array_equal(results[0], FakeBackend.data(*REQUEST))
+    assert len(fetch.calls) == 1
+    assert not any(name.endswith(('.lock', '.wait')) for name in os.listdir(str(tmp_path)))
+
+
+def test_file_lock_is_removed_after_a_failure(tmp_path):
+    def failing(*idx):
+        raise TimeoutError('Read timed out')
+
+    with pytest.raises(TimeoutError):
+        FileSingleFlight(str(tmp_path)).fetch('rain', *REQUEST, failing)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_file_results_are_pruned_after_ttl(tmp_path):
+    flight = FileSingleFlight(str(tmp_path), ttl=60.0)
+    stale = tmp_path / 'stale.npy'
+    np.save(str(stale), np.zeros(1))
+    os.utime(str(stale), (0, 0))
+    flight.fetch('rain', *REQUEST, lambda *idx: FakeBackend.data(*idx))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_one_file_single_flight_per_directory(config, tmp_path, monkeypatch):
+    monkeypatch.setattr(FileSingleFlight, '_instances', {})
+    assert FileSingleFlight.instance() is None
+    config('single_flight_dir', str(tmp_path / 'a'))
+    first = FileSingleFlight.instance()
+    assert FileSingleFlight.instance() is first
+    config('single_flight_dir', str(tmp_path / 'b'))
+    assert FileSingleFlight.instance().directory == str(tmp_path / 'b')
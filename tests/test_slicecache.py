@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.slicecache import SliceCache
+
+IDX = ((0, 4), (0, 3), (0, 2))
+
+
+def test_cached_slices_are_read_only_copies():
+    cache = SliceCache(max_bytes=1024)
+    data = np.zeros((4, 3, 2), dtype=np.float32)
+    cache.put('rain', *IDX, data)
+    data[...] = 1
+    cached = cache.get('rain', *IDX)
+    assert (cached == 0).all()
+    with pytest.raises(ValueError):
+        cached[...] = 2
+    assert data.flags.writeable
+
+
+def test_views_count_their_own_bytes():
+    cache = SliceCache(max_bytes=1024)
+    base = np.zeros((400, 3, 2), dtype=np.float32)
+    cache.put('rain', *IDX, base[:4])
+    assert cache._bytes == 4 * 3 * 2 * 4
+    # not keeping the whole base alive
+    assert cache.get('rain', *IDX).base is None
+
+
+def test_storage_types_do_not_share_slices(config, measure, backend, monkeypatch):
+    config('slice_cache_bytes', 1024 ** 2)
+    monkeypatch.setattr(SliceCache, '_instance', None)
+    assert measure._read(*IDX).dtype == np.float32
+    config('storage_dtype', 'float64')
+    assert measure._read(*IDX).dtype == np.float64
+    assert len(backend.reads) == 2
+    assert measure._read(*IDX).dtype == np.float64
+    assert len(backend.reads) == 2
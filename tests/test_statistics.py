@@ -0,0 +1,47 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.runningstatistics import STATISTICS
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+from tests.conftest import FakeBackend
+
+LAT_RANGE = (-28.2, -28.0)
+LON_RANGE = (152.85, 153.0)
+(LAT_IDX, LON_IDX) = (Indexers.lat_range_as_idx(LAT_RANGE), Indexers.lon_range_as_idx(LON_RANGE))
+# a cell without any valid day
+MISSING = (LAT_IDX[0] + 1, LON_IDX[0] + 2)
+TIME_RANGES = [TimeConverters.ym2trange(1990, mo) for mo in range(1, 13)]
+
+
+def reference(time_range, missing=()):
+    """Statistics of a period straight from the fake data, in numpy, fill values as NaN."""
+    block = FakeBackend.data(Indexers.time_range_as_idx(time_range), LAT_IDX, LON_IDX).astype(np.float64)
+    for (lat, lon) in missing:
+        block[:, lat - LAT_IDX[0], lon - LON_IDX[0]] = np.nan
+    with warnings.catch_warnings():
+        # all-NaN cells
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {'mean': np.nanmean(block, axis=0), 'min': np.nanmin(block, axis=0), 'max': np.nanmax(block, axis=0),
+                'std': np.nanstd(block, axis=0), 'count': np.isfinite(block).sum(axis=0)}
+
+
+@pytest.mark.parametrize('backend', [FakeBackend(), FakeBackend(missing=[MISSING])], indirect=True)
+def test_statistics_match_numpy(utc, measure, backend):
+    result = measure.period_statistics(TIME_RANGES, LAT_RANGE, LON_RANGE, STATISTICS)
+    for statistic in STATISTICS:
+        expected = np.array([reference(time_range, backend.missing)[statistic] for time_range in TIME_RANGES])
+        np.testing.assert_allclose(result[statistic], expected, rtol=1e-6, err_msg=statistic)
+
+
+@pytest.mark.parametrize('backend', [FakeBackend(missing=[MISSING])], indirect=True)
+def test_fill_values_are_skipped(utc, measure, backend):
+    means = measure.period_means(TIME_RANGES, LAT_RANGE, LON_RANGE)
+    cell = (slice(None), MISSING[0] - LAT_IDX[0], MISSING[1] - LON_IDX[0])
+    assert np.isnan(means[cell]).all()
+    # the fill value never leaks into the other cells
+    others = np.delete(means.reshape(len(TIME_RANGES), -1), np.ravel_multi_index(cell[1:], means.shape[1:]), axis=1)
+    assert np.isfinite(others).all()
+    assert (others > 0).all()
@@ -0,0 +1,42 @@
+import pytest
+
+from silvereye_wps_demo.models.ecocomposer import EcoComposer
+
+LAT_RANGE = (-28.2, -28.0)
+LON_RANGE = (152.85, 153.0)
+
+
+def outputs(composer, tmp_path, process, *args):
+    """Returns the csv text of a request written to a file, then streamed."""
+    file_name = str(tmp_path / 'output.csv')
+    getattr(composer, process)(file_name, *args, LAT_RANGE, LON_RANGE)
+    with open(file_name, newline='') as f:
+        written = f.read()
+    streamed = ''.join(getattr(composer, process)(None, *args, LAT_RANGE, LON_RANGE))
+    return (written, streamed)
+
+
+@pytest.mark.parametrize('process, args', [
+    ('process_years_all_months', ((1990, 1994),)),
+    ('process_years', ((1990, 1994),)),
+    ('process_one_year', (2014,)),
+])
+def test_streamed_matches_file(utc, measure, config, backend, tmp_path, process, args):
+    composer = EcoComposer(['rainfall'])
+    (written, streamed) = outputs(composer, tmp_path, process, *args)
+    assert streamed == written
+    # whole spans, as for the file output, not one fetch per period
+    assert len(backend.reads) % 2 == 0
+    assert backend.reads[:len(backend.reads) // 2] == backend.reads[len(backend.reads) // 2:]
+
+
+def test_stream_periods_caps_groups(utc, measure, config, backend, tmp_path):
+    composer = EcoComposer(['rainfall'])
+    (written, _) = outputs(composer, tmp_path, 'process_years_all_months', (1990, 1991))
+    config('stream_periods', 5)
+    del backend.reads[:]
+    streamed = ''.join(composer.process_years_all_months(None, (1990, 1991), LAT_RANGE, LON_RANGE))
+    assert streamed == written
+    # 24 months, 5 at a time
+    assert len(backend.reads) == 5
+
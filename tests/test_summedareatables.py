@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import silvereye_wps_demo.models.ecoconstants as eco_constants
+from silvereye_wps_demo.models.helpers.aggregatestore import MonthlyAggregateStore
+from silvereye_wps_demo.models.helpers.indexers import Indexers
+from silvereye_wps_demo.models.helpers.summedareatables import SummedAreaTables
+from silvereye_wps_demo.models.helpers.timeconverters import TimeConverters
+from tests.test_aggregatestore import daily, direct
+
+
+@pytest.fixture
+def tables(monkeypatch, tmp_path):
+    """Tables of 1990, built from its monthly aggregates on a grid of 6 x 7 cells."""
+    monkeypatch.setattr(eco_constants, 'LAT_IDX_MAX', 5)
+    monkeypatch.setattr(eco_constants, 'LON_IDX_MAX', 6)
+    store = MonthlyAggregateStore(str(tmp_path), 'Rainfall')
+    store.build(daily, (1990, 1990))
+    tables = SummedAreaTables(store)
+    assert tables.build((1990, 1990)) == 12
+    return tables
+
+
+def test_table():
+    plane = np.arange(12, dtype=np.float64).reshape(3, 4)
+    table = SummedAreaTables.table(plane, np.float64)
+    for (i, j) in np.ndindex(table.shape):
+        assert table[i, j] == plane[:i, :j].sum()
+
+
+@pytest.mark.parametrize('time_range', [
+    TimeConverters.ym2trange(1990, 2),
+    TimeConverters.yq2trange(1990, 4),
+    TimeConverters.y2trange(1990),
+])
+@pytest.mark.parametrize('window', [((0, 6), (0, 7)), ((1, 4), (2, 5)), ((3, 4), (4, 5))])
+def test_region_periods_match_daily_data(tables, time_range, window):
+    time_idx = Indexers.time_range_as_idx(time_range)
+    (total, count) = tables.region_period(time_idx, *window)
+    (expected_total, expected_count) = direct(time_idx, *window)
+    assert total == pytest.approx(expected_total.sum(), rel=1e-12)
+    assert count == expected_count.sum()
+
+
+def test_build_resumes(tables):
+    assert tables.build((1990, 1990)) == 0
+    # months without aggregates have no tables
+    assert tables.build((1991, 1991)) == 0
+    tables.store.build(daily, (1991, 1991))
+    assert tables.build((1990, 1991)) == 12
+    time_idx = Indexers.time_range_as_idx(('1990-12-01', '1991-01-31'))
+    (total, count) = tables.region_period(time_idx, (0, 6), (0, 7))
+    assert total == pytest.approx(direct(time_idx, (0, 6), (0, 7))[0].sum(), rel=1e-12)
+    assert tables.region_period(Indexers.time_range_as_idx(('1991-12-01', '1992-01-31')), (0, 6), (0, 7)) is None
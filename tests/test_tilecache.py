@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from silvereye_wps_demo.models.helpers.tilecache import TileCache
+from tests.conftest import FakeBackend
+
+
+class Fetches(object):
+    """Fetches from the fake data, recording every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, time_idx, lat_idx, lon_idx):
+        self.calls.append((time_idx, lat_idx, lon_idx))
+        return FakeBackend.data(time_idx, lat_idx, lon_idx)
+
+
+@pytest.fixture
+def cache(config, tmp_path):
+    return TileCache(str(tmp_path), 10 * 1024 ** 2, (10, 4, 4))
+
+
+def test_round_trip(cache):
+    fetch = Fetches()
+    request = ((5, 25), (2, 9), (3, 6))
+    first = cache.read('rain', *request, fetch)
+    np.testing.assert_array_equal(first, FakeBackend.data(*request))
+    assert len(fetch.calls) == 3 * 3 * 2
+    second = cache.read('rain', *request, fetch)
+    np.testing.assert_array_equal(second, first)
+    assert len(fetch.calls) == 3 * 3 * 2
+    assert cache.stats['hits'] == 3 * 3 * 2
+
+
+def test_small_requests_bypass_the_cache(cache):
+    cache.min_fill = 0.5
+    fetch = Fetches()
+    point = ((0, 10), (1, 2), (1, 2))
+    np.testing.assert_array_equal(cache.read('rain', *point, fetch), FakeBackend.data(*point))
+    assert fetch.calls == [point]
+    assert cache.stats['bypasses'] == 1
+    assert not any(files for (_, _, files) in os.walk(cache.root))
+
+
+def test_budget_accounts_for_other_processes(cache, tmp_path):
+    fetch = Fetches()
+    other = TileCache(str(tmp_path), cache.max_bytes, cache.tile_shape)
+    other.read('rain', (0, 10), (0, 4), (0, 4), fetch)
+    tile_bytes = other._bytes
+    (cache.max_bytes, cache.rescan_seconds) = (2 * tile_bytes, 0)
+    cache.read('rain', (10, 20), (0, 4), (0, 4), fetch)
+    cache.read('rain', (20, 30), (0, 4), (0, 4), fetch)
+    # the tile stored by the other cache was counted, and evicted first
+    stored = [name for (_, _, files) in os.walk(cache.root) for name in files if name.endswith('.npy')]
+    assert sorted(stored) == ['1_0_0.npy', '2_0_0.npy']
+
+
+def test_storage_types_do_not_share_tiles(config, measure, backend, tmp_path, monkeypatch):
+    config('tile_cache_dir', str(tmp_path / 'tiles'))
+    config('tile_cache_min_fill', 0)
+    monkeypatch.setattr(TileCache, '_instance', None)
+    request = ((0, 4), (0, 3), (0, 2))
+    assert measure._read_upstream(*request).dtype == np.float32
+    config('storage_dtype', 'float64')
+    assert measure._read_upstream(*request).dtype == np.float64
+    assert len(os.listdir(str(tmp_path / 'tiles'))) == 2